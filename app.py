@@ -1,57 +1,231 @@
 # app.py
 import os
-import subprocess
+import re
+import sys
+import time
+import uuid
+import queue
 import threading
+import subprocess
+from collections import OrderedDict
 from fastapi import FastAPI, Header, HTTPException
-from typing import Optional
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from typing import Optional, List, Dict, Any
 
-app = FastAPI(title="Postman Master Builder")
+import metrics
 
-# простой in-memory лок, чтобы не запускать два раза параллельно
-_lock = threading.Lock()
-_is_running = False
+app = FastAPI(title="Postman Master Builder")
 
 RUNNER_TOKEN = os.getenv("RUNNER_TOKEN")  # если задан, нужен заголовок X-Runner-Token
+PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
+JOBS_KEEP = int(os.getenv("JOBS_KEEP", "50"))  # сколько последних задач держим в памяти
+# тот же путь, что METRICS_FILE в config.py (config тут не импортируем — он падает на неверном ACTIVE_PROFILE)
+METRICS_FILE = os.getenv("METRICS_FILE", os.path.join(os.getenv("STATE_DIR", os.path.join(PROJECT_ROOT, ".state")), "metrics.jsonl"))
+METRICS_LAST_BUILDS = int(os.getenv("METRICS_LAST_BUILDS", "50"))  # окно /metrics: последние N сборок
+_ARG_RE = re.compile(r"^[\w.-]+$")  # имя профиля и UID коллекции уходят в argv сборки
 
-@app.get("/health")
-def health():
-    return {"ok": True}
 
-@app.post("/run")
-def run_build(x_runner_token: Optional[str] = Header(default=None)):
-    global _is_running
+class Job:
+    """Одна сборка: команда, статус, тайминги и построчный лог (для стриминга)."""
+
+    def __init__(self, key: str, cmd: List[str]):
+        self.id = uuid.uuid4().hex[:12]
+        self.key = key  # одинаковый key у ожидающих задач → триггеры схлопываются
+        self.cmd = cmd
+        self.status = "queued"  # queued → running → succeeded | failed
+        self.returncode: Optional[int] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.triggers = 1
+        self.lines: List[str] = []
+        self.cond = threading.Condition()
+
+    @property
+    def done(self) -> bool:
+        return self.status in ("succeeded", "failed")
+
+    def append(self, line: str) -> None:
+        with self.cond:
+            self.lines.append(line)
+            self.cond.notify_all()
+
+    def finish(self, returncode: int) -> None:
+        with self.cond:
+            self.returncode = returncode
+            self.status = "succeeded" if returncode == 0 else "failed"
+            self.finished_at = time.time()
+            self.cond.notify_all()
+
+    def to_dict(self) -> Dict[str, Any]:
+        now = time.time()
+        return {
+            "job_id": self.id,
+            "key": self.key,
+            "status": self.status,
+            "returncode": self.returncode,
+            "triggers": self.triggers,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "queued_seconds": round((self.started_at or now) - self.created_at, 3),
+            "run_seconds": round((self.finished_at or now) - self.started_at, 3) if self.started_at else None,
+            "log_lines": len(self.lines),
+        }
+
+
+_jobs: "OrderedDict[str, Job]" = OrderedDict()
+_jobs_lock = threading.Lock()
+_queue: "queue.Queue[Job]" = queue.Queue()
 
+
+def _check_token(x_runner_token: Optional[str]) -> None:
     if RUNNER_TOKEN and x_runner_token != RUNNER_TOKEN:
         raise HTTPException(status_code=401, detail="Unauthorized")
-
     if not os.getenv("POSTMAN_API_KEY"):
         raise HTTPException(status_code=500, detail="POSTMAN_API_KEY is not set")
 
+
+def enqueue(key: str, cmd: List[str]) -> Dict[str, Any]:
+    """Ставит сборку в очередь. Если такая же (по key) ещё ждёт запуска — возвращает её."""
+    with _jobs_lock:
+        for job in _jobs.values():
+            if job.key == key and job.status == "queued":
+                job.triggers += 1
+                return {**job.to_dict(), "coalesced": True}
+        job = Job(key, cmd)
+        _jobs[job.id] = job
+        while len(_jobs) > JOBS_KEEP:
+            oldest_id, oldest = next(iter(_jobs.items()))
+            if not oldest.done:
+                break
+            _jobs.pop(oldest_id)
+    _queue.put(job)
+    return {**job.to_dict(), "coalesced": False}
+
+
+def _get_job(job_id: str) -> Job:
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+def _execute(job: Job) -> None:
     # на платформах будем отключать локальный venv/установку pip: USE_VENV=0
     env = os.environ.copy()
     env.setdefault("USE_VENV", "0")  # в облаке
-    # если у тебя config.py читает ACTIVE_PROFILE — не надо, run_all сам переключает
-
-    with _lock:
-        if _is_running:
-            raise HTTPException(status_code=409, detail="Already running")
-        _is_running = True
+    env["PYTHONUNBUFFERED"] = "1"  # чтобы лог шёл построчно, а не в конце
+    job.started_at = time.time()
+    job.status = "running"
     try:
-        # вызываем твой run_all.py и собираем stdout/stderr
-        proc = subprocess.run(
-            ["python", "run_all.py"],
+        proc = subprocess.Popen(
+            job.cmd,
+            cwd=PROJECT_ROOT,
             env=env,
-            capture_output=True,
-            text=True
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+            bufsize=1,
         )
-        ok = proc.returncode == 0
-        # урежем лог, чтобы ответ не раздулся
-        tail = 8000
-        return {
-            "ok": ok,
-            "returncode": proc.returncode,
-            "stdout_tail": proc.stdout[-tail:] if proc.stdout else "",
-            "stderr_tail": proc.stderr[-tail:] if proc.stderr else "",
-        }
-    finally:
-        _is_running = False
+        assert proc.stdout is not None
+        for line in proc.stdout:
+            job.append(line.rstrip("\n"))
+        job.finish(proc.wait())
+    except Exception as e:
+        job.append(f"runner error: {e}")
+        job.finish(-1)
+
+
+def _worker() -> None:
+    """
+    Сборки идут строго по одной. С другими процессами (второй воркер, cron, --watch) их разводит
+    лок BUILD_LOCK_FILE, который берёт сама сборка (build_lock в build_master_mass_merge.py).
+    """
+    while True:
+        job = _queue.get()
+        _execute(job)
+
+
+threading.Thread(target=_worker, name="build-worker", daemon=True).start()
+
+
+@app.get("/health")
+def health():
+    return {"ok": True}
+
+
+@app.post("/run", status_code=202)
+def run_build(x_runner_token: Optional[str] = Header(default=None)):
+    _check_token(x_runner_token)
+    # run_all.py сам собирает все профили
+    return enqueue("run_all", [sys.executable, "run_all.py"])
+
+
+@app.post("/run/{profile}/{collection_uid}", status_code=202)
+def run_one_collection(profile: str, collection_uid: str, x_runner_token: Optional[str] = Header(default=None)):
+    """
+    Точечная пересборка под вебхук: только папка collection_uid в мастере профиля.
+    Если сохранённого мастера нет (или коллекция в него не входит) — сборка профиля целиком.
+    """
+    _check_token(x_runner_token)
+    if not _ARG_RE.match(profile) or not _ARG_RE.match(collection_uid):
+        raise HTTPException(status_code=400, detail="Bad profile or collection uid")
+    cmd = [sys.executable, "build_master_mass_merge.py", f"--profile={profile}", f"--only-uid={collection_uid}"]
+    return enqueue(f"{profile}:{collection_uid}", cmd)
+
+
+@app.get("/jobs")
+def list_jobs():
+    with _jobs_lock:
+        return [job.to_dict() for job in reversed(_jobs.values())]
+
+
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str):
+    return _get_job(job_id).to_dict()
+
+
+@app.get("/jobs/{job_id}/log")
+def stream_job_log(job_id: str, follow: bool = True):
+    """Лог задачи как Server-Sent Events: уже накопленные строки, затем новые до завершения (follow=true)."""
+    job = _get_job(job_id)
+
+    def events():
+        sent = 0
+        while True:
+            with job.cond:
+                while follow and sent == len(job.lines) and not job.done:
+                    job.cond.wait(timeout=15)
+                    if sent == len(job.lines) and not job.done:
+                        break  # keep-alive, чтобы прокси не закрыл соединение
+                lines = job.lines[sent:]
+                finished = job.done or not follow
+            if lines:
+                sent += len(lines)
+                yield "".join(f"data: {line}\n\n" for line in lines)
+            elif not finished:
+                yield ": keep-alive\n\n"
+            if finished and sent == len(job.lines):
+                yield f"event: end\ndata: {job.status}\n\n"
+                return
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def prometheus_metrics(last: int = METRICS_LAST_BUILDS):
+    """Метрики последних сборок (по строкам METRICS_FILE) в формате Prometheus."""
+    records = metrics.read_records(METRICS_FILE, max(1, last)) if METRICS_FILE else []
+    body = metrics.render_prometheus(records)
+    with _jobs_lock:
+        queued = sum(1 for job in _jobs.values() if job.status == "queued")
+        running = sum(1 for job in _jobs.values() if job.status == "running")
+    body += (
+        "# HELP postman_runner_jobs Jobs in the runner queue by status\n"
+        "# TYPE postman_runner_jobs gauge\n"
+        f'postman_runner_jobs{{status="queued"}} {queued}\n'
+        f'postman_runner_jobs{{status="running"}} {running}\n'
+    )
+    return PlainTextResponse(body, media_type="text/plain; version=0.0.4")
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Сравнение _normalized_digest (потоковый обход) с прежней реализацией
+deepcopy → _scrub_ids_in_place → json.dumps на синтетической коллекции.
+
+    python bench/bench_digest.py --mb 50
+"""
+
+import argparse
+import copy
+import gc
+import hashlib
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import build_master_mass_merge as bm  # noqa: E402
+from bench.synthetic import make_collection  # noqa: E402
+
+
+def legacy_digest(obj):
+    x = copy.deepcopy(obj)
+    bm._scrub_ids_in_place(x, keep_root_info_postman_id=False)
+    blob = json.dumps(x, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha1(blob.encode("utf-8")).hexdigest()
+
+
+def measure(fn, obj):
+    """Время — отдельным прогоном без tracemalloc (он сильно замедляет Python-код), затем пик памяти."""
+    gc.collect()
+    t0 = time.perf_counter()
+    digest = fn(obj)
+    took = time.perf_counter() - t0
+    gc.collect()
+    tracemalloc.start()
+    fn(obj)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return digest, took, peak
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    p.add_argument("--mb", type=float, default=50, help="Примерный размер коллекции в JSON, МБ")
+    args = p.parse_args()
+
+    # ~1 КБ JSON на запрос при payload_chars=200
+    n_requests = max(1, int(args.mb * 1024))
+    col = make_collection("bench", n_requests=n_requests, depth=4)
+    size_mb = len(json.dumps(col, ensure_ascii=False).encode("utf-8")) / 1024 / 1024
+    print(f"collection: {n_requests} requests, ~{size_mb:.1f} MB JSON")
+
+    d_old, t_old, m_old = measure(legacy_digest, col)
+    d_new, t_new, m_new = measure(bm._normalized_digest, col)
+    if d_old != d_new:
+        print(f"MISMATCH: legacy={d_old} streaming={d_new}", file=sys.stderr)
+        sys.exit(1)
+    print(f"legacy:    {t_old:7.2f}s  peak {m_old / 1024 / 1024:8.1f} MB")
+    print(f"streaming: {t_new:7.2f}s  peak {m_new / 1024 / 1024:8.1f} MB")
+    print(f"digest {d_new} (совпадает)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Сравнение сборки мастера через _normalize_tree (один обход явным стеком) с прежней цепочкой:
+рекурсивный _sanitize_item в folder_from_collection, ещё раз на master["item"],
+затем рекурсивный _scrub_ids_in_place по всему мастеру. Проверяет, что результат совпадает,
+и показывает, что прежняя версия падает на глубокой вложенности.
+
+    python bench/bench_tree.py --collections 40 --requests 500 --depth 6
+"""
+
+import argparse
+import copy
+import gc
+import json
+import os
+import sys
+import time
+from typing import Any, Dict, List, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import build_master_mass_merge as bm  # noqa: E402
+from bench.synthetic import SCHEMA, make_workspace  # noqa: E402
+
+
+# ---------- прежние рекурсивные реализации (как были в build_master_mass_merge.py) ----------
+
+def legacy_sanitize_item(obj: Dict[str, Any]) -> Dict[str, Any]:
+    if "item" in obj:
+        fixed_children = []
+        for child in obj.get("item") or []:
+            if isinstance(child, dict):
+                fixed_children.append(legacy_sanitize_item(child))
+            else:
+                fixed_children.append({"name": str(child), "item": []})
+        obj["item"] = fixed_children
+        return obj
+    if "request" in obj:
+        return obj
+    new_obj = {"name": obj.get("name", "Untitled"), "item": []}
+    if "description" in obj:
+        new_obj["description"] = obj["description"]
+    for k in ("event", "auth", "variable"):
+        if k in obj:
+            new_obj[k] = obj[k]
+    return new_obj
+
+
+def legacy_scrub_ids_in_place(obj: Any, keep_root_info_postman_id: bool = False, _path: Tuple[str, ...] = ()) -> None:
+    if isinstance(obj, dict):
+        for k in list(obj.keys()):
+            if k in ("id", "uid"):
+                obj.pop(k, None)
+            elif k == "_postman_id":
+                if not (keep_root_info_postman_id and _path == ("info",)):
+                    obj.pop(k, None)
+        for k, v in list(obj.items()):
+            legacy_scrub_ids_in_place(v, keep_root_info_postman_id, _path + (k,))
+    elif isinstance(obj, list):
+        for v in obj:
+            legacy_scrub_ids_in_place(v, keep_root_info_postman_id, _path)
+
+
+def legacy_build(cols: List[Dict[str, Any]]) -> Dict[str, Any]:
+    folders = []
+    for col in cols:
+        info = col.get("info", {}) or {}
+        folder: Dict[str, Any] = {"name": f"{info.get('name', 'Unnamed')}", "item": (col.get("item") or [])[:]}
+        if info.get("description"):
+            folder["description"] = info["description"]
+        for k in ("event", "auth", "variable"):
+            if col.get(k):
+                folder[k] = col[k]
+        folders.append(legacy_sanitize_item(folder))
+    for i, nm in enumerate(bm._dedupe_names([f["name"] for f in folders])):
+        folders[i]["name"] = nm
+    master = {"info": {"name": "Bench master", "schema": SCHEMA}, "item": folders}
+    master["item"] = [legacy_sanitize_item(it) for it in master["item"]]
+    legacy_scrub_ids_in_place(master, keep_root_info_postman_id=True)
+    return master
+
+
+def new_build(cols: List[Dict[str, Any]]) -> Dict[str, Any]:
+    return bm.build_master(cols, "Bench master", "", False)
+
+
+# ---------- замеры ----------
+
+def measure(fn, cols: List[Dict[str, Any]], repeat: int) -> Tuple[Dict[str, Any], float]:
+    """Лучшее время из repeat прогонов; копия входа делается вне замера (обе версии меняют его на месте)."""
+    best = float("inf")
+    result: Dict[str, Any] = {}
+    for _ in range(repeat):
+        data = copy.deepcopy(cols)
+        gc.collect()
+        t0 = time.perf_counter()
+        result = fn(data)
+        best = min(best, time.perf_counter() - t0)
+    return result, best
+
+
+def deep_collection(depth: int) -> Dict[str, Any]:
+    node: Dict[str, Any] = {"id": "leaf", "name": "leaf"}  # лист без request → станет папкой
+    for i in range(depth):
+        node = {"id": f"f{i}", "name": f"level {i}", "item": [node]}
+    return {"info": {"name": "deep", "_postman_id": "x"}, "item": [node]}
+
+
+def main() -> None:
+    p = argparse.ArgumentParser(description="Benchmark of the fused sanitize+scrub tree pass")
+    p.add_argument("--collections", type=int, default=40)
+    p.add_argument("--requests", type=int, default=500, help="Запросов в коллекции")
+    p.add_argument("--depth", type=int, default=6, help="Уровней вложенности папок")
+    p.add_argument("--repeat", type=int, default=3)
+    p.add_argument("--deep", type=int, default=5000, help="Глубина для проверки на рекурсию")
+    args = p.parse_args()
+
+    cols = make_workspace(args.collections, args.requests, args.depth)
+    size_mb = len(json.dumps(cols, ensure_ascii=False).encode("utf-8")) / 1024 / 1024
+    print(f"workspace: {args.collections} × {args.requests} requests, depth {args.depth}, ~{size_mb:.1f} MB JSON")
+
+    old, t_old = measure(legacy_build, cols, args.repeat)
+    new, t_new = measure(new_build, cols, args.repeat)
+    if old != new:
+        print("MISMATCH: результат отличается от прежней реализации", file=sys.stderr)
+        sys.exit(1)
+    print(f"legacy (sanitize ×2 + scrub, рекурсивно): {t_old:7.3f}s")
+    print(f"fused  (_normalize_tree, явный стек):      {t_new:7.3f}s  (×{t_old / t_new:.2f})")
+
+    try:
+        legacy_build([deep_collection(args.deep)])
+        print(f"deep {args.deep}: legacy ok")
+    except RecursionError:
+        print(f"deep {args.deep}: legacy → RecursionError")
+    new_build([deep_collection(args.deep)])
+    print(f"deep {args.deep}: fused ok")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Локальная замена Postman API для бенчмарков и офлайн-проверок.
+
+Поддерживает то, чем пользуется build_master_mass_merge.py:
+GET /collections[?workspace=…], GET/PUT /collections/{uid}, POST /collections,
+POST /collections/{uid}/folders|requests, PUT/DELETE /collections/{uid}/folders|requests/{id}.
+Умеет добавлять задержку, отвечать 429 (с Retry-After) и 5xx с заданной вероятностью,
+считает запросы и байты в обе стороны.
+
+    python bench/fake_postman.py --port 8765 --collections 200 --requests 50 --depth 3 --latency-ms 80
+    POSTMAN_API_BASE=http://127.0.0.1:8765 POSTMAN_API_KEY=x python build_master_mass_merge.py --all …
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List
+from urllib.parse import urlparse, parse_qs
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench.synthetic import make_workspace  # noqa: E402
+
+WORKSPACE_ID = "bench-workspace"
+MASTER_UID = "bench-master"
+
+
+class FakePostman:
+    def __init__(
+        self,
+        collections: List[Dict[str, Any]],
+        latency_ms: float = 0.0,
+        rate_429: float = 0.0,
+        rate_5xx: float = 0.0,
+        retry_after: float = 0.2,
+        seed: int = 0,
+    ):
+        self.collections: Dict[str, Dict[str, Any]] = {}
+        self.updated_at: Dict[str, str] = {}
+        self.workspaces: Dict[str, List[str]] = {}  # дополнительные воркспейсы: id → UID коллекций
+        for i, col in enumerate(collections):
+            self._store(f"bench-{i:05d}", col)
+        self._store(MASTER_UID, {"info": {"name": "Bench master", "_postman_id": "bench-master-pid"}, "item": []})
+        self.latency = latency_ms / 1000.0
+        self.rate_429 = rate_429
+        self.rate_5xx = rate_5xx
+        self.retry_after = retry_after
+        self.stats = {"requests": 0, "bytes_in": 0, "bytes_out": 0, "status_429": 0, "status_5xx": 0}
+        self._rnd = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server: ThreadingHTTPServer | None = None
+
+    def _store(self, uid: str, col: Dict[str, Any]) -> None:
+        self.collections[uid] = col
+        self.updated_at[uid] = time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime()) + f"#{len(self.updated_at)}"
+
+    def add_workspace(self, workspace_id: str, uids: List[str]) -> None:
+        """Ещё один воркспейс с частью (уже существующих) коллекций — как расшаренные между воркспейсами."""
+        self.workspaces[workspace_id] = list(uids)
+
+    def touch(self, uid: str) -> None:
+        """Имитирует правку коллекции в Postman (меняется updatedAt)."""
+        self._store(uid, self.collections[uid])
+
+    @property
+    def base_url(self) -> str:
+        assert self._server is not None
+        return f"http://127.0.0.1:{self._server.server_port}"
+
+    def start(self, port: int = 0) -> "FakePostman":
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args: Any) -> None:
+                pass
+
+            def _read_body(self) -> bytes:
+                if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+                    chunks = []
+                    while True:
+                        size = int(self.rfile.readline().strip() or b"0", 16)
+                        if size == 0:
+                            self.rfile.readline()
+                            break
+                        chunks.append(self.rfile.read(size))
+                        self.rfile.readline()
+                    return b"".join(chunks)
+                length = int(self.headers.get("Content-Length") or 0)
+                return self.rfile.read(length) if length else b""
+
+            def _send(self, status: int, obj: Any, headers: Dict[str, str] | None = None) -> None:
+                data = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for k, v in (headers or {}).items():
+                    self.send_header(k, v)
+                self.end_headers()
+                self.wfile.write(data)
+                with fake._lock:
+                    fake.stats["bytes_out"] += len(data)
+
+            def _handle(self, method: str) -> None:
+                body = self._read_body()
+                with fake._lock:
+                    fake.stats["requests"] += 1
+                    fake.stats["bytes_in"] += len(body)
+                    roll = fake._rnd.random()
+                if fake.latency:
+                    time.sleep(fake.latency)
+                if roll < fake.rate_429:
+                    with fake._lock:
+                        fake.stats["status_429"] += 1
+                    return self._send(429, {"error": "rateLimited"}, {"Retry-After": str(fake.retry_after)})
+                if roll < fake.rate_429 + fake.rate_5xx:
+                    with fake._lock:
+                        fake.stats["status_5xx"] += 1
+                    return self._send(503, {"error": "serviceUnavailable"})
+                fake.route(self, method, body)
+
+            def do_GET(self) -> None:
+                self._handle("GET")
+
+            def do_PUT(self) -> None:
+                self._handle("PUT")
+
+            def do_POST(self) -> None:
+                self._handle("POST")
+
+            def do_DELETE(self) -> None:
+                self._handle("DELETE")
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="fake-postman", daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+    def route(self, h: Any, method: str, body: bytes) -> None:
+        url = urlparse(h.path)
+        parts = [p for p in url.path.split("/") if p]
+        if parts[:1] != ["collections"]:
+            return h._send(404, {"error": "notFound"})
+        if len(parts) == 1 and method == "GET":
+            workspace = parse_qs(url.query).get("workspace", [None])[0]
+            if workspace in self.workspaces:
+                uids = self.workspaces[workspace]
+            elif workspace in (None, WORKSPACE_ID):
+                uids = list(self.collections)
+            else:
+                uids = []
+            return h._send(200, {"collections": [
+                {"uid": uid, "name": (self.collections[uid].get("info") or {}).get("name"), "updatedAt": self.updated_at[uid]}
+                for uid in uids
+            ]})
+        if len(parts) == 1 and method == "POST":
+            col = json.loads(body or b"{}").get("collection") or {}
+            uid = f"bench-created-{len(self.collections):05d}"
+            self._store(uid, col)
+            return h._send(200, {"collection": {"uid": uid, "name": (col.get("info") or {}).get("name")}})
+        uid = parts[1]
+        if uid not in self.collections:
+            return h._send(404, {"error": "instanceNotFoundError"})
+        if len(parts) == 2 and method == "GET":
+            return h._send(200, {"collection": self.collections[uid]})
+        if len(parts) == 2 and method == "PUT":
+            self._store(uid, json.loads(body or b"{}").get("collection") or {})
+            return h._send(200, {"collection": {"uid": uid}})
+        if len(parts) == 4 and parts[2] in ("folders", "requests") and method in ("PUT", "DELETE"):
+            self.touch(uid)
+            return h._send(200, {"data": {"id": parts[3]}})
+        if len(parts) == 3 and parts[2] in ("folders", "requests") and method == "POST":
+            self.touch(uid)
+            with self._lock:
+                self.stats.setdefault("created_items", 0)
+                self.stats["created_items"] += 1
+                new_id = f"bench-{parts[2][:-1]}-{self.stats['created_items']:05d}"
+            return h._send(200, {"data": {"id": new_id}})
+        return h._send(405, {"error": "methodNotAllowed"})
+
+
+def make_fake(n_collections: int, n_requests: int, depth: int, payload_chars: int = 200, **kwargs: Any) -> FakePostman:
+    return FakePostman(make_workspace(n_collections, n_requests, depth, payload_chars), **kwargs)
+
+
+def main() -> None:
+    p = argparse.ArgumentParser(description="Fake Postman API")
+    p.add_argument("--port", type=int, default=8765)
+    p.add_argument("--collections", type=int, default=50)
+    p.add_argument("--requests", type=int, default=50)
+    p.add_argument("--depth", type=int, default=2)
+    p.add_argument("--latency-ms", type=float, default=50)
+    p.add_argument("--rate-429", type=float, default=0.0)
+    p.add_argument("--rate-5xx", type=float, default=0.0)
+    args = p.parse_args()
+    fake = make_fake(args.collections, args.requests, args.depth, latency_ms=args.latency_ms,
+                     rate_429=args.rate_429, rate_5xx=args.rate_5xx).start(args.port)
+    print(f"fake Postman API on {fake.base_url} (workspace={WORKSPACE_ID}, master={MASTER_UID})")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        fake.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Офлайн-бенчмарк всей цепочки на локальном fake Postman API.
+
+Фазы: list → fetch → build_master → digest → upload. Для каждой — время, число API-запросов,
+байты (по счётчикам fake-сервера) и пиковый RSS процесса. Результат — JSON в bench/results/,
+--compare показывает разницу с прошлым результатом.
+
+    python bench/run_bench.py --collections 200 --requests 50 --depth 3 --latency-ms 80 --rate-429 0.02
+    python bench/run_bench.py … --compare bench/results/<прошлый>.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import subprocess
+import sys
+import time
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None  # type: ignore
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench.fake_postman import MASTER_UID, WORKSPACE_ID, make_fake  # noqa: E402
+
+
+def peak_rss_mb() -> float | None:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux — КБ, macOS — байты
+    return round(peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024, 1)
+
+
+def git_version() -> str | None:
+    try:
+        out = subprocess.run(["git", "describe", "--always", "--dirty"], cwd=ROOT, capture_output=True, text=True, timeout=5)
+        return out.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+class Phases:
+    def __init__(self, bm, fake, verbose: bool):
+        self.bm = bm
+        self.fake = fake
+        self.verbose = verbose
+        self.results: dict = {}
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        calls0 = sum(self.bm.api_call_counts().values())
+        stats0 = dict(self.fake.stats)
+        sink = contextlib.nullcontext() if self.verbose else contextlib.redirect_stdout(io.StringIO())
+        t0 = time.perf_counter()
+        with sink:
+            yield
+        took = time.perf_counter() - t0
+        stats1 = self.fake.stats
+        self.results[name] = {
+            "seconds": round(took, 4),
+            "api_calls": sum(self.bm.api_call_counts().values()) - calls0,
+            "bytes_up": stats1["bytes_in"] - stats0["bytes_in"],
+            "bytes_down": stats1["bytes_out"] - stats0["bytes_out"],
+            "status_429": stats1["status_429"] - stats0["status_429"],
+            "status_5xx": stats1["status_5xx"] - stats0["status_5xx"],
+            "peak_rss_mb": peak_rss_mb(),
+        }
+        r = self.results[name]
+        print(f"{name:>8}: {r['seconds']:8.3f}s  calls {r['api_calls']:5d}  "
+              f"down {r['bytes_down'] / 1024:9.1f} KB  up {r['bytes_up'] / 1024:9.1f} KB  rss {r['peak_rss_mb']} MB")
+
+
+def compare(current: dict, previous_path: str) -> None:
+    with open(previous_path, "r", encoding="utf-8") as f:
+        prev = json.load(f)
+    print(f"\nсравнение с {previous_path} ({prev.get('version')}):")
+    for name, cur in current["phases"].items():
+        old = prev.get("phases", {}).get(name)
+        if not old:
+            continue
+        ratio = cur["seconds"] / old["seconds"] if old["seconds"] else float("inf")
+        print(f"{name:>8}: {old['seconds']:8.3f}s → {cur['seconds']:8.3f}s  (×{ratio:.2f})")
+
+
+def main() -> None:
+    p = argparse.ArgumentParser(description="Offline benchmark on a fake Postman API")
+    p.add_argument("--collections", type=int, default=50, help="N коллекций-источников")
+    p.add_argument("--requests", type=int, default=50, help="M запросов в каждой")
+    p.add_argument("--depth", type=int, default=2, help="D уровней вложенности папок")
+    p.add_argument("--payload-chars", type=int, default=200, help="Размер body.raw у запроса")
+    p.add_argument("--latency-ms", type=float, default=50)
+    p.add_argument("--rate-429", type=float, default=0.0, help="Доля ответов 429")
+    p.add_argument("--rate-5xx", type=float, default=0.0, help="Доля ответов 503")
+    p.add_argument("--concurrency", type=int, default=8)
+    p.add_argument("--build-workers", type=int, default=1, help="Процессов для сборки папок (см. build_folders)")
+    p.add_argument("--rate-limit-rps", type=float, default=0.0, help="RATE_LIMIT_RPS клиента (0 — без лимита)")
+    p.add_argument("--out", default=None, help="Куда сохранить JSON (по умолчанию bench/results/<время>.json)")
+    p.add_argument("--compare", default=None, help="JSON прошлого прогона для сравнения")
+    p.add_argument("--verbose", action="store_true", help="Не глушить вывод скрипта")
+    args = p.parse_args()
+
+    # build_master_mass_merge читает ключ и лимиты при импорте
+    os.environ["POSTMAN_API_KEY"] = os.environ.get("POSTMAN_API_KEY") or "bench"
+    os.environ["RATE_LIMIT_RPS"] = str(args.rate_limit_rps)
+    import build_master_mass_merge as bm
+
+    fake = make_fake(args.collections, args.requests, args.depth, args.payload_chars,
+                     latency_ms=args.latency_ms, rate_429=args.rate_429, rate_5xx=args.rate_5xx).start()
+    bm.API_BASE = fake.base_url
+    bm.configure_http(args.concurrency)
+    ph = Phases(bm, fake, args.verbose)
+
+    t0 = time.perf_counter()
+    with ph.phase("list"):
+        meta = bm.list_collections(WORKSPACE_ID)
+    uids = [c["uid"] for c in meta if c["uid"] != MASTER_UID]
+    with ph.phase("fetch"):
+        fetched = bm._fetch_many(uids, args.concurrency)
+    with ph.phase("build"):
+        master = bm.build_master([col for _, col in fetched], "Bench master", "", False, build_workers=args.build_workers)
+    with ph.phase("digest"):
+        bm._normalized_digest(master)
+    with ph.phase("upload"):
+        bm.update_collection(MASTER_UID, master, None, mode="full")
+    total = time.perf_counter() - t0
+    fake.stop()
+
+    result = {
+        "version": git_version(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": sys.version.split()[0],
+        "params": vars(args),
+        "phases": ph.results,
+        "total_seconds": round(total, 4),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+    print(f"   total: {total:8.3f}s  peak rss {result['peak_rss_mb']} MB")
+
+    out = args.out or os.path.join(ROOT, "bench", "results", time.strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(out), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"результат: {out}")
+    if args.compare:
+        compare(result, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""
+Генератор синтетических Postman-коллекций (v2.1) для бенчмарков.
+Структура похожа на наши реальные коллекции: папки, запросы со скриптами,
+auth, заголовками и id/uid/_postman_id на всех уровнях.
+"""
+
+import random
+import uuid
+from typing import Any, Dict, List
+
+SCHEMA = "https://schema.getpostman.com/json/collection/v2.1.0/collection.json"
+
+# Несколько «шаблонных» скриптов: в реальных воркспейсах коллекции клонированы из пары шаблонов
+_TEMPLATE_SCRIPTS = [
+    [
+        "pm.test(\"Status code is 200\", function () {",
+        "    pm.response.to.have.status(200);",
+        "});",
+        "const body = pm.response.json();",
+        "pm.environment.set(\"last_id\", body.id);",
+    ],
+    [
+        "const token = pm.environment.get(\"token\");",
+        "pm.request.headers.add({key: \"Authorization\", value: `Bearer ${token}`});",
+    ],
+]
+
+
+def _id(rnd: random.Random) -> str:
+    return str(uuid.UUID(int=rnd.getrandbits(128)))
+
+
+def make_request(rnd: random.Random, i: int, payload_chars: int = 200) -> Dict[str, Any]:
+    return {
+        "id": _id(rnd),
+        "name": f"Запрос {i}",
+        "event": [
+            {
+                "listen": "test",
+                "script": {"id": _id(rnd), "type": "text/javascript", "exec": list(_TEMPLATE_SCRIPTS[i % 2])},
+            }
+        ],
+        "request": {
+            "method": rnd.choice(["GET", "POST", "PUT", "DELETE"]),
+            "header": [
+                {"key": "Content-Type", "value": "application/json"},
+                {"key": "Accept", "value": "application/json"},
+            ],
+            "auth": {"type": "bearer", "bearer": [{"key": "token", "value": "{{token}}", "type": "string"}]},
+            "body": {"mode": "raw", "raw": "x" * payload_chars},
+            "url": {
+                "raw": f"{{{{base_url}}}}/api/v1/items/{i}",
+                "host": ["{{base_url}}"],
+                "path": ["api", "v1", "items", str(i)],
+            },
+            "description": f"Описание запроса {i}",
+        },
+        "response": [],
+    }
+
+
+def _make_items(rnd: random.Random, n_requests: int, depth: int, counter: List[int], payload_chars: int) -> List[Dict[str, Any]]:
+    if depth <= 1 or n_requests <= 2:
+        items = []
+        for _ in range(n_requests):
+            counter[0] += 1
+            items.append(make_request(rnd, counter[0], payload_chars))
+        return items
+    # половина запросов на этом уровне, остальное — в две подпапки
+    here = n_requests // 2
+    rest = n_requests - here
+    items = _make_items(rnd, here, 1, counter, payload_chars)
+    for k, part in enumerate((rest // 2, rest - rest // 2)):
+        items.append({
+            "id": _id(rnd),
+            "name": f"Папка {depth}.{k}",
+            "item": _make_items(rnd, part, depth - 1, counter, payload_chars),
+        })
+    return items
+
+
+def make_collection(
+    name: str,
+    n_requests: int = 50,
+    depth: int = 2,
+    seed: int = 0,
+    payload_chars: int = 200,
+) -> Dict[str, Any]:
+    """Коллекция с n_requests запросами на глубине до depth уровней папок."""
+    rnd = random.Random(seed)
+    return {
+        "info": {
+            "_postman_id": _id(rnd),
+            "name": name,
+            "description": f"Коллекция {name}",
+            "schema": SCHEMA,
+            "uid": f"1-{_id(rnd)}",
+        },
+        "item": _make_items(rnd, n_requests, depth, [0], payload_chars),
+        "event": [{"listen": "prerequest", "script": {"id": _id(rnd), "type": "text/javascript", "exec": list(_TEMPLATE_SCRIPTS[1])}}],
+        "variable": [{"key": "base_url", "value": "https://example.test"}],
+    }
+
+
+def make_workspace(n_collections: int, n_requests: int, depth: int, payload_chars: int = 200) -> List[Dict[str, Any]]:
+    """n_collections коллекций с детерминированным содержимым (seed = номер коллекции)."""
+    return [
+        make_collection(f"Коллекция {i}", n_requests, depth, seed=i, payload_chars=payload_chars)
+        for i in range(n_collections)
+    ]
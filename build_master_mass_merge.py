@@ -4,18 +4,49 @@ import json
 import time
 import hashlib
 import argparse
-from typing import List, Dict, Any, Iterable, Tuple
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import asyncio
+import threading
+import contextvars
+import gc
+import marshal
+import multiprocessing
+import random
+from email.utils import parsedate_to_datetime
+from contextlib import contextmanager
+from typing import List, Dict, Any, Iterable, Iterator, Tuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from functools import lru_cache
+from itertools import repeat
+from collections import OrderedDict
 import config as cfg
+import interning
+import metrics
+import selection
+from snapshot_store import SnapshotStore
 
 try:
     import requests
+    from requests.adapters import HTTPAdapter
 except ImportError:
     print("Установи пакет: pip install requests", file=sys.stderr)
     sys.exit(1)
 
+# Необязательные ускорители: orjson — быстрый (де)сериализатор, ijson — потоковый разбор ответов
+try:
+    import orjson  # type: ignore
+except ImportError:
+    orjson = None  # type: ignore
+try:
+    import ijson  # type: ignore
+except ImportError:
+    ijson = None  # type: ignore
+try:
+    import fcntl  # межпроцессный лок сборки (Linux/macOS)
+except ImportError:  # pragma: no cover
+    fcntl = None  # type: ignore
+
 # ===================== НАСТРОЙКИ ПО УМОЛЧАНИЮ =====================
-API_BASE = "https://api.getpostman.com"
+API_BASE = cfg.API_BASE
 API_KEY: str = os.getenv("POSTMAN_API_KEY", "")
 HEADERS = {"X-Api-Key": API_KEY, "Content-Type": "application/json"}
 
@@ -29,41 +60,321 @@ DEFAULT_FOLDER_PREFIX = cfg.DEFAULT_FOLDER_PREFIX
 DEFAULT_ADD_README = cfg.DEFAULT_ADD_README
 DEFAULT_CONCURRENCY = cfg.DEFAULT_CONCURRENCY
 DEFAULT_SKIP_UNCHANGED = cfg.DEFAULT_SKIP_UNCHANGED
+FALLBACK_CREATE_ON_PUT_ERROR = cfg.FALLBACK_CREATE_ON_PUT_ERROR
 
 
 
 # ===================== HTTP УТИЛИТЫ =====================
 
-def _req(method: str, path: str, body: dict | None = None, retry: int = 3) -> dict:
+class _RateLimiter:
+    """
+    Глобальный token bucket на все потоки: не более rate запросов/сек со всплеском до burst.
+    Подстраивается под ответы Postman: X-RateLimit-Remaining урезает запас токенов,
+    Retry-After / исчерпанный лимит ставят на паузу сразу всех воркеров.
+    """
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        # rate <= 0 — без token bucket, но пауза по Retry-After / X-RateLimit-* действует всегда
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    wait = self._paused_until - now
+                elif self.rate <= 0:
+                    return
+                else:
+                    self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                    self._updated = now
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        return
+                    wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def pause(self, seconds: float) -> None:
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def observe(self, headers: Any) -> None:
+        remaining = _header_number(headers, "X-RateLimit-Remaining")
+        if remaining is None:
+            return
+        if remaining <= 0:
+            wait = _reset_seconds(_header_number(headers, "X-RateLimit-Reset"))
+            print(f"rate limit: лимит исчерпан, пауза {wait:.1f}s")
+            self.pause(wait)
+            return
+        with self._lock:
+            self._tokens = min(self._tokens, remaining)
+
+
+def _header_number(headers: Any, name: str) -> float | None:
+    try:
+        return float(headers.get(name))
+    except (TypeError, ValueError):
+        return None
+
+
+def _reset_seconds(reset: float | None) -> float:
+    """
+    X-RateLimit-Reset → секунды паузы. Бывает и «через N секунд», и unix-время сброса;
+    пауза не длиннее RATE_LIMIT_MAX_PAUSE, чтобы странный заголовок не остановил все потоки надолго.
+    """
+    if reset is None or reset <= 0:
+        return 1.0
+    if reset > 1e9:  # похоже на unix-время
+        reset -= time.time()
+    return min(max(reset, 1.0), max(1.0, cfg.RATE_LIMIT_MAX_PAUSE))
+
+
+def _retry_after_seconds(headers: Any) -> float | None:
+    """Retry-After бывает числом секунд или HTTP-датой."""
+    value = headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+_api_calls: Dict[str, int] = {}
+_api_calls_lock = threading.Lock()
+
+
+def _count_api_call(method: str) -> None:
+    with _api_calls_lock:
+        _api_calls[method] = _api_calls.get(method, 0) + 1
+
+
+def api_call_counts() -> Dict[str, int]:
+    """Сколько HTTP-запросов (включая повторы) ушло в Postman API с начала процесса, по методам."""
+    with _api_calls_lock:
+        return dict(_api_calls)
+
+
+_session: "requests.Session | None" = None
+_session_pool_size = 0
+_session_lock = threading.Lock()
+_limiter = _RateLimiter(cfg.RATE_LIMIT_RPS, cfg.RATE_LIMIT_BURST)
+
+
+def _new_session(pool_size: int) -> "requests.Session":
+    session = requests.Session()
+    session.headers.update(HEADERS)
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def configure_http(pool_size: int) -> None:
+    """
+    Общий keep-alive Session с пулом соединений не меньше pool_size.
+    Пул только растёт; прежний Session закрывается, чтобы его соединения не висели открытыми
+    (зовётся до запуска потоков — см. run_profiles).
+    """
+    global _session, _session_pool_size
+    pool_size = max(1, pool_size)
+    with _session_lock:
+        if _session is not None and _session_pool_size >= pool_size:
+            return
+        old, _session, _session_pool_size = _session, _new_session(pool_size), pool_size
+    if old is not None:
+        old.close()
+
+
+def _get_session() -> "requests.Session":
+    global _session, _session_pool_size
+    with _session_lock:
+        if _session is None:
+            _session, _session_pool_size = _new_session(DEFAULT_CONCURRENCY), DEFAULT_CONCURRENCY
+        return _session
+
+
+# ---------- JSON: потоковая сериализация тела и разбор ответа ----------
+
+_BODY_CHUNK = 64 * 1024  # мелкие куски склеиваем до такого размера перед отправкой
+_STREAM_DEPTH = 3  # {"collection": {"item": [папка, …]}} — целиком в памяти только одна папка
+
+
+def _dumps(obj: Any) -> bytes:
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj)
+        except (TypeError, orjson.JSONEncodeError):
+            pass  # например, int больше 64 бит — пусть разбирается json
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def _iter_json(obj: Any, depth: int = _STREAM_DEPTH) -> Iterable[bytes]:
+    """JSON по кускам: верхние depth уровней dict/list раскрываются, глубже — _dumps целиком."""
+    if depth <= 0 or not isinstance(obj, (dict, list)) or not obj:
+        yield _dumps(obj)
+    elif isinstance(obj, dict):
+        sep = b"{"
+        for k, v in obj.items():
+            yield sep + _dumps(str(k)) + b":"
+            yield from _iter_json(v, depth - 1)
+            sep = b","
+        yield b"}"
+    else:
+        sep = b"["
+        for v in obj:
+            yield sep
+            yield from _iter_json(v, depth - 1)
+            sep = b","
+        yield b"]"
+
+
+class _JsonBody:
+    """
+    Тело запроса, которое сериализуется по ходу отправки (chunked) и само считает свой размер.
+    Итерировать можно заново — каждый ретрай получает свежий генератор.
+    """
+
+    def __init__(self, obj: Any):
+        self.obj = obj
+        self.size = 0
+
+    def __iter__(self) -> Iterable[bytes]:
+        self.size = 0
+        buf = bytearray()
+        for chunk in _iter_json(self.obj):
+            buf += chunk
+            if len(buf) >= _BODY_CHUNK:
+                self.size += len(buf)
+                yield bytes(buf)
+                buf.clear()
+        if buf:
+            self.size += len(buf)
+            yield bytes(buf)
+
+
+def _json_size(obj: Any) -> int:
+    """Размер JSON без сборки всей строки в памяти."""
+    return sum(len(chunk) for chunk in _iter_json(obj))
+
+
+class _CountingReader:
+    """Обёртка над r.raw для ijson: считает прочитанные байты."""
+
+    def __init__(self, raw: Any):
+        self.raw = raw
+        self.bytes = 0
+
+    def read(self, size: int = -1) -> bytes:
+        data = self.raw.read(size, decode_content=True)
+        self.bytes += len(data)
+        return data
+
+
+class _StreamParseError(RuntimeError):
+    """ijson не справился с ответом (например, целое больше 64 бит) — повторить запрос без потокового разбора."""
+
+
+def _parse_response(r: "requests.Response", streamed: bool) -> Tuple[Any, int]:
+    """Тело успешного ответа → (объект, байт). С ijson — разбор по мере чтения сокета, без копии тела."""
+    if streamed:
+        reader = _CountingReader(r.raw)
+        try:
+            obj = next(ijson.items(reader, "", use_float=True), None)
+            while reader.read(_BODY_CHUNK):  # дочитываем хвост, чтобы соединение вернулось в пул
+                pass
+        except Exception as e:
+            r.close()
+            reason = (str(e).splitlines() or [type(e).__name__])[0]
+            raise _StreamParseError(f"{r.request.method} {r.url}: {reason}") from e
+        r.raw.release_conn()
+        return obj, reader.bytes
+    content = r.content
+    return (orjson.loads(content) if orjson is not None else json.loads(content)), len(content)
+
+
+def _req(method: str, path: str, body: "dict | _JsonBody | None" = None, retry: int = 3) -> dict:
     if not HEADERS.get("X-Api-Key"):
         raise RuntimeError("POSTMAN_API_KEY не задан")
     if not API_KEY:
         raise RuntimeError("POSTMAN_API_KEY не задан.")
+    if method not in ("GET", "POST", "PUT", "DELETE"):
+        raise RuntimeError(f"Unsupported method {method}")
     url = f"{API_BASE}{path}"
+    # Коллекцию целиком не сериализуем заранее: тело генерируется по папкам во время отправки
+    data: "_JsonBody | bytes | None"
+    if isinstance(body, _JsonBody) or (body and "collection" in body):
+        data = body if isinstance(body, _JsonBody) else _JsonBody(body)
+    else:
+        data = _dumps(body) if body else None
+    streamed = ijson is not None
+    timeout = 60 if method == "GET" else 120
+    session = _get_session()
     backoff = 1.5
-    for attempt in range(retry):
-        try:
-            if method == "GET":
-                r = requests.get(url, headers=HEADERS, timeout=60)
-            elif method == "POST":
-                r = requests.post(url, headers=HEADERS, data=json.dumps(body) if body else None, timeout=120)
-            elif method == "PUT":
-                r = requests.put(url, headers=HEADERS, data=json.dumps(body) if body else None, timeout=120)
-            else:
-                raise RuntimeError(f"Unsupported method {method}")
-        except requests.RequestException as e:
-            if attempt < retry - 1:
-                time.sleep(backoff); backoff *= 2; continue
-            raise RuntimeError(f"HTTP error: {e}") from e
+    # метрики: латентность всего вызова (с ретраями), итоговый статус, байты туда/обратно
+    t0 = time.perf_counter()
+    status: int | str = "error"
+    attempt = 0
+    bytes_out = bytes_in = 0
+    try:
+        for attempt in range(retry):
+            _limiter.acquire()
+            _count_api_call(method)
+            try:
+                r = session.request(method, url, data=data, timeout=timeout, stream=streamed)
+            except requests.RequestException as e:
+                if attempt < retry - 1:
+                    time.sleep(backoff); backoff *= 2; continue
+                raise RuntimeError(f"HTTP error: {e}") from e
+            finally:
+                bytes_out += data.size if isinstance(data, _JsonBody) else len(data or b"")
+
+            status = r.status_code
+            _limiter.observe(r.headers)
+
+            if r.ok:
+                try:
+                    obj, received = _parse_response(r, streamed)
+                except _StreamParseError as e:
+                    if attempt == retry - 1:
+                        raise RuntimeError(f"невалидный JSON в ответе {e}") from e
+                    print(f"warn: потоковый разбор не удался ({e}) → повтор без него")
+                    streamed = False
+                    continue
+                bytes_in += received
+                return obj
+
+            bytes_in += len(r.content)
+            if r.status_code == 411 and isinstance(data, _JsonBody) and attempt < retry - 1:
+                # сервер не принимает chunked — шлём тем же телом, но одним куском
+                print("warn: 411 Length Required на потоковое тело → отправка одним куском")
+                data = b"".join(data)
+                continue
 
-        if r.status_code in (429, 500, 502, 503, 504) and attempt < retry - 1:
-            time.sleep(backoff); backoff *= 2; continue
+            if r.status_code == 429 and attempt < retry - 1:
+                # Пауза общая для всех воркеров: следующий acquire() дождётся её окончания
+                wait = _retry_after_seconds(r.headers)
+                _limiter.pause(wait if wait is not None else backoff)
+                backoff *= 2
+                continue
 
-        if not r.ok:
-            raise RuntimeError(f"{method} {path} → {r.status_code} {r.text}")
+            if r.status_code in (500, 502, 503, 504) and attempt < retry - 1:
+                time.sleep(backoff); backoff *= 2; continue
 
-        return r.json()
-    raise RuntimeError("Unreachable")
+            raise RuntimeError(f"{method} {path} → {r.status_code} {r.text}")
+        raise RuntimeError("Unreachable")
+    finally:
+        metrics.observe_http(method, status, time.perf_counter() - t0, attempt, bytes_out, bytes_in)
 
 # ===================== POSTMAN API =====================
 
@@ -73,6 +384,31 @@ def list_collections(workspace_id: str | None = None) -> List[Dict[str, Any]]:
     return data.get("collections", [])
 
 
+def list_collections_many(workspace_ids: List[str | None], concurrency: int = 1, verbose: bool = True) -> List[Dict[str, Any]]:
+    """
+    Метаданные коллекций сразу из нескольких воркспейсов (запросы параллельно).
+    Коллекция, расшаренная в несколько воркспейсов, встречается один раз — там, где попалась первой
+    (порядок — как в workspace_ids). В метаданные добавляется "workspace" — откуда она взята.
+    """
+    if len(workspace_ids) == 1:
+        lists = [list_collections(workspace_ids[0])]
+    else:
+        with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(workspace_ids)))) as pool:
+            lists = list(pool.map(lambda ws: contextvars.copy_context().run(list_collections, ws), workspace_ids))
+    seen: set = set()
+    out: List[Dict[str, Any]] = []
+    for ws, cols in zip(workspace_ids, lists):
+        if verbose:
+            print(f"  workspace {ws or 'ALL'}: {len(cols)} коллекций")
+        for c in cols:
+            uid = c.get("uid")
+            if uid in seen:
+                continue
+            seen.add(uid)
+            out.append({**c, "workspace": ws})
+    return out
+
+
 def get_collection(uid: str) -> Dict[str, Any]:
     data = _req("GET", f"/collections/{uid}")
     return data["collection"]
@@ -83,37 +419,89 @@ def create_collection(col_json: Dict[str, Any], workspace_id: str | None) -> Dic
     return _req("POST", path, {"collection": col_json})
 
 
-def ensure_postman_id(col_json: dict, master_uid: str) -> None:
+class MasterSnapshot:
+    """
+    Текущая мастер-коллекция, загруженная из API не больше одного раза за прогон.
+    Из неё берутся описание, digest для --skip-unchanged и info._postman_id для PUT.
+    """
+
+    def __init__(self, uid: str | None):
+        self.uid = uid
+        self.error: Exception | None = None
+        self._collection: Dict[str, Any] | None = None
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def get(self) -> Dict[str, Any] | None:
+        """Коллекция или None (если uid не задан или загрузка упала — см. self.error)."""
+        with self._lock:
+            if not self._loaded:
+                self._loaded = True
+                if self.uid:
+                    try:
+                        self._collection = get_collection(self.uid)
+                    except Exception as e:
+                        self.error = e
+            return self._collection
+
+    @property
+    def info(self) -> Dict[str, Any]:
+        return (self.get() or {}).get("info") or {}
+
+
+def ensure_postman_id(col_json: dict, master_uid: str, snapshot: MasterSnapshot | None = None) -> None:
     """
     Тихо вытягиваем info._postman_id из существующей master и проставляем в col_json,
-    чтобы PUT обновлял ту же коллекцию, а не создавал новую.
+    чтобы PUT обновлял ту же коллекцию, а не создавал новую. Уже проставленный (из сохранённого
+    мастера при --only-uid) не перепроверяется.
     """
-    try:
-        existing = get_collection(master_uid)
-        pid = existing.get("info", {}).get("_postman_id")
-        if pid:
-            col_json.setdefault("info", {})["_postman_id"] = pid
-    except Exception as e:
-        print(f"warn: couldn't fetch existing master info: {e}")
+    if (col_json.get("info") or {}).get("_postman_id"):
+        return
+    snapshot = snapshot or MasterSnapshot(master_uid)
+    if snapshot.get() is None:
+        print(f"warn: couldn't fetch existing master info: {snapshot.error}")
+        return
+    pid = snapshot.info.get("_postman_id")
+    if pid:
+        col_json.setdefault("info", {})["_postman_id"] = pid
 
 
-def update_collection(uid: str, col_json: dict, workspace_id: str | None) -> dict:
+def update_collection(
+    uid: str,
+    col_json: dict,
+    workspace_id: str | None,
+    snapshot: MasterSnapshot | None = None,
+    mode: str = "full",
+    fallback_create: bool = True,
+) -> dict:
+    """
+    Обновляет мастер. mode="full" — один PUT всей коллекции; "delta" — только изменившиеся
+    папки/запросы через folder/request-эндпоинты; "auto" — delta, если он заметно меньше полного PUT.
+    Если delta невозможен или упал — полный PUT. fallback_create=False — при 5xx не создавать
+    новую коллекцию (для шардов: их UID ведёт реестр).
+    """
+    snapshot = snapshot or MasterSnapshot(uid)
     # 1) сохраним info._postman_id (для корректного PUT)
-    ensure_postman_id(col_json, uid)
+    ensure_postman_id(col_json, uid, snapshot)
 
-    # 2) полезная метрика: размер
-    try:
-        payload_size_kb = len(json.dumps({"collection": col_json}).encode("utf-8")) / 1024
-        print(f"payload ~ {payload_size_kb:.1f} KB")
-    except Exception:
-        pass
+    # 2) delta сравнивает себя с размером полного PUT — считаем его потоково, без строки в памяти
+    if mode in ("delta", "auto"):
+        full_size = _json_size({"collection": col_json})
+        result = _try_delta_update(uid, col_json, snapshot, full_size, force=mode == "delta")
+        if result is not None:
+            return result
 
-    # 3) PUT, при 5xx → POST (создание новой)
+    # 3) PUT (тело генерируется по ходу отправки, размер считается там же), при 5xx → POST (создание новой)
     try:
-        return _req("PUT", f"/collections/{uid}", {"collection": col_json})
+        t0 = time.perf_counter()
+        body = _JsonBody({"collection": col_json})
+        result = _req("PUT", f"/collections/{uid}", body)
+        print(f"upload: full PUT {body.size / 1024:.1f} KB, API {time.perf_counter() - t0:.2f}s")
+        metrics.count("payload_bytes", body.size)
+        return result
     except RuntimeError as e:
         msg = str(e)
-        if (" 500 " in msg or " 502 " in msg or " 503 " in msg or " 504 " in msg) and FALLBACK_CREATE_ON_PUT_ERROR:
+        if (" 500 " in msg or " 502 " in msg or " 503 " in msg or " 504 " in msg) and fallback_create and FALLBACK_CREATE_ON_PUT_ERROR:
             print("PUT failed with 5xx → fallback: creating a NEW collection via POST …")
             created = create_collection(col_json, workspace_id)
             try:
@@ -124,6 +512,305 @@ def update_collection(uid: str, col_json: dict, workspace_id: str | None) -> dic
             return created
         raise
 
+# ===================== DELTA-ОБНОВЛЕНИЕ =====================
+
+class _DeltaFallback(RuntimeError):
+    """Изменение нельзя (или невыгодно) выразить через folder/request-эндпоинты — нужен полный PUT."""
+
+
+# Поля, которые folder/request-эндпоинты переносят без потерь; всё остальное → полный PUT
+_DELTA_REQUEST_ITEM_KEYS = frozenset(("name", "request", "event", "response", "id", "uid", "_postman_id"))
+_DELTA_FOLDER_KEYS = frozenset(("name", "description", "auth", "event", "variable", "item", "id", "uid", "_postman_id"))
+_DELTA_REQUEST_KEYS = frozenset(("method", "url", "header", "body", "auth", "description"))
+_DELTA_URL_KEYS = frozenset(("raw", "protocol", "host", "path", "port", "query", "hash"))
+_DELTA_BODY_KEYS = frozenset(("mode", "raw", "urlencoded", "formdata", "graphql", "options"))
+_DELTA_ROW_KEYS = frozenset(("key", "value", "description", "disabled", "type"))
+
+
+def _check_keys(obj: Dict[str, Any], allowed: frozenset, where: str) -> None:
+    extra = sorted(k for k in obj if k not in allowed)
+    if extra:
+        raise _DeltaFallback(f"{where}: поля {', '.join(extra[:5])} не переносятся delta")
+
+
+def _description_text(desc: Any, where: str = "") -> Any:
+    """Описание как строка; объект с чем-то кроме content (например, type) delta не переносит."""
+    if isinstance(desc, dict):
+        _check_keys(desc, frozenset(("content",)), f"description в «{where}»")
+        return desc.get("content")
+    return desc
+
+
+def _delta_url(url: Any, where: str) -> str:
+    """URL уходит в delta только строкой raw — переменные, описания и disabled у query теряются."""
+    if not isinstance(url, dict):
+        return url or ""
+    _check_keys(url, _DELTA_URL_KEYS, f"url в «{where}»")
+    for q in url.get("query") or []:
+        if not isinstance(q, dict):
+            raise _DeltaFallback(f"url в «{where}»: непонятный query")
+        _check_keys(q, frozenset(("key", "value")), f"query в «{where}»")
+    return url.get("raw", "")
+
+
+def _kv_rows(rows: Any, where: str = "") -> List[Dict[str, Any]]:
+    out = []
+    for r in rows or []:
+        if not isinstance(r, dict):
+            raise _DeltaFallback(f"непонятная строка key/value в «{where}»")
+        _check_keys(r, _DELTA_ROW_KEYS, f"key/value в «{where}»")
+        if r.get("type") not in (None, "text"):
+            raise _DeltaFallback(f"key/value type={r.get('type')} в «{where}»")
+        out.append({
+            "key": r.get("key"),
+            "value": r.get("value"),
+            "description": _description_text(r.get("description"), where),
+            "enabled": not r.get("disabled", False),
+        })
+    return out
+
+
+def _request_payload(item: Dict[str, Any]) -> Dict[str, Any]:
+    """item запроса (Collection v2.1) → тело PUT /collections/{uid}/requests/{id}."""
+    name = item.get("name")
+    _check_keys(item, _DELTA_REQUEST_ITEM_KEYS, f"запрос «{name}»")
+    req = item.get("request")
+    if isinstance(req, str):
+        req = {"url": req, "method": "GET"}
+    if not isinstance(req, dict):
+        raise _DeltaFallback(f"непонятный request в «{name}»")
+    _check_keys(req, _DELTA_REQUEST_KEYS, f"request в «{name}»")
+    payload: Dict[str, Any] = {
+        "name": name,
+        "description": _description_text(req.get("description"), name),
+        "method": req.get("method", "GET"),
+        "url": _delta_url(req.get("url"), name),
+        "headerData": _kv_rows(req.get("header"), name),
+        "auth": req.get("auth"),
+        "events": item.get("event") or [],
+        "dataMode": None,
+    }
+    body = req.get("body") or {}
+    _check_keys(body, _DELTA_BODY_KEYS, f"body в «{name}»")
+    mode = body.get("mode")
+    if mode == "raw":
+        payload["dataMode"], payload["rawModeData"] = "raw", body.get("raw", "")
+    elif mode == "urlencoded":
+        payload["dataMode"], payload["data"] = "urlencoded", _kv_rows(body.get("urlencoded"), name)
+    elif mode == "formdata":
+        payload["dataMode"], payload["data"] = "params", _kv_rows(body.get("formdata"), name)
+    elif mode == "graphql":
+        payload["dataMode"], payload["graphqlModeData"] = "graphql", body.get("graphql") or {}
+    elif mode:
+        raise _DeltaFallback(f"body.mode={mode} в «{name}»")
+    if body.get("options"):
+        payload["dataOptions"] = body["options"]
+    return payload
+
+
+def _folder_payload(item: Dict[str, Any]) -> Dict[str, Any]:
+    _check_keys(item, _DELTA_FOLDER_KEYS, f"папка «{item.get('name')}»")
+    return {
+        "name": item.get("name"),
+        "description": _description_text(item.get("description"), item.get("name")),
+        "auth": item.get("auth"),
+        "events": item.get("event") or [],
+    }
+
+
+def _own_fields(item: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: v for k, v in item.items() if k != "item"}
+
+
+def _diff_item(cur: Dict[str, Any], new: Dict[str, Any], ops: List[Tuple[str, str, Dict[str, Any] | None]]) -> None:
+    if _normalized_digest(cur) == _normalized_digest(new):
+        return
+    if ("item" in cur) != ("item" in new):
+        raise _DeltaFallback(f"«{new.get('name')}»: папка стала запросом или наоборот")
+    item_id = cur.get("id")
+    if not item_id:
+        raise _DeltaFallback(f"у «{cur.get('name')}» в текущем мастере нет id")
+
+    if "item" not in new:
+        if _normalized_digest(cur.get("response") or []) != _normalized_digest(new.get("response") or []):
+            raise _DeltaFallback(f"изменились примеры ответов в «{new.get('name')}»")
+        ops.append(("PUT", f"/requests/{item_id}", _request_payload(new)))
+        return
+
+    own_cur, own_new = _own_fields(cur), _own_fields(new)
+    if _normalized_digest(own_cur) != _normalized_digest(own_new):
+        if _normalized_digest(cur.get("variable")) != _normalized_digest(new.get("variable")):
+            raise _DeltaFallback(f"изменились переменные папки «{new.get('name')}»")
+        ops.append(("PUT", f"/folders/{item_id}", _folder_payload(new)))
+
+    cur_children = [c for c in cur.get("item") or [] if isinstance(c, dict)]
+    new_children = [c for c in new.get("item") or [] if isinstance(c, dict)]
+    if [("item" in c) for c in cur_children] != [("item" in c) for c in new_children]:
+        raise _DeltaFallback(f"в «{new.get('name')}» добавлены, удалены или переставлены элементы")
+    # на своём месте другое имя — переименование (PUT по id); имя, уехавшее на другое место, — перестановка
+    cur_names, new_names = [c.get("name") for c in cur_children], [c.get("name") for c in new_children]
+    moved = {a for a, b in zip(cur_names, new_names) if a != b} & set(new_names)
+    if moved:
+        raise _DeltaFallback(f"в «{new.get('name')}» переставлены элементы: " + ", ".join(map(str, sorted(moved, key=str)[:5])))
+    for c, n in zip(cur_children, new_children):
+        _diff_item(c, n, ops)
+
+
+def _create_ops(item: Dict[str, Any], parent: str | None, ops: List[Tuple[str, str, Dict[str, Any] | None]]) -> None:
+    """
+    POST-операции, создающие item (папку со всем содержимым или запрос) в конце родителя.
+    id создаваемых папок заранее неизвестны: дети ссылаются на родителя как "@<номер операции>",
+    ссылку подставляет _try_delta_update по ответу POST.
+    """
+    name = item.get("name")
+    ref = f"@{len(ops)}"
+    if "item" in item:
+        if item.get("variable"):
+            raise _DeltaFallback(f"у новой папки «{name}» есть variable")
+        body = _folder_payload(item)
+        if parent is not None:
+            body["folder"] = parent
+        ops.append(("POST", "/folders", body))
+        for child in item.get("item") or []:
+            if not isinstance(child, dict):
+                raise _DeltaFallback(f"непонятный элемент в новой папке «{name}»")
+            _create_ops(child, ref, ops)
+        return
+    if item.get("response"):
+        raise _DeltaFallback(f"примеры ответов в новом запросе «{name}»")
+    ops.append(("POST", f"/requests?folder={parent}" if parent is not None else "/requests", _request_payload(item)))
+
+
+def plan_delta_update(current: Dict[str, Any], new: Dict[str, Any]) -> List[Tuple[str, str, Dict[str, Any] | None]]:
+    """
+    Список операций (method, путь внутри /collections/{uid}, тело), которые переводят current в new
+    по папкам верхнего уровня: удаление папок, обновление полей папок и запросов на своих местах,
+    создание новых папок в конце (обычный случай — появился новый источник).
+    Новые папки в середине, перестановки и прочие структурные изменения → _DeltaFallback (нужен полный PUT).
+    """
+    if (current.get("info") or {}).get("name") != (new.get("info") or {}).get("name"):
+        raise _DeltaFallback("изменилось имя мастера")
+    for k in ("event", "auth", "variable"):
+        if _normalized_digest(current.get(k)) != _normalized_digest(new.get(k)):
+            raise _DeltaFallback(f"изменилось {k} на уровне коллекции")
+
+    cur_items = [c for c in current.get("item") or [] if isinstance(c, dict)]
+    new_items = [c for c in new.get("item") or [] if isinstance(c, dict)]
+    cur_by_name = {c.get("name"): c for c in cur_items}
+    new_names = [c.get("name") for c in new_items]
+    if len(cur_by_name) != len(cur_items) or len(set(new_names)) != len(new_names):
+        raise _DeltaFallback("повторяющиеся имена папок")
+    kept = [n for n in new_names if n in cur_by_name]
+    added = new_names[len(kept):]
+    if any(n in cur_by_name for n in added):
+        raise _DeltaFallback("новые папки не в конце: " + ", ".join(
+            map(str, [n for n in new_names[:len(kept)] if n not in cur_by_name][:5])))
+    if [c.get("name") for c in cur_items if c.get("name") in set(new_names)] != kept:
+        raise _DeltaFallback("изменился порядок папок")
+
+    ops: List[Tuple[str, str, Dict[str, Any] | None]] = []
+    for c in cur_items:
+        if c.get("name") not in set(new_names):
+            if not c.get("id"):
+                raise _DeltaFallback(f"у «{c.get('name')}» в текущем мастере нет id")
+            ops.append(("DELETE", f"/folders/{c['id']}", None))
+    for n in new_items[:len(kept)]:
+        _diff_item(cur_by_name[n.get("name")], n, ops)
+    for n in new_items[len(kept):]:
+        _create_ops(n, None, ops)
+    return ops
+
+
+def _resolve_ref(value: str, created: Dict[str, str]) -> str:
+    """"@<номер операции>" (в том числе в конце пути ?folder=@N) → id, который вернул её POST."""
+    head, sep, ref = value.rpartition("@")
+    if not sep or ref not in created:
+        return value
+    return head + created[ref]
+
+
+def _try_delta_update(
+    uid: str,
+    col_json: Dict[str, Any],
+    snapshot: MasterSnapshot,
+    full_size: int,
+    force: bool,
+) -> Dict[str, Any] | None:
+    """Пробует delta-обновление. None → нужно делать полный PUT."""
+    current = snapshot.get()
+    if current is None:
+        print(f"delta → full PUT: нет текущего мастера ({snapshot.error})")
+        return None
+    try:
+        ops = plan_delta_update(current, col_json)
+    except _DeltaFallback as e:
+        print(f"delta → full PUT: {e}")
+        return None
+    delta_size = sum(len(path) + len(json.dumps(body).encode("utf-8") if body else b"") for _, path, body in ops)
+    print(f"upload: full PUT ~ {full_size / 1024:.1f} KB | delta ~ {delta_size / 1024:.1f} KB в {len(ops)} запросах")
+    if not force and (len(ops) > cfg.DELTA_MAX_OPS or delta_size > full_size * cfg.DELTA_MAX_RATIO):
+        print("delta → full PUT: delta не выгоднее полного PUT")
+        return None
+
+    t0 = time.perf_counter()
+    created: Dict[str, str] = {}  # номер POST-операции → id созданного элемента
+    try:
+        for i, (method, path, body) in enumerate(ops):
+            path = _resolve_ref(path, created)
+            if body is not None and isinstance(body.get("folder"), str):
+                body = {**body, "folder": _resolve_ref(body["folder"], created)}
+            result = _req(method, f"/collections/{uid}{path}", body)
+            if method == "POST":
+                new_id = ((result or {}).get("data") or {}).get("id")
+                if not new_id:
+                    raise RuntimeError(f"POST {path} не вернул id")
+                created[str(i)] = new_id
+    except RuntimeError as e:
+        # часть операций могла пройти — полный PUT всё равно приведёт мастер к нужному виду
+        print(f"delta failed ({e}) → full PUT")
+        return None
+    print(f"upload: delta {delta_size / 1024:.1f} KB, {len(ops)} запросов, API {time.perf_counter() - t0:.2f}s")
+    if cfg.DELTA_VERIFY:
+        try:
+            applied = get_collection(uid)
+        except RuntimeError as e:
+            print(f"delta: не удалось проверить результат ({e}) → full PUT")
+            return None
+        if _content_digest(applied) != _content_digest(col_json):
+            print("delta: мастер после delta отличается от собранного → full PUT")
+            return None
+    return {"delta": {"ops": len(ops), "bytes": delta_size}}
+
+
+def _content_digest(col: Dict[str, Any]) -> str:
+    """Digest содержимого коллекции без служебных полей info (updatedAt, schema и т.п. API добавляет сам)."""
+    return _normalized_digest({
+        "name": (col.get("info") or {}).get("name"),
+        "item": col.get("item") or [],
+        "event": col.get("event") or [],
+        "auth": col.get("auth"),
+        "variable": col.get("variable") or [],
+    })
+
+# ===================== ASYNC API =====================
+# Те же вызовы для asyncio-кода (например, FastAPI): блокирующий _req уходит в поток,
+# поэтому ретраи, backoff, пул соединений и rate limit — общие с синхронной версией.
+
+async def alist_collections(workspace_id: str | None = None) -> List[Dict[str, Any]]:
+    return await asyncio.to_thread(list_collections, workspace_id)
+
+
+async def aget_collection(uid: str) -> Dict[str, Any]:
+    return await asyncio.to_thread(get_collection, uid)
+
+
+async def acreate_collection(col_json: Dict[str, Any], workspace_id: str | None) -> Dict[str, Any]:
+    return await asyncio.to_thread(create_collection, col_json, workspace_id)
+
+
+async def aupdate_collection(uid: str, col_json: dict, workspace_id: str | None) -> dict:
+    return await asyncio.to_thread(update_collection, uid, col_json, workspace_id)
+
 # ===================== НОРМАЛИЗАЦИЯ/САНИТАЙЗ =====================
 
 def _normalize_description(desc: Any) -> Any:
@@ -131,28 +818,10 @@ def _normalize_description(desc: Any) -> Any:
     return desc
 
 
-def _sanitize_item(obj: Dict[str, Any]) -> Dict[str, Any]:
-    """
-    Приводит item к валидной форме Postman v2.1:
-    - Если это группа (есть 'item'): рекурсивно чиним её элементы.
-    - Если это запрос (есть 'request'): оставляем.
-    - Если нет ни 'request', ни 'item' → превращаем в группу с пустым item[].
-    """
-    if "item" in obj:
-        items = obj.get("item") or []
-        fixed_children = []
-        for child in items:
-            if isinstance(child, dict):
-                fixed_children.append(_sanitize_item(child))
-            else:
-                fixed_children.append({"name": str(child), "item": []})
-        obj["item"] = fixed_children
-        return obj
-
-    if "request" in obj:
+def _as_valid_item(obj: Dict[str, Any]) -> Dict[str, Any]:
+    """Лист без request/item → папка с пустым item[] (поля name/description/event/auth/variable сохраняются)."""
+    if "item" in obj or "request" in obj:
         return obj
-
-    # Лист без request/item → делаем папкой
     new_obj = {"name": obj.get("name", "Untitled"), "item": []}
     if "description" in obj:
         new_obj["description"] = obj["description"]
@@ -162,29 +831,162 @@ def _sanitize_item(obj: Dict[str, Any]) -> Dict[str, Any]:
     return new_obj
 
 
-def _scrub_ids_in_place(obj: Any, keep_root_info_postman_id: bool = False, _path: Tuple[str, ...] = ()) -> None:
-    """Рекурсивно удаляет id/uid/_postman_id. Оставляет только корневой info._postman_id (если флаг True)."""
-    if isinstance(obj, dict):
-        for k in list(obj.keys()):
-            if k in ("id", "uid"):
-                obj.pop(k, None)
-            elif k == "_postman_id":
-                if not (keep_root_info_postman_id and _path == ("info",)):
-                    obj.pop(k, None)
-        for k, v in list(obj.items()):
-            _scrub_ids_in_place(v, keep_root_info_postman_id, _path + (k,))
-    elif isinstance(obj, list):
-        for v in obj:
-            _scrub_ids_in_place(v, keep_root_info_postman_id, _path)
+_CONTAINERS = frozenset((dict, list))
+
+
+def _drop_ids(node: Dict[str, Any], keep_info: Any) -> None:
+    if "id" in node:
+        del node["id"]
+    if "uid" in node:
+        del node["uid"]
+    if "_postman_id" in node and node is not keep_info:
+        del node["_postman_id"]
+
+
+def _normalize_tree(
+    obj: Any,
+    as_item: bool = False,
+    sanitize: bool = True,
+    scrub: bool = True,
+    keep_root_info_postman_id: bool = False,
+) -> Any:
+    """
+    Санитайз и чистка id за один обход явным стеком (без рекурсии и без копий ключей):
+    - sanitize: item-узлы (корень, если as_item, и все элементы их "item") приводятся
+      к валидной форме Postman v2.1 — группа / запрос; лист без request/item становится папкой,
+      не-dict элемент — папкой {"name": str(x), "item": []};
+    - scrub: из всех dict удаляются id/uid/_postman_id; корневой info._postman_id
+      остаётся, если keep_root_info_postman_id.
+    Меняет дерево на месте и возвращает корень (при санитайзе корень может быть заменён).
+    """
+    as_item = as_item and sanitize and isinstance(obj, dict)
+    if as_item:
+        obj = _as_valid_item(obj)
+    keep_info = obj.get("info") if keep_root_info_postman_id and isinstance(obj, dict) else None
+    items: List[Dict[str, Any]] = [obj] if as_item else []  # item-узлы: санитайз детей + scrub
+    other: List[Any] = [] if as_item else [obj]  # всё остальное: только scrub
+    push = other.append
+    while items or other:
+        if items:
+            node = items.pop()
+            if "item" in node:
+                fixed = []
+                for child in node["item"] or []:
+                    child = _as_valid_item(child) if isinstance(child, dict) else {"name": str(child), "item": []}
+                    fixed.append(child)
+                    items.append(child)
+                node["item"] = fixed
+                if scrub:
+                    _drop_ids(node, keep_info)
+                    for k, v in node.items():
+                        if k != "item" and type(v) in _CONTAINERS:
+                            push(v)
+                continue
+        else:
+            node = other.pop()
+            if type(node) is not dict:
+                if scrub and type(node) is list:
+                    for v in node:
+                        if type(v) in _CONTAINERS:
+                            push(v)
+                continue
+        if scrub:
+            _drop_ids(node, keep_info)
+            for v in node.values():
+                if type(v) in _CONTAINERS:
+                    push(v)
+    return obj
+
+
+def _sanitize_item(obj: Dict[str, Any]) -> Dict[str, Any]:
+    """Приводит item к валидной форме Postman v2.1 (без чистки id) — см. _normalize_tree."""
+    return _normalize_tree(obj, as_item=True, scrub=False)
+
+
+def _scrub_ids_in_place(obj: Any, keep_root_info_postman_id: bool = False) -> None:
+    """Удаляет id/uid/_postman_id. Оставляет только корневой info._postman_id (если флаг True)."""
+    _normalize_tree(obj, sanitize=False, keep_root_info_postman_id=keep_root_info_postman_id)
+
+
+_VOLATILE_KEYS = frozenset(("id", "uid", "_postman_id"))
+_DIGEST_FLUSH_CHARS = 1 << 16
+
+
+class _Raw(str):
+    """Готовый фрагмент JSON-текста на стеке _feed_canonical (в отличие от строки-значения)."""
+
+
+_encode_str = json.encoder.encode_basestring  # то же, что json.dumps(..., ensure_ascii=False) для строк
+
+
+def _encode_scalar(v: Any) -> str:
+    if isinstance(v, str):
+        return _encode_str(v)
+    return json.dumps(v, ensure_ascii=False)
+
+
+def _feed_canonical(obj: Any, h: Any) -> None:
+    """
+    Скармливает в h (hashlib-объект) ровно те байты, которые дал бы
+    json.dumps(<obj без id/uid/_postman_id>, ensure_ascii=False, sort_keys=True),
+    не копируя и не меняя obj: обход явным стеком, текст уходит в хэш кусками.
+    """
+    buf: List[str] = []
+    size = 0
+    stack: List[Any] = [obj]
+    while stack:
+        x = stack.pop()
+        if type(x) is _Raw:
+            chunk = x
+        elif isinstance(x, dict):
+            keys = sorted(k for k in x if k not in _VOLATILE_KEYS)
+            if not keys:
+                chunk = "{}"
+            else:
+                stack.append(_Raw("}"))
+                for i in range(len(keys) - 1, -1, -1):
+                    k = keys[i]
+                    stack.append(x[k])
+                    stack.append(_Raw((", " if i else "") + _encode_str(k) + ": "))
+                chunk = "{"
+        elif isinstance(x, (list, tuple)):
+            if not x:
+                chunk = "[]"
+            elif all(type(v) is str for v in x):
+                # частый случай: строки скрипта (event.script.exec) — целиком одним вызовом
+                chunk = json.dumps(x, ensure_ascii=False)
+            else:
+                stack.append(_Raw("]"))
+                for i in range(len(x) - 1, 0, -1):
+                    stack.append(x[i])
+                    stack.append(_Raw(", "))
+                stack.append(x[0])
+                chunk = "["
+        else:
+            chunk = _encode_scalar(x)
+        buf.append(chunk)
+        size += len(chunk)
+        if size >= _DIGEST_FLUSH_CHARS:
+            h.update("".join(buf).encode("utf-8"))
+            buf.clear()
+            size = 0
+    if buf:
+        h.update("".join(buf).encode("utf-8"))
 
 
 def _normalized_digest(obj: Any) -> str:
     """Возвращает SHA1 нормализованной структуры (без volatile-полей)."""
-    import copy
-    x = copy.deepcopy(obj)
-    _scrub_ids_in_place(x, keep_root_info_postman_id=False)
-    blob = json.dumps(x, ensure_ascii=False, sort_keys=True)
-    return hashlib.sha1(blob.encode("utf-8")).hexdigest()
+    interner = interning.current()
+    if interner is not None:  # общее (интернированное) поддерево хэшируется один раз за прогон
+        cached = interner.cached_digest(obj)
+        if cached is not None:
+            return cached
+    h = hashlib.sha1()
+    _feed_canonical(obj, h)
+    digest = h.hexdigest()
+    if interner is not None:
+        interner.remember_digest(obj, digest)
+    return digest
 
 # ===================== СБОРКА МАСТЕР-КОЛЛЕКЦИИ =====================
 
@@ -209,8 +1011,8 @@ def folder_from_collection(col: Dict[str, Any], folder_prefix: str, add_readme:
     if col.get("variable"):
         folder["variable"] = col["variable"]
 
-    folder = _sanitize_item(folder)
-    return folder
+    # санитайз + чистка id/uid/_postman_id одним проходом
+    return _normalize_tree(folder, as_item=True)
 
 
 def _dedupe_names(names: List[str]) -> List[str]:
@@ -227,26 +1029,145 @@ def _dedupe_names(names: List[str]) -> List[str]:
     return out
 
 
-def _get_existing_master_description(master_uid: str | None) -> str | None:
+def _get_existing_master_description(snapshot: MasterSnapshot) -> str | None:
     """Возвращает info.description из текущей мастер-коллекции (если есть)."""
-    if not master_uid:
-        return None
-    try:
-        existing = get_collection(master_uid)
-        return (existing.get("info") or {}).get("description")
-    except Exception:
-        return None
+    return snapshot.info.get("description")
 
 
-def build_master(
+def _folder_worker(blob: bytes, folder_prefix: str, add_readme: bool) -> bytes:
+    """Процесс пула: коллекция (marshal) → marshal (готовая папка, её merkle-узел)."""
+    folder = folder_from_collection(marshal.loads(blob), folder_prefix, add_readme)
+    return marshal.dumps((folder, _merkle_node(folder)))
+
+
+_build_pool: ProcessPoolExecutor | None = None
+_build_pool_size = 0
+_build_pool_lock = threading.Lock()
+_gc_pauses = 0
+_gc_pauses_lock = threading.Lock()
+
+
+@contextmanager
+def _gc_paused() -> Iterator[None]:
+    """
+    Без циклического GC на время распаковки больших деревьев: он срабатывает на каждой
+    тысяче новых dict/list и обходит всю кучу (marshal.loads мастера замедлялся в 5 раз).
+    В JSON-деревьях циклов нет. Счётчик — на случай нескольких профилей в потоках.
+    """
+    global _gc_pauses
+    with _gc_pauses_lock:
+        _gc_pauses += 1
+        if _gc_pauses == 1:
+            gc.disable()
+    try:
+        yield
+    finally:
+        with _gc_pauses_lock:
+            _gc_pauses -= 1
+            if _gc_pauses == 0:
+                gc.enable()
+
+
+def _get_build_pool(workers: int) -> ProcessPoolExecutor:
+    """Общий на процесс пул сборки (профили из run_profiles делят его). Как и HTTP-пул, только растёт."""
+    global _build_pool, _build_pool_size
+    with _build_pool_lock:
+        if _build_pool is None or _build_pool_size < workers:
+            if _build_pool is not None:
+                _build_pool.shutdown(wait=False)  # уже отправленные задачи доработают
+            # spawn, а не fork: к этому моменту в процессе живут потоки (HTTP, профили)
+            _build_pool = ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context("spawn"), initializer=gc.disable,
+            )
+            _build_pool_size = workers
+        return _build_pool
+
+
+def build_folders(
+    source_cols: List[Dict[str, Any]],
+    folder_prefix: str,
+    add_readme: bool,
+    workers: int = 1,
+    memo: "FolderMemo | None" = None,
+    uids: List[str] | None = None,
+    updated_at: Dict[str, str] | None = None,
+) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any] | None]]:
+    """
+    Папки мастера по источникам (в том же порядке) и их merkle-узлы.
+    workers > 1 — folder_from_collection и хэширование в пуле процессов; данные туда и обратно
+    идут через marshal (быстрее pickle и JSON для dict/list/str). Результат тот же, что и в одном
+    процессе; исходные коллекции при этом не меняются. В одном процессе узлы не считаются (None) —
+    их посчитает build_merkle_tree.
+    memo — кэш готовых папок (FolderMemo): собираются только промахи, их папки и узлы попадают в кэш;
+    uids/updated_at (по порядку source_cols) избавляют от пересчёта digest неизменившихся источников.
+    """
+    if memo is not None:
+        return _build_folders_memo(source_cols, folder_prefix, add_readme, workers, memo, uids, updated_at or {})
+    if workers <= 1 or len(source_cols) < 2:
+        return [folder_from_collection(c, folder_prefix, add_readme) for c in source_cols], [None] * len(source_cols)
+    pool = _get_build_pool(workers)
+    chunksize = max(1, len(source_cols) // (workers * 4))
+    blobs = (marshal.dumps(c) for c in source_cols)
+    folders: List[Dict[str, Any]] = []
+    nodes: List[Dict[str, Any] | None] = []
+    with _gc_paused():
+        for out in pool.map(_folder_worker, blobs, repeat(folder_prefix), repeat(add_readme), chunksize=chunksize):
+            folder, node = marshal.loads(out)
+            folders.append(folder)
+            nodes.append(node)
+    return folders, nodes
+
+
+def _build_folders_memo(
     source_cols: List[Dict[str, Any]],
-    name: str,
     folder_prefix: str,
     add_readme: bool,
+    workers: int,
+    memo: "FolderMemo",
+    uids: List[str] | None,
+    updated_at: Dict[str, str],
+) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any] | None]]:
+    options = (folder_prefix, add_readme)
+    keys = [memo.key_for(col, uids[i] if uids else None, updated_at.get(uids[i]) if uids else None, options)
+            for i, col in enumerate(source_cols)]
+    folders: List[Dict[str, Any] | None] = [None] * len(source_cols)
+    nodes: List[Dict[str, Any] | None] = [None] * len(source_cols)
+    missing: List[int] = []
+    built: Dict[str, int] = {}  # одинаковые источники в одном прогоне собираются один раз
+    with _gc_paused():
+        for i, key in enumerate(keys):
+            hit = memo.get(key) if key not in built else None
+            if hit is not None:
+                folders[i], nodes[i] = hit
+            elif key not in built:
+                built[key] = i
+                missing.append(i)
+    if workers > 1 and len(missing) > 1:
+        pool = _get_build_pool(workers)
+        chunksize = max(1, len(missing) // (workers * 4))
+        blobs = (marshal.dumps(source_cols[i]) for i in missing)
+        with _gc_paused():
+            for i, out in zip(missing, pool.map(_folder_worker, blobs, repeat(folder_prefix), repeat(add_readme), chunksize=chunksize)):
+                folders[i], nodes[i] = marshal.loads(out)
+                memo.put(keys[i], folders[i], nodes[i], out)
+    else:
+        for i in missing:
+            folders[i] = folder_from_collection(source_cols[i], folder_prefix, add_readme)
+            nodes[i] = _merkle_node(folders[i])
+            memo.put(keys[i], folders[i], nodes[i])
+    for i, key in enumerate(keys):
+        if folders[i] is None:  # повтор источника, собранного выше в этом же прогоне
+            j = built[key]
+            folders[i], nodes[i] = dict(folders[j]), nodes[j]
+    return folders, nodes  # type: ignore[return-value]
+
+
+def assemble_master(
+    folders: List[Dict[str, Any]],
+    name: str,
     master_description: str | None = None,
 ) -> Dict[str, Any]:
-    folders = [folder_from_collection(c, folder_prefix, add_readme) for c in source_cols]
-
+    """Готовые папки → мастер: дедупликация имён и корневой info."""
     # дедуплицируем одинаковые имена папок (как было)
     names = [f["name"] for f in folders]
     fixed_names = _dedupe_names(names)
@@ -259,51 +1180,940 @@ def build_master(
     }
     if master_description:  # если есть существующее описание — сохраняем
         info["description"] = master_description
+    _scrub_ids_in_place(info)  # описание может быть объектом со своими id
+
+    # папки уже санитайзены и без id (folder_from_collection); корневой info._postman_id проставит ensure_postman_id
+    return {"info": info, "item": folders}
 
-    master = {"info": info, "item": folders}
-    master["item"] = [_sanitize_item(it) for it in master["item"]]
-    return master
+
+def build_master(
+    source_cols: List[Dict[str, Any]],
+    name: str,
+    folder_prefix: str,
+    add_readme: bool,
+    master_description: str | None = None,
+    build_workers: int = 1,
+) -> Dict[str, Any]:
+    folders, _ = build_folders(source_cols, folder_prefix, add_readme, build_workers)
+    return assemble_master(folders, name, master_description)
 
 
 # ===================== ФИЛЬТРЫ =====================
 
+def build_selector(
+    include_prefixes: List[str] | None = None,
+    exclude_prefixes: List[str] | None = None,
+    include_rules: List[str] | None = None,
+    exclude_rules: List[str] | None = None,
+    updated_since: str | None = None,
+    updated_before: str | None = None,
+) -> selection.Selector:
+    """Правила отбора (см. selection.py); префиксы из старых опций — как prefix:-правила."""
+    return selection.Selector(
+        include=[f"prefix:{p}" for p in include_prefixes or []] + list(include_rules or []),
+        exclude=[f"prefix:{p}" for p in exclude_prefixes or []] + list(exclude_rules or []),
+        updated_since=updated_since,
+        updated_before=updated_before,
+    )
+
+
+@lru_cache(maxsize=32)
+def _prefix_selector(include_prefixes: Tuple[str, ...], exclude_prefixes: Tuple[str, ...]) -> selection.Selector:
+    return build_selector(list(include_prefixes), list(exclude_prefixes))
+
+
 def should_include(name: str, include_prefixes: List[str] | None, exclude_prefixes: List[str] | None) -> bool:
-    if include_prefixes:
-        ok = any(name.startswith(p) for p in include_prefixes)
-        if not ok:
-            return False
-    if exclude_prefixes:
-        if any(name.startswith(p) for p in exclude_prefixes):
-            return False
-    return True
+    selector = _prefix_selector(tuple(include_prefixes or ()), tuple(exclude_prefixes or ()))
+    return selector.decide({"name": name})[0]
+
+# ===================== КЭШ КОЛЛЕКЦИЙ =====================
+
+class CollectionCache:
+    """
+    Кэш исходных коллекций на диске: один JSON-файл на UID, валиден пока updatedAt совпадает
+    со значением из list_collections. Устаревшая запись перезаписывается при следующем fetch,
+    записи, которые давно никто не читал, удаляет evict_unused().
+    """
+
+    # локи по файлам общие для всех экземпляров в процессе (у каждого прогона свой экземпляр)
+    _key_locks: Dict[str, threading.Lock] = {}
+    _key_locks_guard = threading.Lock()
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, uid: str) -> str:
+        return os.path.join(self.directory, f"{_safe_name(uid)}.json")
+
+    def _count(self, hit: bool) -> None:
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def key_lock(self, uid: str) -> threading.Lock:
+        """
+        Лок на UID: если несколько профилей в одном процессе тянут одну и ту же коллекцию,
+        в API идёт только первый, остальные дожидаются его и читают результат из кэша.
+        """
+        with CollectionCache._key_locks_guard:
+            return CollectionCache._key_locks.setdefault(os.path.abspath(self._path(uid)), threading.Lock())
+
+    def get(self, uid: str, updated_at: str | None, count: bool = True) -> Dict[str, Any] | None:
+        col = self._read(uid, updated_at)
+        if count:
+            self._count(col is not None)
+        return col
+
+    def _read(self, uid: str, updated_at: str | None) -> Dict[str, Any] | None:
+        if not updated_at:
+            return None
+        path = self._path(uid)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if entry.get("uid") != uid or entry.get("updatedAt") != updated_at:
+            return None
+        try:
+            os.utime(path)  # отметка «использовался» для evict_unused
+        except OSError:
+            pass
+        return entry.get("collection")
+
+    def put(self, uid: str, updated_at: str | None, col: Dict[str, Any]) -> None:
+        if not updated_at:
+            return
+        path = self._path(uid)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"uid": uid, "updatedAt": updated_at, "collection": col}, f, ensure_ascii=False)
+            os.replace(tmp, path)
+        except OSError as e:
+            print(f"warn: cache write failed for {uid}: {e}")
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+
+    def evict_unused(self, max_age_days: float) -> int:
+        """Удаляет записи, которые не читались и не писались дольше max_age_days."""
+        deadline = time.time() - max_age_days * 86400
+        removed = 0
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return 0
+        for name in names:
+            path = os.path.join(self.directory, name)
+            try:
+                if os.path.getmtime(path) < deadline:
+                    os.remove(path)
+                    removed += 1
+            except OSError:
+                pass
+        return removed
+
+
+def open_cache(directory: str | None) -> CollectionCache | None:
+    if not directory:
+        return None
+    try:
+        cache = CollectionCache(directory)
+    except OSError as e:
+        print(f"warn: cache disabled ({directory}): {e}")
+        return None
+    evicted = cache.evict_unused(cfg.CACHE_MAX_AGE_DAYS)
+    if evicted:
+        print(f"cache: удалено устаревших записей: {evicted}")
+    return cache
+
+# ===================== КЭШ ГОТОВЫХ ПАПОК =====================
+
+FOLDER_MEMO_VERSION = 1
+
+
+class FolderMemo:
+    """
+    Готовые папки мастера (результат folder_from_collection) вместе с их merkle-узлами.
+    Ключ — normalized digest исходной коллекции + опции сборки, поэтому одинаковый источник
+    (тот же UID или копия под другим) собирается один раз. Слои: память процесса (общая для всех
+    прогонов: run_profiles, точечные пересборки) и, если задан каталог, диск с вытеснением по размеру
+    (давно не читанные — первыми).
+
+    Digest источника стоит больше самой сборки папки, поэтому для пар (UID, updatedAt) он
+    запоминается в индексе и для неизменившихся коллекций не пересчитывается. В индексе только
+    последний updatedAt каждого UID, а всего — не больше FOLDER_CACHE_INDEX_ITEMS (давно не нужные — вон).
+    """
+
+    _memory: "OrderedDict[str, Tuple[Dict[str, Any], Dict[str, Any]]]" = OrderedDict()
+    _digests: "OrderedDict[str, str]" = OrderedDict()  # "uid@updatedAt" → digest, общий на процесс
+    _stamps: Dict[str, str] = {}  # uid → его "uid@updatedAt" в _digests
+    _memory_lock = threading.Lock()
+
+    def __init__(self, directory: str | None, max_bytes: int, memory_items: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.memory_items = memory_items
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._index_dirty = False
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            try:
+                with open(os.path.join(directory, "index.json"), "r", encoding="utf-8") as f:
+                    index = json.load(f)
+                with FolderMemo._memory_lock:
+                    for k, v in index.items():  # порядок файла — от давно не нужных к свежим
+                        if k not in FolderMemo._digests:
+                            FolderMemo._index_put(k, v)
+            except (OSError, ValueError, AttributeError):
+                pass
+
+    @staticmethod
+    def _index_put(stamp: str, digest: str) -> None:
+        """Под _memory_lock: запись индекса; прежний updatedAt того же UID больше не понадобится."""
+        uid = stamp.partition("@")[0]
+        old = FolderMemo._stamps.get(uid)
+        if old is not None and old != stamp:
+            FolderMemo._digests.pop(old, None)
+        FolderMemo._stamps[uid] = stamp
+        FolderMemo._digests[stamp] = digest
+        FolderMemo._digests.move_to_end(stamp)
+        while len(FolderMemo._digests) > max(1, cfg.FOLDER_CACHE_INDEX_ITEMS):
+            dropped, _ = FolderMemo._digests.popitem(last=False)
+            dropped_uid = dropped.partition("@")[0]
+            if FolderMemo._stamps.get(dropped_uid) == dropped:
+                del FolderMemo._stamps[dropped_uid]
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory or "", f"{key}.bin")
+
+    def key_for(self, col: Dict[str, Any], uid: str | None, updated_at: str | None, options: Tuple[Any, ...]) -> str:
+        stamp = f"{uid}@{updated_at}" if uid and updated_at else None
+        digest = None
+        if stamp:
+            with FolderMemo._memory_lock:
+                digest = FolderMemo._digests.get(stamp)
+                if digest is not None:
+                    FolderMemo._digests.move_to_end(stamp)
+        if digest is None:
+            digest = _normalized_digest(col)
+            if stamp:
+                with FolderMemo._memory_lock:
+                    FolderMemo._index_put(stamp, digest)
+                self._index_dirty = True
+        raw = f"v{FOLDER_MEMO_VERSION}:{digest}:{json.dumps(options, ensure_ascii=False)}"
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Tuple[Dict[str, Any], Dict[str, Any]] | None:
+        """(папка, merkle-узел) или None. Папка — поверхностная копия: её имя assemble_master меняет."""
+        with FolderMemo._memory_lock:
+            hit = FolderMemo._memory.get(key)
+            if hit is not None:
+                FolderMemo._memory.move_to_end(key)
+        if hit is not None:
+            self.memory_hits += 1
+            return dict(hit[0]), hit[1]
+        if not self.directory:
+            self.misses += 1
+            return None
+        try:
+            with open(self._path(key), "rb") as f:
+                folder, node = marshal.loads(f.read())
+            os.utime(self._path(key))  # отметка «использовался» для вытеснения
+        except (OSError, ValueError, EOFError, TypeError):
+            self.misses += 1
+            return None
+        self.disk_hits += 1
+        self._remember(key, folder, node)
+        return dict(folder), node
+
+    def put(self, key: str, folder: Dict[str, Any], node: Dict[str, Any], blob: bytes | None = None) -> None:
+        """blob — уже готовый marshal.dumps((folder, node)) (из пула процессов), чтобы не сериализовать дважды."""
+        self._remember(key, folder, node)
+        if not self.directory:
+            return
+        path = self._path(key)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp, "wb") as f:
+                f.write(blob if blob is not None else marshal.dumps((folder, node)))
+            os.replace(tmp, path)
+        except (OSError, ValueError) as e:
+            print(f"warn: folder cache write failed: {e}")
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+
+    def _remember(self, key: str, folder: Dict[str, Any], node: Dict[str, Any]) -> None:
+        if self.memory_items <= 0:
+            return
+        with FolderMemo._memory_lock:
+            FolderMemo._memory[key] = (dict(folder), node)
+            FolderMemo._memory.move_to_end(key)
+            while len(FolderMemo._memory) > self.memory_items:
+                FolderMemo._memory.popitem(last=False)
+
+    def flush(self) -> int:
+        """Сохраняет индекс digest и вытесняет старые папки с диска сверх max_bytes. Возвращает число удалённых."""
+        if not self.directory:
+            return 0
+        if self._index_dirty:
+            path = os.path.join(self.directory, "index.json")
+            with FolderMemo._memory_lock:
+                index = dict(FolderMemo._digests)
+            try:
+                with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+                    json.dump(index, f)
+                os.replace(f"{path}.tmp", path)
+            except OSError as e:
+                print(f"warn: can't save folder cache index: {e}")
+            self._index_dirty = False
+        try:
+            entries = [e for e in os.scandir(self.directory) if e.name.endswith(".bin")]
+            files = sorted(((e.stat().st_mtime, e.stat().st_size, e.path) for e in entries))
+        except OSError:
+            return 0
+        total = sum(size for _, size, _ in files)
+        removed = 0
+        for _, size, path in files:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+                removed += 1
+            except OSError:
+                pass
+        return removed
+
+    def summary(self) -> Dict[str, int]:
+        return {"hits": self.memory_hits + self.disk_hits, "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits, "misses": self.misses}
+
+
+def open_folder_memo(directory: str | None) -> FolderMemo | None:
+    """Кэш папок: в памяти всегда (если FOLDER_MEMO_ITEMS > 0), на диске — если задан каталог."""
+    if not directory and cfg.FOLDER_MEMO_ITEMS <= 0:
+        return None
+    try:
+        return FolderMemo(directory or None, int(cfg.FOLDER_CACHE_MAX_MB * 1024 * 1024), cfg.FOLDER_MEMO_ITEMS)
+    except OSError as e:
+        print(f"warn: folder cache on disk disabled ({directory}): {e}")
+        return FolderMemo(None, 0, cfg.FOLDER_MEMO_ITEMS)
+
+# ===================== ФАЙЛЫ СОСТОЯНИЯ (STATE_DIR) =====================
+# Манифест, дерево хэшей, шарды и сохранённый мастер: <kind>-<ключ>.json, у каждого своя версия формата.
+
+def _safe_name(key: str) -> str:
+    return "".join(ch if ch.isalnum() or ch in "-_" else "_" for ch in key)
+
+
+def _state_path(state_dir: str, kind: str, key: str) -> str:
+    return os.path.join(state_dir, f"{kind}-{_safe_name(key)}.json")
+
+
+def load_state_file(state_dir: str | None, kind: str, key: str | None, version: int) -> Dict[str, Any] | None:
+    """Содержимое файла состояния без поля version; None — нет файла, он битый или другой версии."""
+    if not state_dir or not key:
+        return None
+    try:
+        with open(_state_path(state_dir, kind, key), "rb") as f:
+            raw = f.read()
+        data = orjson.loads(raw) if orjson is not None else json.loads(raw)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(data, dict) or data.pop("version", None) != version:
+        return None
+    return data
+
+
+def save_state_file(
+    state_dir: str | None,
+    kind: str,
+    key: str | None,
+    version: int,
+    data: Dict[str, Any],
+    pretty: bool = False,
+) -> None:
+    """
+    Атомарная запись (свой временный файл + os.replace). pretty — с отступами, для небольших файлов,
+    которые читают глазами; иначе потоково через _iter_json, без строки целиком в памяти.
+    """
+    if not state_dir or not key:
+        return
+    path = _state_path(state_dir, kind, key)
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        os.makedirs(state_dir, exist_ok=True)
+        with open(tmp, "wb") as f:
+            if pretty:
+                f.write(json.dumps({"version": version, **data}, ensure_ascii=False, indent=2).encode("utf-8"))
+            else:
+                for chunk in _iter_json({"version": version, **data}):
+                    f.write(chunk)
+        os.replace(tmp, path)
+    except OSError as e:
+        print(f"warn: can't save {kind} state: {e}")
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+
+# ===================== МАНИФЕСТ ПОСЛЕДНЕГО ОБНОВЛЕНИЯ =====================
+
+MANIFEST_VERSION = 1
+
+
+def load_manifest(state_dir: str | None, master_uid: str | None) -> Dict[str, Any] | None:
+    return load_state_file(state_dir, "manifest", master_uid, MANIFEST_VERSION)
+
+
+def save_manifest(state_dir: str | None, master_uid: str | None, manifest: Dict[str, Any]) -> None:
+    save_state_file(state_dir, "manifest", master_uid, MANIFEST_VERSION, manifest, pretty=True)
+
+
+def _build_options(master_name: str, folder_prefix: str, add_readme: bool) -> Dict[str, Any]:
+    """Параметры, от которых зависит содержимое мастера (кроме самих источников)."""
+    return {"master_name": master_name, "folder_prefix": folder_prefix, "add_readme": add_readme}
+
+
+def manifest_matches(
+    manifest: Dict[str, Any] | None,
+    sources: List[List[str]],
+    master_updated_at: str | None,
+    options: Dict[str, Any],
+) -> bool:
+    """
+    True, если с последнего успешного обновления не изменились ни набор/порядок источников,
+    ни их updatedAt, ни сам мастер (его updatedAt), ни опции сборки.
+    """
+    if not manifest or not master_updated_at:
+        return False
+    if any(not updated for _, updated in sources):
+        return False
+    return (
+        manifest.get("sources") == sources
+        and manifest.get("master_updated_at") == master_updated_at
+        and manifest.get("options") == options
+    )
+
+
+def _lookup_updated_at(workspace_id: str | None, uid: str) -> str | None:
+    """Текущий updatedAt коллекции по данным list_collections (один лёгкий запрос)."""
+    return _joined_updated_at(_lookup_updated_ats(workspace_id, [uid]), [uid])
+
+
+def _lookup_updated_ats(workspace_id: str | None, uids: List[str]) -> Dict[str, str]:
+    """updatedAt сразу нескольких коллекций (мастер или все его шарды) одним list-запросом."""
+    wanted = set(uids)
+    try:
+        return {c["uid"]: c["updatedAt"] for c in list_collections(workspace_id)
+                if c.get("uid") in wanted and c.get("updatedAt")}
+    except Exception as e:
+        print(f"warn: can't read master updatedAt: {e}")
+    return {}
+
+
+def _joined_updated_at(stamps: Dict[str, str], uids: List[str]) -> str | None:
+    """Отметка мастера для манифеста: updatedAt одной коллекции или всех шардов по порядку (None, если чего-то нет)."""
+    if not uids or any(not stamps.get(u) for u in uids):
+        return None
+    return ",".join(stamps[u] for u in uids)
+
+# ===================== MERKLE-ДЕРЕВО МАСТЕРА =====================
+
+def _merkle_node(item: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Узел дерева хэшей для item мастера.
+    Запрос: {"name", "hash"}. Папка: {"name", "hash", "content", "children"}, где
+    content — хэш всего, кроме имени (свои поля + хэши детей по порядку), а hash = H(имя, content).
+    Так папку можно переименовать (_dedupe_names), не пересчитывая её содержимое.
+    """
+    if "item" not in item:
+        return {"name": item.get("name"), "hash": _normalized_digest(item)}
+    children = [_merkle_node(c) for c in item.get("item") or [] if isinstance(c, dict)]
+    h = hashlib.sha1()
+    _feed_canonical({k: v for k, v in item.items() if k not in ("name", "item")}, h)
+    for c in children:
+        h.update(c["hash"].encode("ascii"))
+    content = h.hexdigest()
+    return {"name": item.get("name"), "hash": _named_hash(item.get("name"), content), "content": content, "children": children}
+
+
+def _named_hash(name: Any, content: str) -> str:
+    return hashlib.sha1(f"{_encode_scalar(name)}:{content}".encode("utf-8")).hexdigest()
+
+
+def build_merkle_tree(
+    master: Dict[str, Any],
+    folder_uids: List[str],
+    updated_at: Dict[str, str],
+    options: Dict[str, Any],
+    previous: Dict[str, Any] | None = None,
+    nodes: List[Dict[str, Any] | None] | None = None,
+) -> Dict[str, Any]:
+    """
+    Дерево хэшей master["item"]: по узлу на папку (= исходную коллекцию folder_uids[i]).
+    Поддеревья источников, у которых updatedAt и опции сборки не изменились с прошлого прогона,
+    берутся из previous без пересчёта; nodes[i] — узел, уже посчитанный при сборке (build_folders).
+    """
+    prev_sources = (previous or {}).get("sources") or {}
+    sources: Dict[str, Any] = {}
+    folders: List[Dict[str, Any]] = []
+    reused = 0
+    for i, (uid, folder) in enumerate(zip(folder_uids, master.get("item") or [])):
+        prev = prev_sources.get(uid)
+        stamp = updated_at.get(uid)
+        built = nodes[i] if nodes else None
+        if prev and stamp and prev.get("updatedAt") == stamp and prev.get("options") == options:
+            node = {"name": folder.get("name"), "hash": _named_hash(folder.get("name"), prev["content"]),
+                    "content": prev["content"], "children": prev["children"]}
+            reused += 1
+        elif built is not None:
+            # имя могло поменяться в _dedupe_names — content от него не зависит
+            node = {"name": folder.get("name"), "hash": _named_hash(folder.get("name"), built["content"]),
+                    "content": built["content"], "children": built["children"]}
+        else:
+            node = _merkle_node(folder)
+        folders.append(node)
+        sources[uid] = {"updatedAt": stamp, "options": options, "content": node["content"], "children": node["children"]}
+
+    h = hashlib.sha1()
+    _feed_canonical({k: v for k, v in master.items() if k != "item"}, h)
+    for f in folders:
+        h.update(f["hash"].encode("ascii"))
+    print(f"merkle: папок {len(folders)}, переиспользовано без пересчёта {reused}")
+    return {"root": h.hexdigest(), "folders": folders, "sources": sources}
+
+
+def _keyed_children(nodes: List[Dict[str, Any]]) -> Dict[Tuple[Any, int], Dict[str, Any]]:
+    """Ключ ребёнка — (имя, номер вхождения имени): имена внутри папок могут повторяться."""
+    seen: Dict[Any, int] = {}
+    out: Dict[Tuple[Any, int], Dict[str, Any]] = {}
+    for n in nodes:
+        k = seen.get(n.get("name"), 0)
+        seen[n.get("name")] = k + 1
+        out[(n.get("name"), k)] = n
+    return out
+
+
+def diff_merkle_trees(old: Dict[str, Any], new: Dict[str, Any]) -> List[Tuple[str, str]]:
+    """Список изменений [(op, путь)], op: '+' добавлено, '-' удалено, '~' изменено. Спускается только в изменённые папки."""
+    changes: List[Tuple[str, str]] = []
+
+    def walk(old_nodes: List[Dict[str, Any]], new_nodes: List[Dict[str, Any]], prefix: str) -> None:
+        old_k, new_k = _keyed_children(old_nodes), _keyed_children(new_nodes)
+        for key, n in new_k.items():
+            path = f"{prefix}{n.get('name')}"
+            o = old_k.get(key)
+            if o is None:
+                changes.append(("+", path))
+            elif o["hash"] != n["hash"]:
+                if "children" in o and "children" in n and o.get("content") != n.get("content"):
+                    before = len(changes)
+                    walk(o["children"], n["children"], f"{path} / ")
+                    if len(changes) == before:  # поменялись поля самой папки
+                        changes.append(("~", path))
+                else:
+                    changes.append(("~", path))
+        for key, o in old_k.items():
+            if key not in new_k:
+                changes.append(("-", f"{prefix}{o.get('name')}"))
+
+    walk(old.get("folders") or [], new.get("folders") or [], "")
+    return changes
+
+
+def print_merkle_diff(old: Dict[str, Any] | None, new: Dict[str, Any], limit: int = 50) -> None:
+    if not old:
+        print("diff: нет дерева хэшей с прошлого прогона")
+        return
+    if old.get("root") == new["root"]:
+        print("diff: мастер не изменился")
+        return
+    changes = diff_merkle_trees(old, new)
+    counts = {op: sum(1 for o, _ in changes if o == op) for op in "+~-"}
+    print(f"diff: +{counts['+']} ~{counts['~']} -{counts['-']}")
+    for op, path in changes[:limit]:
+        print(f"  {op} {path}")
+    if len(changes) > limit:
+        print(f"  … ещё {len(changes) - limit}")
+
+
+MERKLE_VERSION = 1
+
+
+def load_merkle_tree(state_dir: str | None, master_uid: str | None) -> Dict[str, Any] | None:
+    return load_state_file(state_dir, "merkle", master_uid, MERKLE_VERSION)
+
+
+def save_merkle_tree(state_dir: str | None, master_uid: str | None, tree: Dict[str, Any]) -> None:
+    save_state_file(state_dir, "merkle", master_uid, MERKLE_VERSION, tree)
+
+# ===================== ШАРДИРОВАНИЕ МАСТЕРА =====================
+
+SHARDS_VERSION = 1
+
+
+def load_shard_state(state_dir: str | None, key: str | None) -> Dict[str, Any]:
+    """{"uids": [UID шарда по номеру], "assignment": {UID источника: номер шарда}} с прошлого прогона."""
+    return load_state_file(state_dir, "shards", key, SHARDS_VERSION) or {"uids": [], "assignment": {}}
+
+
+def save_shard_state(state_dir: str | None, key: str | None, state: Dict[str, Any]) -> None:
+    save_state_file(state_dir, "shards", key, SHARDS_VERSION, state, pretty=True)
+
+
+def shard_registry(configured: List[str] | None, state: Dict[str, Any]) -> List[str]:
+    """
+    UID шардов по номерам: из конфига профиля, дальше — созданные прошлыми прогонами (из файла состояния).
+    Позиции сохраняются: шард, который не удалось создать, остаётся пустой строкой на своём месте
+    (его создаст следующий прогон), иначе все следующие шарды съехали бы на номер вниз.
+    """
+    configured, saved = list(configured or []), list(state.get("uids") or [])
+    uids = [(configured[i] if i < len(configured) else "") or (saved[i] if i < len(saved) else "") or ""
+            for i in range(max(len(configured), len(saved)))]
+    while uids and not uids[-1]:
+        uids.pop()
+    return uids
+
+
+def plan_shards(
+    keys: List[str],
+    sizes: List[int],
+    max_bytes: int,
+    base_bytes: int,
+    previous: Dict[str, int],
+    min_shards: int = 0,
+    previous_sizes: Dict[str, int] | None = None,
+) -> List[List[int]]:
+    """
+    Раскладка папок по шардам: список номеров папок (по порядку мастера) для каждого шарда.
+    Папка остаётся в шарде из previous, пока он не переполнен, — правка одного источника не
+    перетасовывает остальные: первыми место в своих шардах занимают папки, которые не выросли
+    (previous_sizes), так что при переполнении переезжает сама выросшая папка. Новые и не
+    поместившиеся папки — first fit decreasing в уже существующие шарды, затем в новые.
+    Папка больше лимита занимает шард одна.
+    """
+    bins: List[List[int]] = [[] for _ in range(min_shards)]
+    used: List[int] = [base_bytes] * min_shards
+
+    def fits(b: int, size: int) -> bool:
+        return not bins[b] or used[b] + size + 1 <= max_bytes
+
+    def put(b: int, i: int) -> None:
+        while len(bins) <= b:
+            bins.append([])
+            used.append(base_bytes)
+        bins[b].append(i)
+        used[b] += sizes[i] + 1  # +1 — запятая между папками
+
+    old_sizes = previous_sizes or {}
+    grown = [old_sizes.get(k, 0) < sizes[i] for i, k in enumerate(keys)]
+    pending: List[int] = []
+    for i in sorted(range(len(keys)), key=lambda i: grown[i]):
+        key = keys[i]
+        b = previous.get(key)
+        if b is not None and b >= 0 and (b >= len(bins) or fits(b, sizes[i])):
+            put(b, i)
+        else:
+            pending.append(i)
+    for i in sorted(pending, key=lambda i: -sizes[i]):
+        b = next((b for b in range(len(bins)) if fits(b, sizes[i])), len(bins))
+        put(b, i)
+    while len(bins) > max(1, min_shards) and not bins[-1]:
+        bins.pop()
+    return [sorted(b) for b in bins]
+
+
+def split_master(master: Dict[str, Any], plan: List[List[int]]) -> List[Dict[str, Any]]:
+    """Шарды-коллекции "<имя> [i/N]" с общим info мастера и своими папками."""
+    items = master.get("item") or []
+    info = master.get("info") or {}
+    n = len(plan)
+    info = {k: v for k, v in info.items() if k != "_postman_id"}  # у каждого шарда свой
+    return [{"info": {**info, "name": f"{info.get('name')} [{b + 1}/{n}]"}, "item": [items[i] for i in idx]}
+            for b, idx in enumerate(plan)]
+
+
+def print_shard_plan(shards: List[Dict[str, Any]], sizes: List[int], plan: List[List[int]], max_bytes: int) -> None:
+    print(f"shards: {len(shards)} (лимит {max_bytes / 1024 / 1024:.1f} MB)")
+    for shard, idx in zip(shards, plan):
+        size = sum(sizes[i] for i in idx)
+        over = "  ⚠️ больше лимита (папка не делится)" if size > max_bytes else ""
+        print(f"  {shard['info']['name']}: папок {len(idx)}, ~{size / 1024:.1f} KB{over}")
+
+
+def upload_shards(
+    shards: List[Dict[str, Any]],
+    uids: List[str],
+    workspace_id: str | None,
+    concurrency: int,
+    update_mode: str,
+    skip_unchanged: bool,
+) -> List[Tuple[str | None, str, str | None]]:
+    """
+    Загружает шарды параллельно: шарды из реестра — PUT (без fallback на создание новой коллекции),
+    недостающие — POST. Возвращает по шарду (uid, "updated"|"unchanged"|"created"|"error", ошибка).
+    """
+
+    def one(i: int) -> Tuple[str | None, str, str | None]:
+        shard = shards[i]
+        label = shard["info"]["name"]
+        uid = (uids[i] if i < len(uids) else None) or None
+        try:
+            if uid is None:
+                created = create_collection(shard, workspace_id)
+                uid = (created.get("collection") or {}).get("uid")
+                if not uid:
+                    raise RuntimeError("POST /collections не вернул uid")
+                print(f"  + {label}: создана коллекция {uid}")
+                return uid, "created", None
+            snapshot = MasterSnapshot(uid)
+            if skip_unchanged and maybe_skip_put_if_unchanged(snapshot, shard):
+                print(f"  = {label}: без изменений")
+                return uid, "unchanged", None
+            update_collection(uid, shard, workspace_id, snapshot, update_mode, fallback_create=False)
+            print(f"  ~ {label}: обновлена ({uid})")
+            return uid, "updated", None
+        except Exception as e:
+            print(f"  ✖ {label}: {e}")
+            return uid, "error", str(e)
+
+    with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(shards)))) as pool:
+        futures = [pool.submit(contextvars.copy_context().run, one, i) for i in range(len(shards))]
+        return [f.result() for f in futures]
+
+# ===================== СОХРАНЁННЫЙ МАСТЕР (ТОЧЕЧНАЯ ПЕРЕСБОРКА) =====================
+
+MASTER_CACHE_VERSION = 1
+
+
+def load_master_cache(state_dir: str | None, key: str | None) -> Dict[str, Any] | None:
+    """
+    Мастер последнего успешного обновления: {"master", "sources" (UID источника по папкам),
+    "names" (имена папок до _dedupe_names), "updated_at", "options", "postman_id"}.
+    """
+    return load_state_file(state_dir, "master", key, MASTER_CACHE_VERSION)
+
+
+def save_master_cache(state_dir: str | None, key: str | None, cached: Dict[str, Any]) -> None:
+    save_state_file(state_dir, "master", key, MASTER_CACHE_VERSION, cached)
+
+
+def splice_folder(
+    folders: List[Dict[str, Any]],
+    base_names: List[str],
+    pos: int,
+    folder: Dict[str, Any] | None,
+) -> None:
+    """
+    Меняет папку pos в списке папок сохранённого мастера (None — удаляет) и возвращает всем папкам
+    исходные имена из base_names. Дубликаты здесь не разводятся: это делает assemble_master
+    (через _dedupe_names) — без него имена папок разойдутся с полной сборкой.
+    """
+    if folder is None:
+        del folders[pos]
+        del base_names[pos]
+    else:
+        folders[pos] = folder
+        base_names[pos] = folder["name"]
+    for f, name in zip(folders, base_names):
+        f["name"] = name
 
 # ===================== ГЛАВНАЯ ЛОГИКА =====================
 
-def _fetch_many(uids: List[str]) -> List[Dict[str, Any]]:
-    out: List[Dict[str, Any]] = []
-    for uid in uids:
+def _fetch_one(
+    uid: str,
+    updated_at: str | None = None,
+    cache: CollectionCache | None = None,
+) -> Tuple[Dict[str, Any] | None, float, str | None]:
+    """Тянет одну коллекцию. Возвращает (коллекция|None, секунды, текст ошибки|None)."""
+    t0 = time.perf_counter()
+    if cache is None or not updated_at:
+        try:
+            return get_collection(uid), time.perf_counter() - t0, None
+        except Exception as e:
+            return None, time.perf_counter() - t0, str(e)
+    with cache.key_lock(uid):
+        # пока ждали лок, коллекцию мог скачать соседний профиль
+        col = cache.get(uid, updated_at, count=False)
+        if col is not None:
+            return col, time.perf_counter() - t0, None
         try:
             col = get_collection(uid)
-            print(f"  • ok {uid}: {col.get('info', {}).get('name')}")
-            out.append(col)
         except Exception as e:
-            print(f"  • error {uid}: {e}")
-    return out
+            return None, time.perf_counter() - t0, str(e)
+        cache.put(uid, updated_at, col)
+    return col, time.perf_counter() - t0, None
+
+
+def _intern_result(
+    result: Tuple[Dict[str, Any] | None, float, str | None],
+    interner: interning.Interner | None,
+) -> Tuple[Dict[str, Any] | None, float, str | None]:
+    """Источник интернируется сразу после загрузки — до того, как рядом накопятся остальные."""
+    col, took, err = result
+    if interner is None or col is None:
+        return result
+    return interner.intern(col), took, err
+
+
+def _log_fetch(uid: str, result: Tuple[Dict[str, Any] | None, float, str | None]) -> None:
+    col, took, err = result
+    if err is None:
+        print(f"  • ok {uid}: {(col or {}).get('info', {}).get('name')} ({took:.2f}s)")
+    else:
+        print(f"  • error {uid}: {err}")
+
 
+async def _afetch_into(
+    results: List[Tuple[Dict[str, Any] | None, float, str | None]],
+    uids: List[str],
+    to_fetch: List[int],
+    workers: int,
+    updated_at: Dict[str, str],
+    cache: CollectionCache | None,
+    interner: interning.Interner | None = None,
+) -> None:
+    """Асинхронный движок: все загрузки — задачи одного event loop, одновременно не больше workers."""
+    loop = asyncio.get_running_loop()
+    # блокирующий HTTP (_req) уходит в собственный пул, иначе упрёмся в размер default executor
+    executor = ThreadPoolExecutor(max_workers=workers)
+    sem = asyncio.Semaphore(workers)
+
+    async def one(i: int) -> None:
+        async with sem:
+            # copy_context: как в потоковой версии, запросы попадают в метрики текущего run()
+            result = await loop.run_in_executor(executor, contextvars.copy_context().run, _fetch_one,
+                                                uids[i], updated_at.get(uids[i]), cache)
+        results[i] = _intern_result(result, interner)
+        _log_fetch(uids[i], results[i])
 
-def maybe_skip_put_if_unchanged(master_uid: str, new_master: Dict[str, Any]) -> bool:
     try:
-        current = get_collection(master_uid)
-    except Exception as e:
-        print(f"warn: can't load existing master for diff: {e}")
+        await asyncio.gather(*(one(i) for i in to_fetch))
+    finally:
+        executor.shutdown(wait=True)
+
+
+def _fetch_many(
+    uids: List[str],
+    concurrency: int = 1,
+    updated_at: Dict[str, str] | None = None,
+    cache: CollectionCache | None = None,
+    use_async: bool = False,
+    interner: interning.Interner | None = None,
+) -> List[Tuple[str, Dict[str, Any]]]:
+    """
+    Параллельно (не более concurrency запросов одновременно) тянет коллекции.
+    Результат — в исходном порядке uids, чтобы порядок папок и _dedupe_names
+    не зависели от того, кто ответил первым. Ошибки логируются по каждому UID.
+    Если передан cache, коллекции с неизменившимся updatedAt берутся с диска.
+    Возвращает пары (uid, коллекция) только для успешно загруженных.
+    use_async=True — та же загрузка через asyncio (см. _afetch_into).
+    interner — интернирование каждой коллекции сразу после загрузки (в этом потоке, не в пуле).
+    """
+    updated_at = updated_at or {}
+    results: List[Tuple[Dict[str, Any] | None, float, str | None]] = [(None, 0.0, None)] * len(uids)
+    to_fetch: List[int] = []
+    for i, uid in enumerate(uids):
+        cached = cache.get(uid, updated_at.get(uid)) if cache is not None else None
+        if cached is not None:
+            results[i] = _intern_result((cached, 0.0, None), interner)
+        else:
+            to_fetch.append(i)
+    if cache is not None:
+        print(f"cache: {len(uids) - len(to_fetch)} из {len(uids)} коллекций без изменений, тянем {len(to_fetch)}")
+        metrics.count("cache_hits", len(uids) - len(to_fetch))
+        metrics.count("cache_misses", len(to_fetch))
+
+    workers = max(1, min(concurrency, len(to_fetch) or 1))
+    t0 = time.perf_counter()
+    if use_async:
+        asyncio.run(_afetch_into(results, uids, to_fetch, workers, updated_at, cache, interner))
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            # copy_context: запросы из потоков пула попадают в метрики текущего run()
+            futures = {
+                pool.submit(contextvars.copy_context().run, _fetch_one, uids[i], updated_at.get(uids[i]), cache): i
+                for i in to_fetch
+            }
+            for fut in as_completed(futures):
+                i = futures[fut]
+                results[i] = _intern_result(fut.result(), interner)
+                _log_fetch(uids[i], results[i])
+    wall = time.perf_counter() - t0
+
+    out = [(uid, col) for uid, (col, _, err) in zip(uids, results) if err is None and col is not None]
+    timings = [results[i][1] for i in to_fetch]
+    errors = sum(1 for _, _, err in results if err is not None)
+    if timings:
+        print(
+            f"fetch: {len(to_fetch) - errors} ok, {errors} errors, workers={workers}, "
+            f"wall={wall:.2f}s, sum={sum(timings):.2f}s, "
+            f"avg={sum(timings) / len(timings):.2f}s, max={max(timings):.2f}s"
+        )
+    return out
+
+
+def dedupe_by_content(fetched: List[Tuple[str, Dict[str, Any]]]) -> List[Tuple[str, Dict[str, Any]]]:
+    """
+    Убирает копии одной и той же коллекции под разными UID (например, форки в разных воркспейсах):
+    одинаковый нормализованный дайджест (без id/uid/_postman_id) → остаётся первая.
+    """
+    seen: Dict[str, str] = {}
+    out: List[Tuple[str, Dict[str, Any]]] = []
+    for uid, col in fetched:
+        digest = _normalized_digest(col)
+        if digest in seen:
+            print(f"dedup: {uid} совпадает по содержимому с {seen[digest]} — пропущена")
+            continue
+        seen[digest] = uid
+        out.append((uid, col))
+    if len(out) < len(fetched):
+        print(f"dedup: по содержимому убрано {len(fetched) - len(out)} из {len(fetched)}")
+    return out
+
+
+def maybe_skip_put_if_unchanged(
+    snapshot: MasterSnapshot,
+    new_master: Dict[str, Any],
+    new_digest: str | None = None,
+) -> bool:
+    current = snapshot.get()
+    if current is None:
+        print(f"warn: can't load existing master for diff: {snapshot.error}")
         return False
 
-    new_d = _normalized_digest(new_master)
+    new_d = new_digest or _normalized_digest(new_master)
     cur_d = _normalized_digest(current)
     print(f"digest existing={cur_d} new={new_d}")
     return new_d == cur_d
 
 
+def _print_api_calls(before: Dict[str, int]) -> None:
+    now = api_call_counts()
+    delta = {m: n - before.get(m, 0) for m, n in sorted(now.items()) if n - before.get(m, 0)}
+    details = ", ".join(f"{m} {n}" for m, n in delta.items())
+    print(f"API calls: {sum(delta.values())}" + (f" ({details})" if details else ""))
+
+
+def _print_phases(record: Dict[str, Any]) -> None:
+    phases = ", ".join(f"{name} {sec:.2f}s" for name, sec in record["phases"].items())
+    print(f"phases: {phases} (total {record['seconds']:.2f}s)")
+
+
 def run(
     workspace_id: str | None,
     master_uid: str | None,
@@ -317,75 +2127,582 @@ def run(
     concurrency: int,
     skip_unchanged: bool,
     dry_run: bool,
+    cache_dir: str | None = None,
+    state_dir: str | None = None,
+    force: bool = False,
+    use_async: bool = False,
+    update_mode: str = "full",
+    snapshot_dir: str | None = None,
+    save_snapshot: bool = False,
+    from_snapshot: str | None = None,
+    output_path: str | None = None,
+    metrics_file: str | None = None,
+    build_workers: int = 1,
+    include_rules: List[str] | None = None,
+    exclude_rules: List[str] | None = None,
+    updated_since: str | None = None,
+    updated_before: str | None = None,
+    explain: bool = False,
+    source_workspaces: List[str] | None = None,
+    shard_max_bytes: int = 0,
+    shard_uids: List[str] | None = None,
+    only_uid: str | None = None,
+    folder_cache_dir: str | None = None,
+    intern_sources: bool = True,
 ) -> None:
-    # Источники
-    if use_all:
-        cols_meta = list_collections(workspace_id)
-        print(f"Найдено коллекций: {len(cols_meta)} (workspace={workspace_id or 'ALL'})")
-        uids: List[str] = []
-        for c in cols_meta:
-            uid = c.get("uid"); name = c.get("name", "")
-            if not uid:
-                continue
-            if master_uid and uid == master_uid:
-                continue
-            if should_include(name, include_prefixes, exclude_prefixes):
-                uids.append(uid)
-        if not uids:
-            print("Нет источников после фильтрации.", file=sys.stderr)
-            sys.exit(2)
-        print(f"Отобрано источников: {len(uids)}")
-    else:
-        if not source_uids:
-            print("Нужно либо --all, либо --source-uid (можно много раз)", file=sys.stderr)
+    configure_http(concurrency)
+    calls_before = api_call_counts()
+    run_metrics = metrics.start_run(metrics_file, master_uid=master_uid, master_name=master_name)
+    # одинаковые поддеревья источников — один экземпляр в памяти (мастер через interner не идёт);
+    # для архива снапшотов id не вычищаем: там источники должны быть ровно такими, как их отдал API
+    interner = interning.Interner(scrub_ids=not save_snapshot) if intern_sources else None
+    intern_token = interning.use(interner)
+    try:
+        # Шардирование: мастер — это N коллекций "<имя> [i/N]" из реестра, а не одна master_uid
+        sharded = shard_max_bytes > 0
+        if shard_uids and not sharded:
+            print("Реестр шардов задан, но лимит размера нет (--shard-max-bytes / shard_max_bytes)", file=sys.stderr)
             sys.exit(2)
-        uids = source_uids
-        print(f"Используем SOURCE_UIDS: {len(uids)} шт.")
-
-    # Тянем источники
-    sources = _fetch_many(uids)
-    if not sources:
-        print("Не удалось загрузить ни одной коллекции.", file=sys.stderr)
-        sys.exit(3)
-
-    # ВАЖНО: вытаскиваем текущее описание мастера (если мастер_uid задан)
-    existing_desc = _get_existing_master_description(master_uid)
-
-    # Собираем мастер
-    master = build_master(
-        sources,
-        master_name,
-        folder_prefix,
-        add_readme,
-        master_description=existing_desc,
-    )
-    # Чистим id/uid внутри, но СОХРАНЯЕМ корневой info._postman_id (его проставит ensure_postman_id перед PUT)
-    _scrub_ids_in_place(master, keep_root_info_postman_id=True)
-
-    # Выведем сводку
-    summary = {
-        "master_name": master["info"]["name"],
-        "folders_count": len(master["item"]),
-        "folders": [it.get("name") for it in master["item"]],
-    }
-    print(json.dumps(summary, ensure_ascii=False, indent=2))
+        state_key = master_uid or (master_name if sharded else None)
+        shard_state = load_shard_state(state_dir, state_key) if sharded else {"uids": [], "assignment": {}}
+        registry = shard_registry(shard_uids, shard_state) if sharded else []
+        master_uids = registry if sharded else [master_uid] if master_uid else []
+        options = _build_options(master_name, folder_prefix, add_readme)
+
+        # Точечная пересборка: одна папка в мастере с прошлого успешного обновления (--only-uid)
+        cached: Dict[str, Any] | None = None
+        if only_uid:
+            cached = load_master_cache(state_dir, state_key)
+            if cached is None:
+                reason = "нет сохранённого мастера"
+            elif cached.get("options") != options:
+                reason = "опции сборки изменились"
+            elif only_uid not in cached["sources"]:
+                reason = "коллекция не входит в сохранённый мастер"
+            else:
+                reason = None
+            if reason:
+                print(f"only-uid {only_uid}: {reason} → полная сборка")
+                only_uid, cached = None, None
+
+        # Источники
+        metrics.phase("list")
+        updated_at: Dict[str, str] = {}
+        master_updated_at: str | None = None
+        archive = SnapshotStore(snapshot_dir) if snapshot_dir and (save_snapshot or from_snapshot) else None
+        snap_record: Dict[str, Any] | None = None
+        if cached is not None:
+            uids = list(cached["sources"])
+            updated_at = {uid: stamp for uid, stamp in (cached.get("updated_at") or {}).items() if uid != only_uid}
+            print(f"Точечная пересборка: {only_uid} — папка {uids.index(only_uid) + 1} из {len(uids)}")
+        elif from_snapshot:
+            if archive is None:
+                print("Для --from-snapshot нужен --snapshot-dir", file=sys.stderr)
+                sys.exit(2)
+            snap_record = archive.load_snapshot(from_snapshot, master_uid)
+            uids = [src["uid"] for src in snap_record["sources"]]
+            updated_at = {src["uid"]: src["updatedAt"] for src in snap_record["sources"] if src.get("updatedAt")}
+            print(f"Снапшот {snap_record['id']}: источников {len(uids)} (без обращения к API)")
+        elif use_all:
+            selector = build_selector(include_prefixes, exclude_prefixes, include_rules, exclude_rules,
+                                      updated_since, updated_before)
+            workspaces: List[str | None] = list(source_workspaces) if source_workspaces else [workspace_id]
+            cols_meta = list_collections_many(workspaces, concurrency)
+            print(f"Найдено коллекций: {len(cols_meta)} (workspace={', '.join(w or 'ALL' for w in workspaces)})")
+            candidates: List[Dict[str, Any]] = []
+            own = set(master_uids) | ({master_uid} if master_uid else set())
+            master_stamps: Dict[str, str] = {}
+            for c in cols_meta:
+                if not c.get("uid"):
+                    continue
+                if c["uid"] in own:  # сам мастер (или его шарды) — не источник
+                    if c.get("updatedAt"):
+                        master_stamps[c["uid"]] = c["updatedAt"]
+                    continue
+                candidates.append(c)
+            if master_uids and workspace_id not in workspaces:
+                # мастер живёт вне воркспейсов-источников — без его updatedAt манифест никогда не совпадёт
+                master_stamps.update(_lookup_updated_ats(workspace_id, master_uids))
+            master_updated_at = _joined_updated_at(master_stamps, master_uids)
+            chosen, decisions = selector.select(candidates)
+            if explain:
+                selection.explain(decisions)
+            uids: List[str] = []
+            for c in chosen:
+                uids.append(c["uid"])
+                if c.get("updatedAt"):
+                    updated_at[c["uid"]] = c["updatedAt"]
+            if not uids:
+                print("Нет источников после фильтрации.", file=sys.stderr)
+                sys.exit(2)
+            print(f"Отобрано источников: {len(uids)}")
+        else:
+            if not source_uids:
+                print("Нужно либо --all, либо --source-uid (можно много раз)", file=sys.stderr)
+                sys.exit(2)
+            uids = source_uids
+            print(f"Используем SOURCE_UIDS: {len(uids)} шт.")
+
+        # Ничего не менялось с последнего успешного обновления → выходим после одного list-запроса
+        source_state = [[uid, updated_at.get(uid, "")] for uid in uids]
+        if use_all and not from_snapshot and skip_unchanged and not force and not dry_run:
+            if manifest_matches(load_manifest(state_dir, state_key), source_state, master_updated_at, options):
+                print("⏭️  Источники не менялись с последнего обновления — сборка пропущена.")
+                metrics.outcome("skipped_manifest")
+                return
+
+        # Тянем источники
+        metrics.phase("fetch")
+        if cached is not None:
+            try:
+                fetched = [(only_uid, _intern_result((get_collection(only_uid), 0.0, None), interner)[0])]
+            except RuntimeError as e:
+                if "→ 404 " not in str(e):
+                    raise
+                print(f"{only_uid}: коллекции больше нет — папка будет удалена")
+                fetched = []
+        elif snap_record is not None and archive is not None:
+            fetched = [(src["uid"], _intern_result((archive.get_collection(src["ref"]), 0.0, None), interner)[0])
+                       for src in snap_record["sources"]]
+        else:
+            cache = open_cache(cache_dir) if updated_at else None
+            fetched = _fetch_many(uids, concurrency, updated_at, cache, use_async, interner)
+            if cached is None and len(fetched) < len(uids):
+                # незагруженные не пишем в манифест: иначе следующий прогон сочтёт их учтёнными и выйдет досрочно
+                got = {uid for uid, _ in fetched}
+                print(f"warn: коллекций не загружено: {len(uids) - len(fetched)} — следующий прогон попробует снова")
+                source_state = [s for s in source_state if s[0] in got]
+        if not fetched and cached is None:
+            print("Не удалось загрузить ни одной коллекции.", file=sys.stderr)
+            sys.exit(3)
+        if interner is not None:
+            st = interner.summary()
+            print(f"intern: общих поддеревьев {st['nodes'] - st['unique_nodes']} из {st['nodes']} "
+                  f"({st['node_dedup_ratio']:.0%}), уникальных строк {st['unique_strings']} из {st['strings']}")
+            metrics.count("intern_nodes", st["nodes"])
+            metrics.count("intern_shared_nodes", st["nodes"] - st["unique_nodes"])
+        if source_workspaces and len(source_workspaces) > 1 and cached is None:
+            fetched = dedupe_by_content(fetched)
+
+        # ВАЖНО: вытаскиваем текущее описание мастера (если мастер_uid задан)
+        metrics.phase("master")
+        snapshot = MasterSnapshot(master_uid or (registry[0] if registry else None) or None)
+        if snap_record is not None:
+            existing_desc = snap_record.get("master_description")
+        elif cached is not None:
+            existing_desc = (cached["master"].get("info") or {}).get("description")
+        else:
+            existing_desc = _get_existing_master_description(snapshot)
+
+        # Архив: источники — до сборки (build_master правит их на месте)
+        metrics.phase("build")
+        source_refs: List[Dict[str, Any]] = []
+        if save_snapshot and archive is not None and snap_record is None and cached is None:
+            source_refs = [
+                {"uid": uid, "updatedAt": updated_at.get(uid), "ref": archive.put_collection(col)}
+                for uid, col in fetched
+            ]
+
+        # Собираем мастер (build_workers > 1 — папки и их хэши считаются в пуле процессов)
+        memo: FolderMemo | None = None
+        if cached is not None:
+            folders, base_names, folder_nodes = cached["master"]["item"], list(cached["names"]), None
+            pos = uids.index(only_uid)
+            splice_folder(folders, base_names, pos, folder_from_collection(fetched[0][1], folder_prefix, add_readme) if fetched else None)
+            if not fetched:
+                del uids[pos]
+            folder_uids = uids
+        else:
+            folder_uids = [uid for uid, _ in fetched]
+            memo = open_folder_memo(folder_cache_dir)
+            folders, folder_nodes = build_folders([col for _, col in fetched], folder_prefix, add_readme, build_workers,
+                                                  memo, folder_uids, updated_at)
+            base_names = [f["name"] for f in folders]
+        if memo is not None:
+            evicted = memo.flush()
+            memo_stats = memo.summary()
+            metrics.count("folder_memo_hits", memo_stats["hits"])
+            metrics.count("folder_memo_misses", memo_stats["misses"])
+            if evicted:
+                print(f"folder cache: вытеснено с диска {evicted}")
+        master = assemble_master(folders, master_name, master_description=existing_desc)
+        # id/uid внутри уже вычищены; корневой info._postman_id проставит ensure_postman_id перед PUT
+
+        # Выведем сводку
+        summary = {
+            "master_name": master["info"]["name"],
+            "folders_count": len(master["item"]),
+            "folder_cache": memo.summary() if memo is not None else None,
+            "interning": interner.summary() if interner is not None else None,
+            "folders": [it.get("name") for it in master["item"]],
+        }
+        print(json.dumps(summary, ensure_ascii=False, indent=2))
+
+        if source_refs and archive is not None:
+            snapshot_id = archive.save_snapshot({
+                "master_uid": master_uid,
+                "master_name": master_name,
+                "master_description": existing_desc,
+                "options": _build_options(master_name, folder_prefix, add_readme),
+                "sources": source_refs,
+                "master": archive.put_collection(master),
+            })
+            print(f"snapshot: {snapshot_id} (новых объектов {archive.written}, уже были {archive.deduplicated})")
+        if output_path:
+            with open(output_path, "w", encoding="utf-8") as f:
+                json.dump(master, f, ensure_ascii=False, indent=2)
+            print(f"Мастер записан в {output_path}")
+
+        # Что именно поменялось относительно прошлого прогона
+        metrics.phase("diff")
+        prev_tree = load_merkle_tree(state_dir, state_key)
+        tree = build_merkle_tree(master, folder_uids, updated_at, options, prev_tree, folder_nodes)
+        print_merkle_diff(prev_tree, tree)
+        if interner is not None and interner.digest_hits:
+            print(f"intern: digest общих поддеревьев переиспользован {interner.digest_hits} раз")
+            metrics.count("intern_digest_hits", interner.digest_hits)
+
+        if sharded:
+            # папка = источник; её шард запоминается между прогонами
+            folder_keys = folder_uids
+            sizes = [_json_size(f) for f in master["item"]]
+            base = _json_size({"collection": {"info": {**master["info"], "name": f"{master_name} [00/00]"}, "item": []}})
+            plan = plan_shards(folder_keys, sizes, shard_max_bytes, base, shard_state.get("assignment") or {},
+                               len(registry), shard_state.get("sizes"))
+            shards = split_master(master, plan)
+            print_shard_plan(shards, sizes, plan, shard_max_bytes)
+            metrics.count("shards", len(shards))
+
+        if dry_run:
+            print("DRY-RUN: обновление не выполнялось.")
+            metrics.outcome("dry_run")
+            return
+
+        def remember_master(postman_id: str | None, key: str | None = state_key) -> None:
+            """Мастер, который сейчас в Postman, — основа для следующей точечной пересборки."""
+            save_master_cache(state_dir, key, {
+                "master": master, "sources": folder_uids, "names": base_names,
+                "updated_at": updated_at, "options": options, "postman_id": postman_id,
+            })
+
+        if sharded:
+            metrics.phase("upload")
+            print(f"Загружаем шарды ({len(shards)}) …")
+            results = upload_shards(shards, registry, workspace_id, concurrency, update_mode, skip_unchanged)
+            final_uids = [uid or (registry[i] if i < len(registry) else "") for i, (uid, _, _) in enumerate(results)]
+            save_shard_state(state_dir, state_key, {
+                "uids": final_uids,
+                "assignment": {folder_keys[i]: b for b, idx in enumerate(plan) for i in idx},
+                "sizes": dict(zip(folder_keys, sizes)),
+            })
+            created = [uid for uid, status, _ in results if status == "created"]
+            if created:
+                print(f"Новые шарды: {', '.join(created)} (запомнены в {state_dir}; можно добавить в 'shards' профиля)")
+            failed = [(shards[i]["info"]["name"], err) for i, (_, status, err) in enumerate(results) if status == "error"]
+            if failed:
+                raise RuntimeError("Не удалось загрузить шарды: " + "; ".join(f"{n}: {e}" for n, e in failed))
+            statuses = [status for _, status, _ in results]
+            if all(st == "unchanged" for st in statuses):
+                print("⏭️  Изменений нет — PUT пропущен.")
+                metrics.outcome("skipped_unchanged")
+            else:
+                print(f"✅ Шарды: обновлено {statuses.count('updated')}, создано {statuses.count('created')}, "
+                      f"без изменений {statuses.count('unchanged')}.")
+                metrics.outcome("updated")
+            save_merkle_tree(state_dir, state_key, tree)
+            remember_master(None)
+            if use_all and state_dir and cached is None:
+                stamps = _lookup_updated_ats(workspace_id, final_uids)
+                save_manifest(state_dir, state_key, {
+                    "master_uid": master_uid, "shards": final_uids, "sources": source_state, "options": options,
+                    "master_updated_at": _joined_updated_at(stamps, final_uids),
+                })
+            return
 
-    if dry_run:
-        print("DRY-RUN: обновление не выполнялось.")
+        # Обновляем/создаём
+        if master_uid:
+            if cached is not None and cached.get("postman_id"):
+                # только в тело PUT, после дерева: иначе корень не совпал бы с сохранённым полной сборкой
+                master["info"]["_postman_id"] = cached["postman_id"]  # без лишнего GET мастера в ensure_postman_id
+            metrics.phase("digest")
+            new_digest = _normalized_digest(master)
+            manifest = {"master_uid": master_uid, "sources": source_state, "options": options, "master_digest": new_digest}
+            if cached is not None:
+                # сохранённый мастер = текущий в Postman, сравниваем корни деревьев без GET мастера
+                unchanged = prev_tree is not None and prev_tree.get("root") == tree["root"]
+            else:
+                unchanged = skip_unchanged and maybe_skip_put_if_unchanged(snapshot, master, new_digest)
+            if skip_unchanged and unchanged:
+                if use_all and cached is None:
+                    save_manifest(state_dir, master_uid, {**manifest, "master_updated_at": master_updated_at})
+                save_merkle_tree(state_dir, master_uid, tree)
+                remember_master(master["info"].get("_postman_id") or snapshot.info.get("_postman_id"))
+                print("⏭️  Изменений нет — PUT пропущен.")
+                metrics.outcome("skipped_unchanged")
+                return
+            metrics.phase("upload")
+            print(f"Обновляем мастер-коллекцию {master_uid} …")
+            result = update_collection(master_uid, master, workspace_id, snapshot, update_mode)
+            created = (result or {}).get("collection") or {}
+            if created.get("uid") and created["uid"] != master_uid:
+                # PUT упал с 5xx и создана новая коллекция: старый мастер не менялся — его состояние не трогаем
+                print("✅ Создана новая мастер-коллекция.")
+                metrics.outcome("created")
+                save_merkle_tree(state_dir, created["uid"], tree)
+                remember_master(created.get("id"), created["uid"])
+                return
+            print("✅ Обновлено.")
+            metrics.outcome("updated")
+            save_merkle_tree(state_dir, master_uid, tree)
+            remember_master(master["info"].get("_postman_id"))
+            if use_all and state_dir and cached is None:
+                master_updated_at = _lookup_updated_at(workspace_id, master_uid)
+                save_manifest(state_dir, master_uid, {**manifest, "master_updated_at": master_updated_at})
+        else:
+            metrics.phase("upload")
+            print("Создаём новую мастер-коллекцию …")
+            _ = create_collection(master, workspace_id)
+            print("✅ Создано.")
+            metrics.outcome("created")
+    except BaseException as e:
+        run_metrics.fail(e)
+        raise
+    finally:
+        interning.reset(intern_token)
+        _print_api_calls(calls_before)
+        _print_phases(metrics.finish_run(run_metrics))
+
+
+# ===================== ЛОК СБОРКИ =====================
+
+@contextmanager
+def build_lock(path: str | None = None) -> Iterator[None]:
+    """
+    Межпроцессный лок (BUILD_LOCK_FILE) на всё время сборки: CLI, run_all.py, --watch и задачи app.py
+    не пересекаются и не пишут одни и те же файлы .state. Берётся на входе, а не в run(): профили
+    run_profiles идут параллельно в одном процессе. Без fcntl (Windows) ничего не блокирует.
+    """
+    path = path or cfg.BUILD_LOCK_FILE
+    if not path or fcntl is None:
+        yield
         return
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "a") as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            print(f"lock: идёт другая сборка, ждём ({path}) …")
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
 
-    # Обновляем/создаём
-    if master_uid:
-        if skip_unchanged and maybe_skip_put_if_unchanged(master_uid, master):
-            print("⏭️  Изменений нет — PUT пропущен.")
-            return
-        print(f"Обновляем мастер-коллекцию {master_uid} …")
-        _ = update_collection(master_uid, master, workspace_id)
-        print("✅ Обновлено.")
-    else:
-        print("Создаём новую мастер-коллекцию …")
-        _ = create_collection(master, workspace_id)
-        print("✅ Создано.")
+# ===================== НЕСКОЛЬКО ПРОФИЛЕЙ В ОДНОМ ПРОЦЕССЕ =====================
+
+def profile_run_kwargs(profile: str) -> Dict[str, Any]:
+    """
+    Аргументы run() для профиля из cfg.PROFILES — так же, как собирает run_all.py
+    (--all --skip-unchanged, остальное из config). MASTER_UID/MASTER_NAME из env здесь не действуют:
+    они относятся только к ACTIVE_PROFILE.
+    """
+    if profile not in cfg.PROFILES:
+        raise RuntimeError(f"Unknown profile {profile}. Допустимые: {', '.join(cfg.PROFILES.keys())}")
+    p = cfg.PROFILES[profile]
+    return {
+        "workspace_id": p["workspace_id"],
+        "master_uid": p.get("master_uid"),
+        "master_name": p["master_name"],
+        "folder_prefix": DEFAULT_FOLDER_PREFIX,
+        "add_readme": DEFAULT_ADD_README,
+        "use_all": True,
+        "include_prefixes": None,
+        "exclude_prefixes": list(cfg.DEFAULT_EXCLUDE_PREFIXES),
+        "source_uids": None,
+        "concurrency": max(1, DEFAULT_CONCURRENCY),
+        "skip_unchanged": True,
+        "dry_run": False,
+        "cache_dir": cfg.CACHE_DIR if cfg.USE_CACHE else None,
+        "state_dir": cfg.STATE_DIR,
+        "update_mode": cfg.UPDATE_MODE,
+        "snapshot_dir": cfg.SNAPSHOT_DIR,
+        "save_snapshot": cfg.SAVE_SNAPSHOTS,
+        "metrics_file": cfg.METRICS_FILE or None,
+        "build_workers": cfg.BUILD_WORKERS,
+        "folder_cache_dir": cfg.FOLDER_CACHE_DIR if cfg.USE_CACHE else None,
+        "intern_sources": cfg.INTERN_SOURCES,
+        "include_rules": p.get("include"),
+        "exclude_rules": p.get("exclude"),
+        "updated_since": p.get("updated_since"),
+        "updated_before": p.get("updated_before"),
+        "source_workspaces": p.get("source_workspaces"),
+        "shard_max_bytes": cfg.shard_max_bytes(p),
+        "shard_uids": p.get("shards"),
+    }
+
+
+def _run_profile_safely(profile: str, overrides: Dict[str, Any]) -> Dict[str, Any]:
+    t0 = time.perf_counter()
+    error: str | None = None
+    try:
+        run(**{**profile_run_kwargs(profile), **overrides})
+    except SystemExit as e:
+        if e.code not in (0, None):
+            error = f"exit code {e.code}"
+    except Exception as e:
+        error = str(e)
+    return {"ok": error is None, "seconds": round(time.perf_counter() - t0, 2), "error": error}
+
+
+def run_profiles(
+    profiles: List[str],
+    per_profile: Dict[str, Dict[str, Any]] | None = None,
+    **overrides: Any,
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Собирает несколько профилей параллельно в одном процессе: общий пул HTTP-соединений,
+    общий rate limit и общий кэш источников (пересекающиеся коллекции тянутся один раз).
+    Время ограничено самым медленным профилем, а не суммой.
+    per_profile — дополнительные аргументы run() для отдельных профилей (например, only_uid из watch).
+    Возвращает {профиль: {"ok", "seconds", "error"}}. Счётчики API calls в логах при этом общие на процесс.
+    """
+    concurrency = max(1, overrides.get("concurrency", DEFAULT_CONCURRENCY))
+    configure_http(concurrency * max(1, len(profiles)))
+    results: Dict[str, Dict[str, Any]] = {}
+    with ThreadPoolExecutor(max_workers=max(1, len(profiles))) as pool:
+        futures = {pool.submit(_run_profile_safely, p, {**overrides, **(per_profile or {}).get(p, {})}): p for p in profiles}
+        for fut in as_completed(futures):
+            results[futures[fut]] = fut.result()
+    for p in profiles:
+        r = results[p]
+        status = "✅" if r["ok"] else f"❌ {r['error']}"
+        print(f"profile {p}: {status} ({r['seconds']:.2f}s)")
+    return {p: results[p] for p in profiles}
+
+# ===================== WATCH: ПЕРЕСБОРКА ПО ИЗМЕНЕНИЯМ =====================
+
+def _profile_own_uids(kw: Dict[str, Any]) -> set:
+    """Коллекции самого мастера профиля (мастер и шарды) — их изменения не повод пересобирать."""
+    own = {kw["master_uid"]} if kw.get("master_uid") else set()
+    if kw.get("shard_max_bytes"):
+        state = load_shard_state(kw.get("state_dir"), kw.get("master_uid") or kw.get("master_name"))
+        own.update(u for u in shard_registry(kw.get("shard_uids"), state) if u)
+    return own
+
+
+def poll_profile(kw: Dict[str, Any]) -> Dict[str, str]:
+    """
+    {UID источника: updatedAt} для профиля по одному list-запросу на воркспейс, с теми же правилами
+    отбора, что и в run(): коллекции, которые в мастер не попадают, пересборку не вызывают.
+    """
+    selector = build_selector(kw.get("include_prefixes"), kw.get("exclude_prefixes"), kw.get("include_rules"),
+                              kw.get("exclude_rules"), kw.get("updated_since"), kw.get("updated_before"))
+    workspaces: List[str | None] = list(kw["source_workspaces"]) if kw.get("source_workspaces") else [kw.get("workspace_id")]
+    own = _profile_own_uids(kw)
+    metas = [c for c in list_collections_many(workspaces, len(workspaces), verbose=False)
+             if c.get("uid") and c["uid"] not in own]
+    chosen, _ = selector.select(metas)
+    return {c["uid"]: c.get("updatedAt") or "" for c in chosen}
+
+
+def _changed_sources(old: Dict[str, str], new: Dict[str, str]) -> Tuple[List[str], List[str], List[str]]:
+    """(изменённые, добавленные, удалённые) UID источников."""
+    changed = [uid for uid, stamp in new.items() if uid in old and old[uid] != stamp]
+    added = [uid for uid in new if uid not in old]
+    removed = [uid for uid in old if uid not in new]
+    return changed, added, removed
+
+
+def watch(
+    profiles: List[str],
+    interval: float,
+    debounce: float,
+    jitter: float = 0.2,
+    max_delay: float | None = None,
+    stop: threading.Event | None = None,
+) -> None:
+    """
+    Долгоживущий режим: раз в interval (±jitter, у каждого профиля своё расписание) — только
+    list_collections по воркспейсам профиля. Пересобираются лишь профили, у которых изменился
+    набор или updatedAt отобранных источников; серия правок схлопывается в одну сборку —
+    она начинается, когда debounce секунд нет новых изменений (но не позже max_delay от первого).
+    Изменилась ровно одна коллекция — точечная пересборка (only_uid), иначе — обычная run().
+    Первый опрос собирает каждый профиль сразу (по манифесту это один list-запрос, если всё как было).
+    """
+    stop = stop or threading.Event()
+    rnd = random.Random()
+    kwargs = {p: profile_run_kwargs(p) for p in profiles}
+    built: Dict[str, Dict[str, str] | None] = {p: None for p in profiles}  # состояние на момент последней удачной сборки
+    latest: Dict[str, Dict[str, str]] = {}
+    pending: Dict[str, Tuple[float, float]] = {}  # профиль → (первое, последнее замеченное изменение)
+    start = time.monotonic()
+    next_poll = {p: start + rnd.uniform(0, interval * jitter) for p in profiles}  # профили не опрашиваются разом
+    print(f"watch: профили {', '.join(profiles)}, опрос раз в {interval:g}s ±{jitter:.0%}, debounce {debounce:g}s")
+
+    while not stop.is_set():
+        now = time.monotonic()
+        due: List[str] = []
+        for p in profiles:
+            if next_poll[p] > now:
+                continue
+            next_poll[p] = now + interval * rnd.uniform(1 - jitter, 1 + jitter)
+            try:
+                state = poll_profile(kwargs[p])
+            except Exception as e:
+                print(f"watch: {p}: опрос не удался: {e}")
+                continue
+            previous = latest.get(p)
+            latest[p] = state
+            if built[p] is None:
+                pending.setdefault(p, (now, now - debounce))
+            elif state == built[p]:
+                pending.pop(p, None)  # правку откатили
+            elif state != previous or p not in pending:
+                changed, added, removed = _changed_sources(built[p], state)
+                print(f"watch: {p}: изменено {len(changed)}, добавлено {len(added)}, удалено {len(removed)}")
+                pending[p] = (pending.get(p, (now, now))[0], now)
+            if p not in pending:
+                continue
+            first, last = pending[p]
+            if now - last >= debounce or (max_delay is not None and now - first >= max_delay):
+                due.append(p)
+            else:
+                # к концу debounce — ещё один опрос: сборка только если за это время правок не было
+                next_poll[p] = min(next_poll[p], last + debounce)
+
+        if due:
+            per_profile: Dict[str, Dict[str, Any]] = {}
+            snapshot = {p: latest[p] for p in due}
+            for p in due:
+                pending.pop(p)
+                if built[p] is not None:
+                    changed, added, removed = _changed_sources(built[p], snapshot[p])
+                    if len(changed) == 1 and not added and not removed:
+                        per_profile[p] = {"only_uid": changed[0]}
+            labels = [f"{p} (only {per_profile[p]['only_uid']})" if p in per_profile else p for p in due]
+            print(f"watch: пересборка {', '.join(labels)}")
+            with build_lock():  # не одновременно с cron, run_all.py и задачами app.py
+                results = run_profiles(due, per_profile)
+            for p in due:
+                if results[p]["ok"]:
+                    built[p] = snapshot[p]
+                # при ошибке built не меняется: следующий опрос снова увидит разницу и повторит после debounce
+
+        stop.wait(max(0.05, min(next_poll.values()) - time.monotonic()))
+    print("watch: остановлен")
+
+# ===================== ASYNC RUN =====================
+
+async def arun(**kwargs: Any) -> None:
+    """
+    run() для вызова из event loop: сборка идёт в отдельном потоке, загрузка источников —
+    асинхронным движком. Принимает те же аргументы, что run(); sys.exit внутри превращается в RuntimeError.
+    """
+    kwargs.setdefault("use_async", True)
+    try:
+        await asyncio.to_thread(run, **kwargs)
+    except SystemExit as e:
+        raise RuntimeError(f"build failed (exit code {e.code})") from e
 
 # ===================== CLI =====================
 
@@ -397,32 +2714,109 @@ def parse_args() -> argparse.Namespace:
     p.add_argument("--prefix", default=DEFAULT_FOLDER_PREFIX, help="Префикс имён папок в мастере")
     p.add_argument("--add-readme", action="store_true", default=DEFAULT_ADD_README, help="Вставлять README-элемент в каждую папку")
     p.add_argument("--all", action="store_true", help="Автообнаружение всех коллекций в воркспейсе")
+    p.add_argument("--source-workspace", dest="source_workspaces", action="append", default=None,
+                   help="Воркспейс-источник для --all (можно много раз; по умолчанию --workspace)")
     p.add_argument("--include-prefix", action="append", default=None, help="Фильтр: включить только имена с данным префиксом (можно много раз)")
     p.add_argument("--exclude-prefix", action="append", default=cfg.DEFAULT_EXCLUDE_PREFIXES, help="Фильтр: исключить имена с данным префиксом (можно много раз)")
+    p.add_argument("--include", dest="include_rules", action="append", default=None, metavar="RULE",
+                   help="Правило отбора: prefix:/glob:/re:/tag:/owner:/uid:… (можно много раз, см. selection.py)")
+    p.add_argument("--exclude", dest="exclude_rules", action="append", default=None, metavar="RULE",
+                   help="Правило исключения в том же формате (можно много раз)")
+    p.add_argument("--updated-since", default=None, help="Только коллекции с updatedAt не раньше (ISO-дата или 30d/12h/2w)")
+    p.add_argument("--updated-before", default=None, help="Только коллекции с updatedAt раньше (ISO-дата или 30d/12h/2w)")
+    p.add_argument("--explain", action="store_true", help="Показать, почему каждая коллекция взята или отброшена")
     p.add_argument("--source-uid", action="append", default=None, help="UID исходной коллекции (можно много раз)")
     p.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="Количество параллельных запросов")
     p.add_argument("--skip-unchanged", action="store_true", default=DEFAULT_SKIP_UNCHANGED, help="Пропускать PUT, если изменений нет")
     p.add_argument("--dry-run", action="store_true", help="Не отправлять изменения (только показать сводку)")
+    p.add_argument("--cache-dir", default=cfg.CACHE_DIR, help="Каталог кэша исходных коллекций (UID + updatedAt)")
+    p.add_argument("--async", dest="use_async", action="store_true", help="Тянуть источники асинхронным движком (asyncio)")
+    p.add_argument("--update-mode", choices=("full", "delta", "auto"), default=cfg.UPDATE_MODE,
+                   help="full — PUT всего мастера; delta — только изменённые папки/запросы; auto — delta, если выгоднее")
+    p.add_argument("--snapshot", dest="save_snapshot", action="store_true", default=cfg.SAVE_SNAPSHOTS,
+                   help="Сохранить источники и собранный мастер в локальный архив снапшотов")
+    p.add_argument("--snapshot-dir", default=cfg.SNAPSHOT_DIR, help="Каталог архива снапшотов")
+    p.add_argument("--from-snapshot", default=None, metavar="ID|latest",
+                   help="Собрать мастер из снапшота, не обращаясь к API за источниками (с --dry-run — полностью офлайн)")
+    p.add_argument("--output", default=None, help="Записать собранный мастер в JSON-файл")
+    p.add_argument("--state-dir", default=cfg.STATE_DIR, help="Каталог состояния (манифест последнего обновления)")
+    p.add_argument("--force", action="store_true", help="Собрать заново, даже если по манифесту источники не менялись")
+    p.add_argument("--no-cache", action="store_true", default=not cfg.USE_CACHE, help="Не использовать кэш, тянуть все коллекции заново")
+    p.add_argument("--no-intern", action="store_true", default=not cfg.INTERN_SOURCES,
+                   help="Не интернировать одинаковые поддеревья источников (больше памяти, см. interning.py)")
+    p.add_argument("--folder-cache-dir", default=cfg.FOLDER_CACHE_DIR,
+                   help="Каталог кэша готовых папок мастера (пусто — только в памяти процесса)")
+    p.add_argument("--build-workers", type=int, default=cfg.BUILD_WORKERS,
+                   help="Процессов для сборки папок (1 — в текущем процессе; имеет смысл на сотнях коллекций)")
+    p.add_argument("--shard-max-bytes", type=int, default=cfg.DEFAULT_SHARD_MAX_BYTES,
+                   help="Делить мастер на коллекции \"<имя> [i/N]\" не больше этого размера (0 — одна коллекция)")
+    p.add_argument("--shard-uid", dest="shard_uids", action="append", default=None,
+                   help="UID коллекции-шарда по порядку (можно много раз; недостающие будут созданы)")
+    p.add_argument("--only-uid", default=None, metavar="UID",
+                   help="Пересобрать только папку этой коллекции в мастере с прошлого обновления (из --state-dir)")
+    p.add_argument("--profile", default=None,
+                   help="Взять настройки профиля из config.PROFILES, как run_all.py (остальные флаги, кроме --only-uid/--dry-run/--force, не действуют)")
+    p.add_argument("--watch", action="store_true",
+                   help="Следить за изменениями и пересобирать только изменившиеся профили (--profile или все из config)")
+    p.add_argument("--watch-interval", type=float, default=cfg.WATCH_INTERVAL, help="Секунд между опросами профиля")
+    p.add_argument("--watch-debounce", type=float, default=cfg.WATCH_DEBOUNCE,
+                   help="Секунд без новых правок перед пересборкой")
+    p.add_argument("--metrics-file", default=cfg.METRICS_FILE,
+                   help="Куда дописывать JSON-строку с метриками прогона (пусто — не писать)")
 
     return p.parse_args()
 
 
 def main():
     args = parse_args()
-    run(
-        workspace_id=args.workspace,
-        master_uid=args.master_uid or None,
-        master_name=args.name,
-        folder_prefix=args.prefix,
-        add_readme=args.add_readme,
-        use_all=args.all,
-        include_prefixes=args.include_prefix,
-        exclude_prefixes=args.exclude_prefix,
-        source_uids=args.source_uid,
-        concurrency=max(1, args.concurrency),
-        skip_unchanged=args.skip_unchanged,
-        dry_run=args.dry_run,
-    )
+    if args.watch:
+        profiles = [args.profile] if args.profile else list(cfg.PROFILES.keys())
+        try:
+            watch(profiles, max(1.0, args.watch_interval), max(0.0, args.watch_debounce),
+                  cfg.WATCH_JITTER, cfg.WATCH_MAX_DELAY or None)
+        except KeyboardInterrupt:
+            print("watch: остановлен")
+        return
+    with build_lock():
+        if args.profile:
+            run(**{**profile_run_kwargs(args.profile), "only_uid": args.only_uid, "dry_run": args.dry_run, "force": args.force})
+            return
+        run(
+            workspace_id=args.workspace,
+            master_uid=args.master_uid or None,
+            master_name=args.name,
+            folder_prefix=args.prefix,
+            add_readme=args.add_readme,
+            use_all=args.all,
+            include_prefixes=args.include_prefix,
+            exclude_prefixes=args.exclude_prefix,
+            source_uids=args.source_uid,
+            concurrency=max(1, args.concurrency),
+            skip_unchanged=args.skip_unchanged,
+            dry_run=args.dry_run,
+            cache_dir=None if args.no_cache else args.cache_dir,
+            state_dir=args.state_dir,
+            force=args.force,
+            use_async=args.use_async,
+            update_mode=args.update_mode,
+            snapshot_dir=args.snapshot_dir,
+            save_snapshot=args.save_snapshot,
+            from_snapshot=args.from_snapshot,
+            output_path=args.output,
+            metrics_file=args.metrics_file or None,
+            build_workers=max(1, args.build_workers),
+            include_rules=args.include_rules,
+            exclude_rules=args.exclude_rules,
+            updated_since=args.updated_since,
+            updated_before=args.updated_before,
+            explain=args.explain,
+            source_workspaces=args.source_workspaces or cfg.DEFAULT_SOURCE_WORKSPACES,
+            shard_max_bytes=max(0, args.shard_max_bytes),
+            shard_uids=args.shard_uids or cfg.DEFAULT_SHARD_UIDS,
+            only_uid=args.only_uid,
+            folder_cache_dir=None if args.no_cache else args.folder_cache_dir or None,
+            intern_sources=not args.no_intern,
+        )
 
 
 if __name__ == "__main__":
@@ -39,6 +39,14 @@ COLLECTIONS = {
     "Автозаполнение (Полная документация)": "46112485-b1843756-de4f-4a01-941a-461f12f9196c",
 }
 
+# Необязательные ключи профиля для отбора источников (см. selection.py):
+#   "include": ["glob:Автозаполнение*", "tag:PUBLIC"], "exclude": ["re:\\(copy\\)$", "uid:…"],
+#   "updated_since": "90d", "updated_before": "2025-01-01"
+# и "source_workspaces": [WORKSPACES[...], …] — собирать из нескольких воркспейсов сразу
+# (workspace_id остаётся воркспейсом самого мастера).
+# Если мастер не помещается в одну коллекцию: "shard_max_bytes": 20_000_000 и реестр шардов
+# "shards": [UID "<имя> [1/N]", UID "<имя> [2/N]", …] вместо master_uid (недостающие шарды
+# создаются сами и запоминаются в STATE_DIR).
 PROFILES = {
     "auto_full": {
         "master_uid": COLLECTIONS["Автозаполнение (Полная документация)"],
@@ -66,9 +74,26 @@ if ACTIVE_PROFILE not in PROFILES:
 _profile = PROFILES[ACTIVE_PROFILE]
 
 # === Дефолты, используемые скриптом ===
-DEFAULT_MASTER_UID: str = os.getenv("MASTER_UID", _profile["master_uid"])  # UID мастер-коллекции
+DEFAULT_MASTER_UID: str = os.getenv("MASTER_UID", _profile.get("master_uid") or "")  # UID мастер-коллекции
 DEFAULT_MASTER_NAME: str = os.getenv("MASTER_NAME", _profile["master_name"])  # Имя мастера
 DEFAULT_WORKSPACE_ID: str | None = _profile["workspace_id"]  # workspace-источник
+# Несколько воркспейсов-источников (через запятую); по умолчанию — только DEFAULT_WORKSPACE_ID
+DEFAULT_SOURCE_WORKSPACES: list[str] | None = (
+    [w.strip() for w in os.getenv("SOURCE_WORKSPACES", "").split(",") if w.strip()]
+    or _profile.get("source_workspaces")
+)
+
+# Шардирование мастера: лимит размера одной коллекции-шарда в байтах (0 — без шардов) и реестр UID шардов
+def shard_max_bytes(profile: Dict[str, Any]) -> int:
+    """SHARD_MAX_BYTES из .env важнее "shard_max_bytes" профиля — одинаково для CLI и run_all."""
+    return int(os.getenv("SHARD_MAX_BYTES") or profile.get("shard_max_bytes") or 0)
+
+
+DEFAULT_SHARD_MAX_BYTES: int = shard_max_bytes(_profile)
+DEFAULT_SHARD_UIDS: list[str] | None = (
+    [u.strip() for u in os.getenv("SHARD_UIDS", "").split(",") if u.strip()]
+    or _profile.get("shards")
+)
 
 DEFAULT_FOLDER_PREFIX: str = os.getenv("FOLDER_NAME_PREFIX", "")
 DEFAULT_ADD_README: bool = os.getenv("ADD_README_ITEM", "0") == "1"
@@ -76,6 +101,53 @@ FALLBACK_CREATE_ON_PUT_ERROR: bool = os.getenv("FALLBACK_CREATE_ON_PUT_ERROR", "
 DEFAULT_CONCURRENCY: int = int(os.getenv("CONCURRENCY", "8"))
 DEFAULT_SKIP_UNCHANGED: bool = os.getenv("SKIP_IF_NO_CHANGES", "1") == "1"
 DEFAULT_EXCLUDE_PREFIXES: list[str] = ["[HIDDEN]"]
+# Сборка папок в пуле процессов: 1 — в текущем процессе, 0 — по числу ядер
+BUILD_WORKERS: int = int(os.getenv("BUILD_WORKERS", "1")) or (os.cpu_count() or 1)
+
+# === Лимит запросов к Postman API (общий на все потоки) ===
+# RATE_LIMIT_RPS=0 — без ограничения (остаётся только реакция на 429/Retry-After)
+RATE_LIMIT_RPS: float = float(os.getenv("RATE_LIMIT_RPS", "5"))
+RATE_LIMIT_BURST: int = int(os.getenv("RATE_LIMIT_BURST", str(DEFAULT_CONCURRENCY)))
+RATE_LIMIT_MAX_PAUSE: float = float(os.getenv("RATE_LIMIT_MAX_PAUSE", "60"))  # потолок паузы по X-RateLimit-Reset, секунд
+
+# === Локальный кэш исходных коллекций (ключ: UID + updatedAt) ===
+PROJECT_ROOT: str = os.path.dirname(os.path.abspath(__file__))
+CACHE_DIR: str = os.getenv("CACHE_DIR", os.path.join(PROJECT_ROOT, ".cache"))
+USE_CACHE: bool = os.getenv("USE_CACHE", "1") == "1"
+CACHE_MAX_AGE_DAYS: float = float(os.getenv("CACHE_MAX_AGE_DAYS", "30"))  # неиспользуемые записи удаляются
+
+# Одинаковые скрипты/auth/заголовки источников — один объект в памяти (см. interning.py)
+INTERN_SOURCES: bool = os.getenv("INTERN_SOURCES", "1") == "1"
+
+# === Кэш готовых папок мастера (ключ: digest источника + опции сборки; см. FolderMemo) ===
+FOLDER_CACHE_DIR: str = os.getenv("FOLDER_CACHE_DIR", os.path.join(PROJECT_ROOT, ".folder-cache"))  # пусто — только память
+FOLDER_CACHE_MAX_MB: float = float(os.getenv("FOLDER_CACHE_MAX_MB", "512"))  # сверх — удаляются давно не читанные
+FOLDER_MEMO_ITEMS: int = int(os.getenv("FOLDER_MEMO_ITEMS", "256"))  # папок в памяти процесса (0 — не держать)
+FOLDER_CACHE_INDEX_ITEMS: int = int(os.getenv("FOLDER_CACHE_INDEX_ITEMS", "20000"))  # записей uid@updatedAt → digest
+
+# === Архив снапшотов (сжатые, content-addressed; см. snapshot_store.py) ===
+SNAPSHOT_DIR: str = os.getenv("SNAPSHOT_DIR", os.path.join(PROJECT_ROOT, ".snapshots"))
+SAVE_SNAPSHOTS: bool = os.getenv("SAVE_SNAPSHOTS", "0") == "1"
+
+# === Способ обновления мастера: full | delta | auto (см. update_collection) ===
+UPDATE_MODE: str = os.getenv("UPDATE_MODE", "full")
+DELTA_MAX_OPS: int = int(os.getenv("DELTA_MAX_OPS", "200"))  # больше операций → полный PUT
+DELTA_MAX_RATIO: float = float(os.getenv("DELTA_MAX_RATIO", "0.5"))  # delta дороже этой доли полного PUT → полный PUT
+DELTA_VERIFY: bool = os.getenv("DELTA_VERIFY", "0").lower() in ("1", "true", "yes")  # после delta скачать мастер и сверить (дорого), при расхождении — полный PUT
+
+# === Состояние между прогонами (манифест последнего успешного обновления мастера) ===
+STATE_DIR: str = os.getenv("STATE_DIR", os.path.join(PROJECT_ROOT, ".state"))
+# Межпроцессный лок сборки: CLI, run_all.py, --watch и задачи app.py не пишут STATE_DIR одновременно
+BUILD_LOCK_FILE: str = os.getenv("BUILD_LOCK_FILE", os.path.join(PROJECT_ROOT, ".build.lock"))
+
+# === Watch-режим (--watch): опрос list_collections по профилям и пересборка только изменившихся ===
+WATCH_INTERVAL: float = float(os.getenv("WATCH_INTERVAL", "60"))  # секунд между опросами профиля
+WATCH_JITTER: float = float(os.getenv("WATCH_JITTER", "0.2"))  # ± доля интервала, чтобы профили не опрашивались разом
+WATCH_DEBOUNCE: float = float(os.getenv("WATCH_DEBOUNCE", "30"))  # секунд без новых правок перед сборкой
+WATCH_MAX_DELAY: float = float(os.getenv("WATCH_MAX_DELAY", "600"))  # собрать не позже чем через столько после первой правки (0 — без предела)
+
+# === Метрики прогонов: JSON lines, одна строка на run() (см. metrics.py, /metrics в app.py) ===
+METRICS_FILE: str = os.getenv("METRICS_FILE", os.path.join(STATE_DIR, "metrics.jsonl"))  # пусто — не писать
 
 
 # Удобный агрегатор (если где-то нужно всё сразу)
@@ -83,10 +155,38 @@ DEFAULTS: Dict[str, Any] = {
     "MASTER_UID": DEFAULT_MASTER_UID,
     "MASTER_NAME": DEFAULT_MASTER_NAME,
     "WORKSPACE_ID": DEFAULT_WORKSPACE_ID,
+    "SOURCE_WORKSPACES": DEFAULT_SOURCE_WORKSPACES,
+    "SHARD_MAX_BYTES": DEFAULT_SHARD_MAX_BYTES,
+    "SHARD_UIDS": DEFAULT_SHARD_UIDS,
     "FOLDER_PREFIX": DEFAULT_FOLDER_PREFIX,
     "ADD_README": DEFAULT_ADD_README,
     "FALLBACK_CREATE_ON_PUT_ERROR": FALLBACK_CREATE_ON_PUT_ERROR,
     "CONCURRENCY": DEFAULT_CONCURRENCY,
     "SKIP_UNCHANGED": DEFAULT_SKIP_UNCHANGED,
     "EXCLUDE_PREFIXES": DEFAULT_EXCLUDE_PREFIXES,
+    "BUILD_WORKERS": BUILD_WORKERS,
+    "RATE_LIMIT_RPS": RATE_LIMIT_RPS,
+    "RATE_LIMIT_BURST": RATE_LIMIT_BURST,
+    "RATE_LIMIT_MAX_PAUSE": RATE_LIMIT_MAX_PAUSE,
+    "CACHE_DIR": CACHE_DIR,
+    "USE_CACHE": USE_CACHE,
+    "CACHE_MAX_AGE_DAYS": CACHE_MAX_AGE_DAYS,
+    "INTERN_SOURCES": INTERN_SOURCES,
+    "FOLDER_CACHE_DIR": FOLDER_CACHE_DIR,
+    "FOLDER_CACHE_MAX_MB": FOLDER_CACHE_MAX_MB,
+    "FOLDER_MEMO_ITEMS": FOLDER_MEMO_ITEMS,
+    "FOLDER_CACHE_INDEX_ITEMS": FOLDER_CACHE_INDEX_ITEMS,
+    "STATE_DIR": STATE_DIR,
+    "BUILD_LOCK_FILE": BUILD_LOCK_FILE,
+    "METRICS_FILE": METRICS_FILE,
+    "WATCH_INTERVAL": WATCH_INTERVAL,
+    "WATCH_JITTER": WATCH_JITTER,
+    "WATCH_DEBOUNCE": WATCH_DEBOUNCE,
+    "WATCH_MAX_DELAY": WATCH_MAX_DELAY,
+    "SNAPSHOT_DIR": SNAPSHOT_DIR,
+    "SAVE_SNAPSHOTS": SAVE_SNAPSHOTS,
+    "UPDATE_MODE": UPDATE_MODE,
+    "DELTA_MAX_OPS": DELTA_MAX_OPS,
+    "DELTA_MAX_RATIO": DELTA_MAX_RATIO,
+    "DELTA_VERIFY": DELTA_VERIFY,
 }
@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+"""
+Интернирование (hash-consing) поддеревьев JSON исходных коллекций.
+
+Коллекции клонированы из нескольких шаблонов, поэтому одни и те же event-скрипты, auth,
+заголовки и variable встречаются тысячи раз. Interner.intern() сразу после разбора ответа
+заменяет одинаковые поддеревья одним экземпляром, а одинаковые строки — одной строкой,
+так что в памяти прогона каждое уникальное поддерево хранится один раз. Заодно из источников
+вычищаются id/uid/_postman_id — они всё равно удаляются при сборке папок, а без них
+поддеревья клонов совпадают (кроме прогонов с архивом снапшотов: scrub_ids=False).
+
+Общие экземпляры нельзя менять на месте. Поэтому не интернируются dict с "item" (их
+переписывает _normalize_tree) и всё, что их содержит; ответ с мастером через Interner
+не проходит никогда (там нужны id для PUT и delta).
+
+Пока Interner активен (use()), digest интернированного поддерева считается один раз
+(см. _normalized_digest в build_master_mass_merge.py).
+"""
+
+import contextvars
+from typing import Any, Dict, List, Tuple
+
+VOLATILE_KEYS = frozenset(("id", "uid", "_postman_id"))
+_SCALARS = (int, float, bool, type(None))
+
+
+class Interner:
+    """Таблица уникальных поддеревьев одного прогона и статистика дедупликации."""
+
+    def __init__(self, scrub_ids: bool = True):
+        self.scrub_ids = scrub_ids
+        self._table: Dict[Tuple[Any, ...], Any] = {}
+        self._strings: Dict[str, str] = {}
+        self._ids: set = set()  # id() интернированных контейнеров (живы, пока жива таблица)
+        self._digests: Dict[int, str] = {}
+        self.nodes = 0  # контейнеров пройдено
+        self.shared = 0  # из них заменено уже имеющимся экземпляром
+        self.strings = 0
+        self.shared_strings = 0
+        self.digest_hits = 0
+
+    def _str(self, s: str) -> str:
+        self.strings += 1
+        got = self._strings.setdefault(s, s)
+        if got is not s:
+            self.shared_strings += 1
+        return got
+
+    def intern(self, obj: Any) -> Any:
+        """
+        Интернирует дерево на месте (обход явным стеком, без рекурсии) и возвращает корень —
+        он может оказаться уже известным экземпляром.
+        """
+        if type(obj) is str:
+            return self._str(obj)
+        if type(obj) not in (dict, list):
+            return obj
+        # post-order: (контейнер, родитель, ключ/индекс в родителе, дети уже обработаны?)
+        root: List[Any] = [obj]
+        stack: List[Tuple[Any, Any, Any, bool]] = [(obj, root, 0, False)]
+        internable: Dict[int, bool] = {}
+        while stack:
+            node, parent, slot, ready = stack.pop()
+            if not ready:
+                stack.append((node, parent, slot, True))
+                if type(node) is dict:
+                    if self.scrub_ids:
+                        for k in VOLATILE_KEYS.intersection(node):
+                            del node[k]
+                    for k, v in node.items():
+                        t = type(v)
+                        if t is str:
+                            node[k] = self._str(v)
+                        elif t is dict or t is list:
+                            stack.append((v, node, k, False))
+                else:
+                    for i, v in enumerate(node):
+                        t = type(v)
+                        if t is str:
+                            node[i] = self._str(v)
+                        elif t is dict or t is list:
+                            stack.append((v, node, i, False))
+                continue
+            self.nodes += 1
+            ok = not (type(node) is dict and "item" in node)
+            key: List[Any] = ["d" if type(node) is dict else "l"]
+            values = node.items() if type(node) is dict else enumerate(node)
+            for k, v in values:
+                if type(node) is dict:
+                    key.append(k)
+                t = type(v)
+                if t is str:
+                    key.append(v)
+                elif t is dict or t is list:
+                    if not internable.get(id(v), False):
+                        ok = False
+                    key.append(id(v))
+                elif isinstance(v, _SCALARS):
+                    key.append((t, v))
+                else:
+                    ok = False
+            if ok:
+                k = tuple(key)
+                got = self._table.get(k)
+                if got is None:
+                    self._table[k] = node
+                    self._ids.add(id(node))
+                    got = node
+                else:
+                    self.shared += 1
+                    parent[slot] = got
+                internable[id(got)] = True
+            else:
+                internable[id(node)] = False
+        return root[0]
+
+    def cached_digest(self, obj: Any) -> str | None:
+        d = self._digests.get(id(obj)) if id(obj) in self._ids else None
+        if d is not None:
+            self.digest_hits += 1
+        return d
+
+    def remember_digest(self, obj: Any, digest: str) -> None:
+        if id(obj) in self._ids:
+            self._digests[id(obj)] = digest
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "nodes": self.nodes,
+            "unique_nodes": self.nodes - self.shared,
+            "node_dedup_ratio": round(self.shared / self.nodes, 4) if self.nodes else 0.0,
+            "strings": self.strings,
+            "unique_strings": self.strings - self.shared_strings,
+            "digest_hits": self.digest_hits,
+        }
+
+
+_current: contextvars.ContextVar[Interner | None] = contextvars.ContextVar("interner", default=None)
+
+
+def use(interner: Interner | None) -> contextvars.Token:
+    """Делает interner текущим для прогона (потоки — через contextvars.copy_context()); парный вызов — reset()."""
+    return _current.set(interner)
+
+
+def reset(token: contextvars.Token) -> None:
+    try:
+        _current.reset(token)
+    except ValueError:  # другой контекст
+        pass
+
+
+def current() -> Interner | None:
+    return _current.get()
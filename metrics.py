@@ -0,0 +1,270 @@
+# -*- coding: utf-8 -*-
+"""
+Метрики сборки: фазы прогона, латентность запросов к Postman API, байты, кэш, память.
+
+Каждый run() пишет одну JSON-строку в METRICS_FILE; app.py отдаёт последние N строк
+в формате Prometheus на /metrics. Текущий прогон хранится в contextvar, поэтому
+параллельные профили (run_profiles) не смешивают свои метрики — потоки, в которых
+идут запросы, должны запускаться через contextvars.copy_context() (см. _fetch_many).
+"""
+
+import os
+import json
+import time
+import uuid
+import threading
+import contextvars
+from typing import Any, Dict, List
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None  # type: ignore
+
+# границы бакетов гистограммы латентности HTTP, секунды
+HTTP_BUCKETS: List[float] = [0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0]
+
+
+def peak_rss_bytes() -> int | None:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return int(peak if os.uname().sysname == "Darwin" else peak * 1024)
+
+
+class RunMetrics:
+    """Метрики одного run(): фазы, HTTP, счётчики."""
+
+    def __init__(self, labels: Dict[str, Any]):
+        self.run_id = uuid.uuid4().hex[:12]
+        self.labels = labels
+        self.started = time.time()
+        self.phases: Dict[str, float] = {}
+        self.counters: Dict[str, float] = {}
+        self.http: Dict[str, Dict[str, Any]] = {}
+        self._phase: str | None = None
+        self._phase_t0 = 0.0
+        self.status = "ok"
+        self.outcome: str | None = None
+        self.metrics_file: str | None = None
+        self.token: Any = None
+        self._lock = threading.Lock()
+
+    def fail(self, exc: BaseException) -> None:
+        """Исключение из run(): sys.exit(0) — не ошибка."""
+        if isinstance(exc, SystemExit) and exc.code in (0, None):
+            return
+        self.status = "error"
+        self.outcome = self.outcome or type(exc).__name__
+
+    def phase(self, name: str | None) -> None:
+        """Закрывает текущую фазу и начинает новую (None — просто закрыть)."""
+        now = time.perf_counter()
+        with self._lock:
+            if self._phase is not None:
+                self.phases[self._phase] = round(self.phases.get(self._phase, 0.0) + now - self._phase_t0, 4)
+            self._phase, self._phase_t0 = name, now
+
+    def count(self, name: str, value: float = 1) -> None:
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe_http(self, method: str, status: int | str, seconds: float, retries: int, bytes_out: int, bytes_in: int) -> None:
+        key = f"{method} {status}"
+        with self._lock:
+            h = self.http.setdefault(key, {"count": 0, "sum": 0.0, "buckets": [0] * (len(HTTP_BUCKETS) + 1)})
+            h["count"] += 1
+            h["sum"] = round(h["sum"] + seconds, 6)
+            idx = next((i for i, b in enumerate(HTTP_BUCKETS) if seconds <= b), len(HTTP_BUCKETS))
+            h["buckets"][idx] += 1
+            self.counters["http_retries"] = self.counters.get("http_retries", 0) + retries
+            self.counters["bytes_out"] = self.counters.get("bytes_out", 0) + bytes_out
+            self.counters["bytes_in"] = self.counters.get("bytes_in", 0) + bytes_in
+
+    def to_record(self) -> Dict[str, Any]:
+        self.phase(None)
+        hits = self.counters.get("cache_hits", 0)
+        misses = self.counters.get("cache_misses", 0)
+        return {
+            "ts": time.time(),
+            "run_id": self.run_id,
+            **self.labels,
+            "status": self.status,
+            "outcome": self.outcome,
+            "seconds": round(time.time() - self.started, 4),
+            "phases": dict(self.phases),
+            "counters": dict(self.counters),
+            "cache_hit_rate": round(hits / (hits + misses), 4) if hits + misses else None,
+            "http": self.http,
+            "http_buckets": HTTP_BUCKETS,
+            "peak_rss_bytes": peak_rss_bytes(),
+        }
+
+
+_current: contextvars.ContextVar[RunMetrics | None] = contextvars.ContextVar("build_metrics", default=None)
+_file_lock = threading.Lock()
+
+
+def phase(name: str | None) -> None:
+    m = _current.get()
+    if m is not None:
+        m.phase(name)
+
+
+def outcome(value: str) -> None:
+    """Чем закончился прогон: updated, created, skipped_manifest, skipped_unchanged, dry_run …"""
+    m = _current.get()
+    if m is not None:
+        m.outcome = value
+
+
+def count(name: str, value: float = 1) -> None:
+    m = _current.get()
+    if m is not None:
+        m.count(name, value)
+
+
+def observe_http(method: str, status: int | str, seconds: float, retries: int, bytes_out: int, bytes_in: int) -> None:
+    m = _current.get()
+    if m is not None:
+        m.observe_http(method, status, seconds, retries, bytes_out, bytes_in)
+
+
+def start_run(metrics_file: str | None, **labels: Any) -> RunMetrics:
+    """Начинает метрики одного run(); парный вызов — finish_run() в finally."""
+    m = RunMetrics(labels)
+    m.metrics_file = metrics_file
+    m.token = _current.set(m)
+    return m
+
+
+def finish_run(m: RunMetrics) -> Dict[str, Any]:
+    """Закрывает прогон и дописывает его JSON-строку в metrics_file (если задан)."""
+    try:
+        _current.reset(m.token)
+    except ValueError:  # другой контекст (не тот поток) — просто не трогаем
+        pass
+    record = m.to_record()
+    if m.metrics_file:
+        write_record(m.metrics_file, record)
+    return record
+
+
+def write_record(metrics_file: str, record: Dict[str, Any]) -> None:
+    try:
+        os.makedirs(os.path.dirname(os.path.abspath(metrics_file)), exist_ok=True)
+        line = json.dumps(record, ensure_ascii=False)
+        with _file_lock, open(metrics_file, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+    except OSError as e:
+        print(f"warn: can't write metrics: {e}")
+
+
+def read_records(metrics_file: str, last: int) -> List[Dict[str, Any]]:
+    """Последние last записей (читается только хвост файла)."""
+    try:
+        with open(metrics_file, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            size = f.tell()
+            chunk = min(size, max(64 * 1024, last * 16 * 1024))
+            f.seek(size - chunk)
+            lines = f.read().decode("utf-8", errors="replace").splitlines()
+    except OSError:
+        return []
+    if chunk < size:
+        lines = lines[1:]  # первая строка могла быть обрезана
+    out = []
+    for line in lines[-last:]:
+        try:
+            out.append(json.loads(line))
+        except ValueError:
+            continue
+    return out
+
+
+def _label_str(labels: Dict[str, Any]) -> str:
+    parts = []
+    for k, v in labels.items():
+        v = str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        parts.append(f'{k}="{v}"')
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def render_prometheus(records: List[Dict[str, Any]]) -> str:
+    """
+    Prometheus text format по последним сборкам: суммы по окну, «последние значения» — по мастеру.
+    Окно сдвигается и суммы по нему могут уменьшаться, поэтому всё отдаётся как gauge (без _total):
+    rate()/increase() к ним не применять.
+    """
+    lines: List[str] = []
+
+    def metric(name: str, kind: str, help_text: str) -> None:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+
+    metric("postman_builds_window", "gauge", "Builds in the window, by status")
+    by_status: Dict[str, int] = {}
+    for r in records:
+        by_status[r.get("status", "unknown")] = by_status.get(r.get("status", "unknown"), 0) + 1
+    for status, n in sorted(by_status.items()):
+        lines.append(f"postman_builds_window{_label_str({'status': status})} {n}")
+
+    latest: Dict[str, Dict[str, Any]] = {}
+    for r in records:
+        latest[str(r.get("master_uid") or r.get("master_name"))] = r
+
+    metric("postman_build_duration_seconds", "gauge", "Duration of the latest build per master")
+    for key, r in latest.items():
+        lines.append(f"postman_build_duration_seconds{_label_str({'master': key, 'status': r.get('status')})} {r.get('seconds', 0)}")
+    metric("postman_build_phase_seconds", "gauge", "Phase durations of the latest build per master")
+    for key, r in latest.items():
+        for ph, sec in (r.get("phases") or {}).items():
+            lines.append(f"postman_build_phase_seconds{_label_str({'master': key, 'phase': ph})} {sec}")
+    metric("postman_cache_hit_ratio", "gauge", "Source cache hit ratio of the latest build per master")
+    for key, r in latest.items():
+        if r.get("cache_hit_rate") is not None:
+            lines.append(f"postman_cache_hit_ratio{_label_str({'master': key})} {r['cache_hit_rate']}")
+    metric("postman_build_peak_rss_bytes", "gauge", "Peak RSS of the latest build per master")
+    for key, r in latest.items():
+        if r.get("peak_rss_bytes") is not None:
+            lines.append(f"postman_build_peak_rss_bytes{_label_str({'master': key})} {r['peak_rss_bytes']}")
+
+    totals: Dict[str, float] = {}
+    for r in records:
+        for name in ("bytes_out", "bytes_in", "http_retries"):
+            totals[name] = totals.get(name, 0) + (r.get("counters") or {}).get(name, 0)
+    metric("postman_api_bytes_sent_window", "gauge", "Request bytes sent to the Postman API in the window")
+    lines.append(f"postman_api_bytes_sent_window {totals.get('bytes_out', 0)}")
+    metric("postman_api_bytes_received_window", "gauge", "Response bytes received from the Postman API in the window")
+    lines.append(f"postman_api_bytes_received_window {totals.get('bytes_in', 0)}")
+    metric("postman_api_retries_window", "gauge", "Retried Postman API requests in the window")
+    lines.append(f"postman_api_retries_window {totals.get('http_retries', 0)}")
+
+    # гистограмма по окну тоже не монотонна — бакеты, сумма и число отдельными gauge
+    name = "postman_api_request_duration_window_seconds"
+    merged: Dict[str, Dict[str, Any]] = {}
+    for r in records:
+        for key, h in (r.get("http") or {}).items():
+            m = merged.setdefault(key, {"count": 0, "sum": 0.0, "buckets": [0] * (len(HTTP_BUCKETS) + 1)})
+            m["count"] += h.get("count", 0)
+            m["sum"] += h.get("sum", 0.0)
+            for i, n in enumerate(h.get("buckets") or []):
+                if i < len(m["buckets"]):
+                    m["buckets"][i] += n
+    series: Dict[str, List[str]] = {"bucket": [], "sum": [], "count": []}
+    for key, h in sorted(merged.items()):
+        method, _, status = key.partition(" ")
+        base = {"method": method, "status": status}
+        cumulative = 0
+        for bound, n in zip(HTTP_BUCKETS + [float("inf")], h["buckets"]):
+            cumulative += n
+            le = "+Inf" if bound == float("inf") else repr(bound)
+            series["bucket"].append(f"{name}_bucket{_label_str({**base, 'le': le})} {cumulative}")
+        series["sum"].append(f"{name}_sum{_label_str(base)} {round(h['sum'], 6)}")
+        series["count"].append(f"{name}_count{_label_str(base)} {h['count']}")
+    for part, help_text in (("bucket", "Postman API requests in the window at or below le seconds (including retries)"),
+                            ("sum", "Total Postman API request time in the window, seconds"),
+                            ("count", "Postman API requests in the window")):
+        metric(f"{name}_{part}", "gauge", help_text)
+        lines.extend(series[part])
+    return "\n".join(lines) + "\n"
@@ -3,6 +3,7 @@
 
 import os
 import sys
+import hashlib
 import subprocess
 from pathlib import Path
 USE_VENV = os.getenv("USE_VENV", "1") == "1"
@@ -18,36 +19,79 @@ def venv_python() -> str:
     else:
         return str(VENV_DIR / "Scripts" / "python.exe")  # Windows fallback
 
+REQUIREMENTS = PROJECT_ROOT / "requirements.txt"
+DEPS_STAMP = VENV_DIR / ".deps-stamp"
+# WHEELHOUSE=/path/to/wheels — ставить зависимости только оттуда, без сети
+WHEELHOUSE = os.getenv("WHEELHOUSE", "")
+FORCE_DEPS = os.getenv("FORCE_DEPS", "0") == "1"
+
+def _venv_python_version() -> str:
+    """Версия интерпретатора venv из pyvenv.cfg (без запуска python)."""
+    try:
+        for line in (VENV_DIR / "pyvenv.cfg").read_text(encoding="utf-8").splitlines():
+            key, _, value = line.partition("=")
+            if key.strip() in ("version", "version_info"):
+                return value.strip()
+    except OSError:
+        pass
+    return ""
+
+def deps_fingerprint() -> str:
+    h = hashlib.sha256()
+    h.update(REQUIREMENTS.read_bytes() if REQUIREMENTS.exists() else b"")
+    h.update(f"|{_venv_python_version()}|{sys.platform}|wheelhouse={bool(WHEELHOUSE)}".encode("utf-8"))
+    return h.hexdigest()
+
 def ensure_venv_and_deps():
     # 1) venv
     if not VENV_DIR.exists():
         print("→ Создаю виртуальное окружение .venv …")
         subprocess.run([sys.executable, "-m", "venv", str(VENV_DIR)], check=True)
 
+    # 2) быстрый старт: requirements.txt и интерпретатор не менялись с последней установки
+    fingerprint = deps_fingerprint()
+    if not FORCE_DEPS and DEPS_STAMP.exists() and DEPS_STAMP.read_text(encoding="utf-8").strip() == fingerprint:
+        return
+
     py = venv_python()
-    # 2) pip up-to-date (не обязательно, но полезно)
-    subprocess.run([py, "-m", "pip", "install", "--upgrade", "pip", "setuptools", "wheel"], check=True)
-    # 3) зависимости
-    print("→ Устанавливаю зависимости (requests, python-dotenv) …")
-    subprocess.run([py, "-m", "pip", "install", "requests", "python-dotenv"], check=True)
-
-def run_profile(profile: str):
-    env = os.environ.copy()
-    env["ACTIVE_PROFILE"] = profile
-    py = venv_python()
-    print(f"\n=== Запуск профиля: {profile} ===\n")
-    subprocess.run(
-        [py, str(PROJECT_ROOT / "build_master_mass_merge.py"), "--all", "--skip-unchanged"],
-        env=env,
-        check=True,
-    )
+    if WHEELHOUSE:
+        # 3a) офлайн: только из локальной папки с wheel-файлами
+        print(f"→ Устанавливаю зависимости из {WHEELHOUSE} (без сети) …")
+        subprocess.run([py, "-m", "pip", "install", "--no-index", "--find-links", WHEELHOUSE, "-r", str(REQUIREMENTS)], check=True)
+    else:
+        # 3b) pip up-to-date (не обязательно, но полезно) + зависимости
+        subprocess.run([py, "-m", "pip", "install", "--upgrade", "pip", "setuptools", "wheel"], check=True)
+        print("→ Устанавливаю зависимости из requirements.txt …")
+        subprocess.run([py, "-m", "pip", "install", "-r", str(REQUIREMENTS)], check=True)
+    DEPS_STAMP.write_text(fingerprint, encoding="utf-8")
+
+def _in_venv() -> bool:
+    try:
+        return Path(sys.prefix).resolve() == VENV_DIR.resolve()
+    except OSError:
+        return False
 
 def main():
-    ensure_venv_and_deps()
-    # порядок фиксированный
-    for profile in ["auto_full", "bad_main"]:
-        run_profile(profile)
-    print("\n✅ Готово: оба профиля собраны (auto_full → bad_main)")
+    if USE_VENV and not _in_venv():
+        ensure_venv_and_deps()
+        # перезапускаемся уже внутри .venv — дальше всё в одном процессе
+        proc = subprocess.run([venv_python(), str(Path(__file__).resolve()), *sys.argv[1:]])
+        sys.exit(proc.returncode)
+
+    import config as cfg
+    import build_master_mass_merge as bm
+
+    # RUN_PROFILES=auto_full,bad_main — подмножество; по умолчанию все профили из config.PROFILES
+    selected = [p.strip() for p in os.getenv("RUN_PROFILES", "").split(",") if p.strip()]
+    profiles = selected or list(cfg.PROFILES.keys())
+    print(f"\n=== Запуск профилей (параллельно): {', '.join(profiles)} ===\n")
+    with bm.build_lock():
+        results = bm.run_profiles(profiles)
+    failed = [p for p, r in results.items() if not r["ok"]]
+    if failed:
+        print(f"\n❌ Ошибки в профилях: {', '.join(failed)}")
+        sys.exit(1)
+    print(f"\n✅ Готово: собраны профили {', '.join(profiles)}")
 
 if __name__ == "__main__":
     main()
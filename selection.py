@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+"""
+Отбор коллекций-источников по метаданным list_collections.
+
+Правила — строки вида "<вид>:<значение>"; без известного вида строка считается префиксом
+(так работают старые --include-prefix/--exclude-prefix и DEFAULT_EXCLUDE_PREFIXES):
+
+    prefix:Авто      имя начинается с «Авто»         (все префиксы — в одном trie)
+    glob:*[WIP]*     имя по shell-маске               (все маски — одним регулярным выражением)
+    re:^v\\d+ API     имя по регулярному выражению    (search, не match)
+    tag:HIDDEN       в имени есть метка [HIDDEN]
+    owner:12345      поле owner из метаданных
+    uid:1-abc…       конкретная коллекция
+
+Selector компилируется один раз на прогон; решение по коллекции — один проход по правилам
+без перебора списков префиксов. explain() печатает, почему коллекция взята или отброшена.
+"""
+
+import re
+import fnmatch
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Tuple
+
+KINDS = ("prefix", "glob", "re", "tag", "owner", "uid")
+_TAG_RE = re.compile(r"\[([^\[\]]+)\]")
+_RELATIVE_RE = re.compile(r"^(\d+(?:\.\d+)?)([mhdw])$")
+_RELATIVE_UNITS = {"m": "minutes", "h": "hours", "d": "days", "w": "weeks"}
+
+
+def parse_rule(rule: str) -> Tuple[str, str]:
+    kind, sep, value = rule.partition(":")
+    if sep and kind in KINDS:
+        return kind, value
+    return "prefix", rule
+
+
+def parse_time(value: str | None, now: datetime | None = None) -> datetime | None:
+    """ISO-дата/время (updatedAt Postman, "2024-05-01") или относительное "30d", "12h", "2w" — столько назад."""
+    if not value:
+        return None
+    m = _RELATIVE_RE.match(value.strip())
+    if m:
+        delta = timedelta(**{_RELATIVE_UNITS[m.group(2)]: float(m.group(1))})
+        return (now or datetime.now(timezone.utc)) - delta
+    try:
+        dt = datetime.fromisoformat(value.strip().replace("Z", "+00:00"))
+    except ValueError as e:
+        raise RuntimeError(f"Не понимаю время {value!r}: нужно ISO (2024-05-01, 2024-05-01T10:00:00Z) или 30d/12h/2w") from e
+    return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+
+
+def _union(compiled: List[Tuple[str, "re.Pattern[str]"]]) -> "re.Pattern[str] | None":
+    """Все выражения одним (для быстрого отказа); None — если не собрать, тогда проверяем по одному."""
+    if not compiled:
+        return None
+    try:
+        return re.compile("|".join(f"(?:{rx.pattern})" for _, rx in compiled))
+    except re.error:
+        # например, (?i) в середине объединённого выражения
+        return None
+
+
+class PrefixTrie:
+    """Префиксы в дереве по символам: проверка имени — O(длина имени), а не O(число префиксов)."""
+
+    _END = ""  # ключ-маркер конца префикса (символов нулевой длины в именах не бывает)
+
+    def __init__(self, prefixes: Iterable[str] = ()):
+        self.root: Dict[str, Any] = {}
+        self.size = 0
+        for p in prefixes:
+            self.add(p)
+
+    def add(self, prefix: str) -> None:
+        node = self.root
+        for ch in prefix:
+            node = node.setdefault(ch, {})
+        if self._END not in node:
+            node[self._END] = prefix
+            self.size += 1
+
+    def match(self, name: str) -> str | None:
+        """Самый короткий префикс из trie, с которого начинается name."""
+        node = self.root
+        if self._END in node:
+            return node[self._END]
+        for ch in name:
+            node = node.get(ch)
+            if node is None:
+                return None
+            if self._END in node:
+                return node[self._END]
+        return None
+
+
+class RuleSet:
+    """Скомпилированный набор правил одного знака (include или exclude)."""
+
+    def __init__(self, rules: Iterable[str]):
+        self.rules = [parse_rule(r) for r in rules]
+        by_kind: Dict[str, List[str]] = {k: [] for k in KINDS}
+        for kind, value in self.rules:
+            by_kind[kind].append(value)
+        self.prefixes = PrefixTrie(by_kind["prefix"])
+        self.globs = [(g, re.compile(fnmatch.translate(g))) for g in by_kind["glob"]]
+        try:
+            self.regexes = [(r, re.compile(r)) for r in by_kind["re"]]
+        except re.error as e:
+            raise RuntimeError(f"Неверное регулярное выражение в правиле отбора: {e}") from e
+        # быстрый отказ: все маски/регэкспы одним выражением, конкретное правило ищем только при совпадении
+        self._glob_any = _union(self.globs)
+        self._re_any = _union(self.regexes)
+        self.tags = frozenset(by_kind["tag"])
+        self.owners = frozenset(by_kind["owner"])
+        self.uids = frozenset(by_kind["uid"])
+
+    def __bool__(self) -> bool:
+        return bool(self.rules)
+
+    def match(self, meta: Dict[str, Any], tags: frozenset) -> str | None:
+        """Первое сработавшее правило (для explain) или None."""
+        name = meta.get("name") or ""
+        if self.uids and meta.get("uid") in self.uids:
+            return f"uid:{meta.get('uid')}"
+        p = self.prefixes.match(name) if self.prefixes.size else None
+        if p is not None:
+            return f"prefix:{p}"
+        if self.globs and (self._glob_any is None or self._glob_any.match(name)):
+            hit = next((f"glob:{g}" for g, rx in self.globs if rx.match(name)), None)
+            if hit is not None:
+                return hit
+        if self.regexes and (self._re_any is None or self._re_any.search(name)):
+            hit = next((f"re:{r}" for r, rx in self.regexes if rx.search(name)), None)
+            if hit is not None:
+                return hit
+        if self.tags:
+            hit = self.tags & tags
+            if hit:
+                return f"tag:{sorted(hit)[0]}"
+        if self.owners and str(meta.get("owner")) in self.owners:
+            return f"owner:{meta.get('owner')}"
+        return None
+
+
+class Selector:
+    """
+    include: если задано хоть одно правило, коллекция должна подойти хотя бы под одно;
+    exclude: подошла хоть под одно — отброшена; updated_since/updated_before — окно по updatedAt.
+    """
+
+    def __init__(
+        self,
+        include: Iterable[str] | None = None,
+        exclude: Iterable[str] | None = None,
+        updated_since: str | None = None,
+        updated_before: str | None = None,
+    ):
+        self.include = RuleSet(include or [])
+        self.exclude = RuleSet(exclude or [])
+        self.since = parse_time(updated_since)
+        self.before = parse_time(updated_before)
+        self._need_tags = bool(self.include.tags or self.exclude.tags)
+
+    def decide(self, meta: Dict[str, Any]) -> Tuple[bool, str]:
+        """(взять ли коллекцию, причина)."""
+        tags = frozenset(_TAG_RE.findall(meta.get("name") or "")) if self._need_tags else frozenset()
+        reason = "нет правил include"
+        if self.include:
+            hit = self.include.match(meta, tags)
+            if hit is None:
+                return False, "не подошла ни под одно правило include"
+            reason = f"include {hit}"
+        if self.exclude:
+            hit = self.exclude.match(meta, tags)
+            if hit is not None:
+                return False, f"exclude {hit}"
+        if self.since or self.before:
+            raw = meta.get("updatedAt")
+            try:
+                updated = parse_time(raw) if raw else None
+            except RuntimeError:
+                updated = None
+            if updated is None:
+                return False, f"нет понятного updatedAt ({raw!r}) при окне по времени"
+            if self.since and updated < self.since:
+                return False, f"updatedAt {raw} раньше {self.since.isoformat()}"
+            if self.before and updated >= self.before:
+                return False, f"updatedAt {raw} не раньше {self.before.isoformat()}"
+        return True, reason
+
+    def select(self, metas: Iterable[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[Tuple[Dict[str, Any], bool, str]]]:
+        """Один проход: (отобранные метаданные по порядку, решения по всем коллекциям)."""
+        chosen: List[Dict[str, Any]] = []
+        decisions: List[Tuple[Dict[str, Any], bool, str]] = []
+        for meta in metas:
+            ok, reason = self.decide(meta)
+            decisions.append((meta, ok, reason))
+            if ok:
+                chosen.append(meta)
+        return chosen, decisions
+
+
+def explain(decisions: List[Tuple[Dict[str, Any], bool, str]]) -> None:
+    print(f"explain: {sum(1 for _, ok, _ in decisions if ok)} из {len(decisions)} коллекций отобрано")
+    for meta, ok, reason in decisions:
+        where = f", workspace {meta['workspace']}" if meta.get("workspace") else ""
+        print(f"  {'+' if ok else '-'} {meta.get('name')!s} ({meta.get('uid')}{where}) — {reason}")
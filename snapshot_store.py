@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""
+Локальный архив снапшотов: исходные коллекции и собранные мастера.
+
+Объекты хранятся content-addressed (sha256 канонического JSON) и сжаты zstd,
+если установлен пакет zstandard, иначе gzip. Коллекция раскладывается на «оболочку»
+(всё, кроме item) и по объекту на каждый элемент верхнего уровня, поэтому одинаковые
+папки в разных снапшотах и коллекциях лежат на диске один раз.
+
+    .snapshots/
+      objects/ab/abcdef….json.zst   — сжатые объекты
+      snapshots/<id>.json           — описание снапшота (маленький JSON со ссылками)
+"""
+
+import os
+import gzip
+import json
+import time
+import uuid
+import hashlib
+import threading
+from typing import Any, Dict, List
+
+try:
+    import zstandard  # type: ignore
+except ImportError:
+    zstandard = None  # type: ignore
+
+Ref = Dict[str, Any]  # {"shell": sha, "items": [sha, …]}
+
+
+def _canonical_bytes(obj: Any) -> bytes:
+    return json.dumps(obj, ensure_ascii=False, sort_keys=True, separators=(",", ":")).encode("utf-8")
+
+
+class SnapshotStore:
+    def __init__(self, root: str):
+        self.root = root
+        self.objects_dir = os.path.join(root, "objects")
+        self.snapshots_dir = os.path.join(root, "snapshots")
+        self.written = 0
+        self.deduplicated = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.objects_dir, exist_ok=True)
+        os.makedirs(self.snapshots_dir, exist_ok=True)
+
+    # ---------- объекты ----------
+
+    def _object_path(self, digest: str, ext: str) -> str:
+        return os.path.join(self.objects_dir, digest[:2], f"{digest}.json.{ext}")
+
+    def put_object(self, obj: Any) -> str:
+        data = _canonical_bytes(obj)
+        digest = hashlib.sha256(data).hexdigest()
+        for ext in ("zst", "gz"):
+            if os.path.exists(self._object_path(digest, ext)):
+                with self._lock:
+                    self.deduplicated += 1
+                return digest
+        if zstandard is not None:
+            ext, blob = "zst", zstandard.ZstdCompressor(level=3).compress(data)
+        else:
+            ext, blob = "gz", gzip.compress(data, compresslevel=6)
+        path = self._object_path(digest, ext)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(blob)
+        os.replace(tmp, path)
+        with self._lock:
+            self.written += 1
+        return digest
+
+    def get_object(self, digest: str) -> Any:
+        zst_path = self._object_path(digest, "zst")
+        if os.path.exists(zst_path):
+            if zstandard is None:
+                raise RuntimeError(f"объект {digest} сжат zstd — установи пакет zstandard")
+            with open(zst_path, "rb") as f:
+                return json.loads(zstandard.ZstdDecompressor().decompress(f.read()))
+        gz_path = self._object_path(digest, "gz")
+        if os.path.exists(gz_path):
+            with open(gz_path, "rb") as f:
+                return json.loads(gzip.decompress(f.read()))
+        raise RuntimeError(f"объект {digest} не найден в {self.objects_dir}")
+
+    # ---------- коллекции ----------
+
+    def put_collection(self, col: Dict[str, Any]) -> Ref:
+        """Коллекция → ссылка {"shell", "items"}; каждый элемент item хранится отдельным объектом."""
+        shell = {k: v for k, v in col.items() if k != "item"}
+        return {
+            "shell": self.put_object(shell),
+            "items": [self.put_object(it) for it in col.get("item") or []],
+        }
+
+    def get_collection(self, ref: Ref) -> Dict[str, Any]:
+        col = self.get_object(ref["shell"])
+        col["item"] = [self.get_object(d) for d in ref.get("items") or []]
+        return col
+
+    # ---------- снапшоты ----------
+
+    def save_snapshot(self, record: Dict[str, Any]) -> str:
+        now = time.time()
+        # id сортируется по времени создания (до миллисекунд) — на этом держится "latest"
+        snapshot_id = time.strftime("%Y%m%d-%H%M%S", time.gmtime(now)) + f"{int(now * 1000) % 1000:03d}-{uuid.uuid4().hex[:6]}"
+        record = {"id": snapshot_id, "created_at": now, **record}
+        path = os.path.join(self.snapshots_dir, f"{snapshot_id}.json")
+        with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+            json.dump(record, f, ensure_ascii=False, indent=2)
+        os.replace(f"{path}.tmp", path)
+        return snapshot_id
+
+    def list_snapshots(self) -> List[str]:
+        try:
+            names = os.listdir(self.snapshots_dir)
+        except OSError:
+            return []
+        return sorted(n[:-len(".json")] for n in names if n.endswith(".json"))
+
+    def load_snapshot(self, snapshot_id: str, master_uid: str | None = None) -> Dict[str, Any]:
+        """snapshot_id="latest" — последний снапшот (для master_uid, если задан)."""
+        if snapshot_id == "latest":
+            for candidate in reversed(self.list_snapshots()):
+                record = self.load_snapshot(candidate)
+                if not master_uid or record.get("master_uid") == master_uid:
+                    return record
+            raise RuntimeError(f"в {self.snapshots_dir} нет снапшотов" + (f" для {master_uid}" if master_uid else ""))
+        path = os.path.join(self.snapshots_dir, f"{snapshot_id}.json")
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except OSError as e:
+            raise RuntimeError(f"снапшот {snapshot_id} не найден: {e}") from e
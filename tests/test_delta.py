@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+import copy
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import build_master_mass_merge as bm  # noqa: E402
+
+
+def _request(name, rid, method="GET", url="http://api/x"):
+    return {"name": name, "id": rid, "request": {"method": method, "url": url,
+                                                "header": [{"key": "Accept", "value": "*/*", "type": "text"}]}}
+
+
+CURRENT = {
+    "info": {"name": "Master", "_postman_id": "pid"},
+    "item": [
+        {"name": "Users", "id": "f-users", "item": [
+            _request("List", "r-list"),
+            {"name": "Admin", "id": "f-admin", "item": [_request("Ban", "r-ban", "POST")]},
+        ]},
+        {"name": "Orders", "id": "f-orders", "item": [_request("Create", "r-create", "POST")]},
+    ],
+}
+
+
+def _plan(mutate):
+    new = copy.deepcopy(CURRENT)
+    mutate(new)
+    return bm.plan_delta_update(CURRENT, new)
+
+
+def test_unchanged_master_needs_no_operations():
+    assert _plan(lambda m: None) == []
+
+
+def test_request_rename_updates_only_that_request():
+    def rename(m):
+        m["item"][0]["item"][0]["name"] = "List all"
+    ops = _plan(rename)
+    assert [(method, path) for method, path, _ in ops] == [("PUT", "/requests/r-list")]
+    assert ops[0][2]["name"] == "List all"
+
+
+def test_nested_folder_rename_updates_the_folder():
+    def rename(m):
+        m["item"][0]["item"][1]["name"] = "Administration"
+    ops = _plan(rename)
+    assert [(method, path, body["name"]) for method, path, body in ops] == [("PUT", "/folders/f-admin", "Administration")]
+
+
+def test_removed_top_level_folder_is_deleted():
+    ops = _plan(lambda m: m["item"].pop(1))
+    assert ops == [("DELETE", "/folders/f-orders", None)]
+
+
+def test_request_field_edits_are_carried_in_the_payload():
+    def edit(m):
+        req = m["item"][1]["item"][0]["request"]
+        req["method"] = "PUT"
+        req["url"] = {"raw": "http://api/orders?id=1", "query": [{"key": "id", "value": "1"}]}
+        req["header"][0]["value"] = "application/json"
+        req["body"] = {"mode": "raw", "raw": "{}"}
+    (method, path, body), = _plan(edit)
+    assert (method, path) == ("PUT", "/requests/r-create")
+    assert body["method"] == "PUT"
+    assert body["url"] == "http://api/orders?id=1"
+    assert body["headerData"] == [{"key": "Accept", "value": "application/json", "description": None, "enabled": True}]
+    assert (body["dataMode"], body["rawModeData"]) == ("raw", "{}")
+
+
+def test_folder_appended_at_the_end_is_created_with_its_contents():
+    def append(m):
+        m["item"].append({"name": "Billing", "item": [
+            {"name": "Invoices", "item": [{"name": "Get", "request": {"method": "GET", "url": "http://api/inv"}}]},
+            {"name": "Pay", "request": "http://api/pay"},
+        ]})
+    ops = _plan(append)
+    assert [(method, path, body["name"], body.get("folder")) for method, path, body in ops] == [
+        ("POST", "/folders", "Billing", None),
+        ("POST", "/folders", "Invoices", "@0"),
+        ("POST", "/requests?folder=@1", "Get", None),
+        ("POST", "/requests?folder=@0", "Pay", None),
+    ]
+    assert bm._resolve_ref("/requests?folder=@1", {"1": "f-new"}) == "/requests?folder=f-new"
+
+
+@pytest.mark.parametrize("mutate, reason", [
+    (lambda m: m["item"].reverse(), "порядок"),
+    (lambda m: m["item"].insert(1, {"name": "New", "item": []}), "не в конце"),
+    (lambda m: m["info"].update(name="Other"), "имя мастера"),
+    (lambda m: m.update(variable=[{"key": "host"}]), "variable"),
+    (lambda m: m["item"][0]["item"].pop(0), "добавлены, удалены или переставлены"),
+    (lambda m: m["item"][0]["item"].insert(1, _request("Ban", "r-x")), "добавлены, удалены или переставлены"),
+    (lambda m: m["item"][0]["item"].append(_request("List", "r-2")), "добавлены, удалены или переставлены"),
+    (lambda m: m["item"][0]["item"][0].update(name="Admin") or m["item"][0]["item"][1].update(name="Staff"),
+     "переставлены элементы: Admin"),
+    (lambda m: m["item"][1]["item"][0]["request"].update(protocolProfileBehavior={"followRedirects": False}),
+     "protocolProfileBehavior"),
+    (lambda m: m["item"][1]["item"][0]["request"].update(url={"raw": "http://api/:id", "variable": [{"key": "id"}]}),
+     "variable"),
+    (lambda m: m["item"][1]["item"][0]["request"].update(description={"content": "x", "type": "text/markdown"}),
+     "type"),
+    (lambda m: m["item"][1]["item"][0].update(response=[{"name": "200"}]), "примеры ответов"),
+    (lambda m: m["item"][1]["item"][0]["request"].update(body={"mode": "file", "file": {}}), "file"),
+    (lambda m: m["item"].append({"name": "Vars", "variable": [{"key": "v"}], "item": []}), "variable"),
+])
+def test_changes_the_endpoints_cannot_express_fall_back_to_full_put(mutate, reason):
+    with pytest.raises(bm._DeltaFallback, match=reason):
+        _plan(mutate)
+
+
+def test_missing_ids_in_current_master_fall_back():
+    current = copy.deepcopy(CURRENT)
+    del current["item"][1]["item"][0]["id"]
+    new = copy.deepcopy(current)
+    new["item"][1]["item"][0]["request"]["method"] = "DELETE"
+    with pytest.raises(bm._DeltaFallback, match="нет id"):
+        bm.plan_delta_update(current, new)
@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from selection import Selector  # noqa: E402
+
+
+def test_regexes_that_cannot_be_joined_are_checked_one_by_one():
+    # (?i) не в начале объединённого выражения — re.error, быстрого отказа нет
+    selector = Selector(include=["re:(?i)foo", "re:bar"])
+    assert selector.decide({"name": "zzz"})[0] is False
+    assert selector.decide({"name": "FOO api"}) == (True, "include re:(?i)foo")
+    assert selector.decide({"name": "a bar"}) == (True, "include re:bar")
+
+
+def test_exclude_with_unjoinable_regexes_does_not_drop_everything():
+    selector = Selector(exclude=["re:(?i)wip", "glob:Old *"])
+    assert selector.decide({"name": "Payments"})[0] is True
+    assert selector.decide({"name": "WIP payments"})[0] is False
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import build_master_mass_merge as bm  # noqa: E402
+
+KEYS = ["a", "b", "c", "d", "e"]
+
+
+def _assignment(keys, plan):
+    return {keys[i]: b for b, idx in enumerate(plan) for i in idx}
+
+
+def test_grown_folder_moves_alone_even_past_the_limit():
+    sizes = [30, 30, 30, 30, 30]
+    first = bm.plan_shards(KEYS, sizes, 100, 10, {})
+    previous = _assignment(KEYS, first)
+    # «b» вырос больше лимита шарда — переезжает только он, остальные остаются на местах
+    grown = [30, 150, 30, 30, 30]
+    plan = bm.plan_shards(KEYS, grown, 100, 10, previous, len(first), dict(zip(KEYS, sizes)))
+    after = _assignment(KEYS, plan)
+    assert {k: after[k] for k in KEYS if k != "b"} == {k: previous[k] for k in KEYS if k != "b"}
+    assert after["b"] != previous["b"]
+    assert [KEYS.index("b")] in plan  # папка больше лимита занимает шард одна
+
+
+def test_unchanged_sizes_keep_the_plan():
+    sizes = [60, 20, 50, 40, 10]
+    first = bm.plan_shards(KEYS, sizes, 100, 10, {})
+    again = bm.plan_shards(KEYS, sizes, 100, 10, _assignment(KEYS, first), len(first), dict(zip(KEYS, sizes)))
+    assert again == first
+
+
+def test_registry_keeps_the_slot_of_a_shard_that_failed_to_be_created():
+    assert bm.shard_registry(None, {"uids": ["", "u2", "u3"]}) == ["", "u2", "u3"]
+    assert bm.shard_registry(["u1"], {"uids": ["", "u2", ""]}) == ["u1", "u2"]
+    assert bm.shard_registry(["", "c2"], {"uids": ["s1", "s2"]}) == ["s1", "c2"]
+
+
+def test_upload_creates_only_the_missing_slot(monkeypatch):
+    created, updated = [], []
+
+    def create(shard, workspace_id):
+        created.append(shard["info"]["name"])
+        return {"collection": {"uid": "new-1"}}
+
+    def update(uid, shard, workspace_id, snapshot, mode, fallback_create=True):
+        updated.append((uid, shard["info"]["name"], fallback_create))
+
+    monkeypatch.setattr(bm, "create_collection", create)
+    monkeypatch.setattr(bm, "update_collection", update)
+    shards = bm.split_master({"info": {"name": "M"}, "item": [{"name": "x", "item": []}, {"name": "y", "item": []}]},
+                             [[0], [1]])
+    results = bm.upload_shards(shards, ["", "u2"], None, 2, "full", skip_unchanged=False)
+    assert [(uid, status) for uid, status, _ in results] == [("new-1", "created"), ("u2", "updated")]
+    assert created == ["M [1/2]"]
+    assert updated == [("u2", "M [2/2]", False)]